@@ -0,0 +1,120 @@
+"""
+Benchmark parsec2fsps phase remapping and isochrone writing on a synthetic
+CMD-like table, against the sequential masked assignment and the
+np.savetxt per isochrone versions they replaced.
+
+python -m padova_tracks.benchmarks.bench_parsec2fsps -n 1000000
+"""
+import argparse
+import io
+import json
+import sys
+import time
+
+import numpy as np
+
+from ..parsec2fsps import (FSPS_FMT, FSPS_HEADER, FSPS_KEYS,
+                           format_isochrones, redefine_phase)
+
+
+def synthetic_table(nrows=1000000, nages=93, seed=0):
+    """CMD-like table of nages isochrones, nrows in total"""
+    rng = np.random.RandomState(seed)
+    keys = FSPS_KEYS + ['slope']
+    tab = np.zeros(nrows, dtype=[(k, float) for k in keys])
+    tab['logageyr'] = np.sort(rng.randint(nages, size=nrows)) * 0.05 + 5.5
+    tab['M_ini'] = rng.uniform(0.1, 100, nrows)
+    tab['M_act'] = tab['M_ini'] * rng.uniform(0.5, 1, nrows)
+    tab['logL'] = rng.uniform(-3, 6, nrows)
+    tab['logT'] = rng.uniform(3.3, 5, nrows)
+    tab['logg'] = rng.uniform(-1, 8, nrows)
+    tab['CO'] = rng.uniform(0, 3, nrows)
+    tab['stage'] = rng.randint(0, 12, nrows)
+    tab['slope'][rng.uniform(size=nrows) > 0.99] = 1.
+    return tab.view(np.recarray)
+
+
+def legacy_redefine_phase(tab):
+    """redefine_phase as eleven masked assignments"""
+    tab['stage'][tab['stage'] == 1] = 0.
+    tab['stage'][tab['stage'] == 2] = 1.
+    tab['stage'][tab['stage'] == 3] = 2.
+    tab['stage'][tab['stage'] == 4] = 3.
+    tab['stage'][tab['stage'] == 5] = 3.
+    tab['stage'][tab['stage'] == 6] = 3.
+    tab['stage'][tab['stage'] == 7] = 4.
+    tab['stage'][tab['stage'] == 8] = 0.
+    tab['stage'][tab['stage'] == 9] = 6.
+    tab['stage'][tab['stage'] == 10] = 0.
+    itp, = np.nonzero(tab['slope'])
+    tab['stage'][itp] = 5.
+    tab['stage'][tab['stage'] > 10] = 0.
+    return tab
+
+
+def legacy_format_isochrones(tab):
+    """np.savetxt of each isochrone after a header line"""
+    outp = io.StringIO()
+    _, aidx = np.unique(tab['logageyr'], return_index=True)
+    aidx = np.append(aidx, len(tab))
+    idxes = [np.arange(aidx[i], aidx[i+1]) for i in range(len(aidx)-1)]
+    for idx in idxes:
+        outp.write(FSPS_HEADER)
+        np.savetxt(outp, tab[FSPS_KEYS][idx], fmt=FSPS_FMT)
+    return outp.getvalue()
+
+
+def timeit(func, tab, repeat=3):
+    """best wall time of func(copy of tab) and the last result"""
+    times = []
+    for _ in range(repeat):
+        tab_ = tab.copy()
+        t0 = time.time()
+        result = func(tab_)
+        times.append(time.time() - t0)
+    return np.min(times), result
+
+
+def main(argv):
+    """Main function for bench_parsec2fsps"""
+    parser = argparse.ArgumentParser(description="benchmark parsec2fsps")
+
+    parser.add_argument('-n', '--nrows', type=int, default=1000000,
+                        help='number of table rows')
+
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of repeats (best time is reported)')
+
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+                        help='write results to this json file')
+
+    args = parser.parse_args(argv)
+
+    tab = synthetic_table(args.nrows)
+    results = {'nrows': args.nrows}
+    for name, new, old in [('redefine_phase', redefine_phase,
+                            legacy_redefine_phase),
+                           ('format_isochrones', format_isochrones,
+                            legacy_format_isochrones)]:
+        if name == 'format_isochrones':
+            tab = redefine_phase(tab.copy())
+        tnew, rnew = timeit(new, tab, repeat=args.repeat)
+        told, rold = timeit(old, tab, repeat=args.repeat)
+        if name == 'redefine_phase':
+            same = np.array_equal(rnew['stage'], rold['stage'])
+        else:
+            same = rnew == rold
+        assert same, '{0:s} differs from the legacy version'.format(name)
+        results[name] = {'legacy_s': told, 'new_s': tnew,
+                         'speedup': told / tnew}
+        print('{0:s}: legacy {1:.3f}s new {2:.3f}s ({3:.1f}x)'.format(
+            name, told, tnew, told / tnew))
+
+    if args.outfile is not None:
+        with open(args.outfile, 'w') as out:
+            json.dump(results, out, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,336 @@
+"""
+Benchmark the parsec2match pipeline on a synthetic grid (see
+benchmarks.synthetic).
+
+Each benchmark times one stage over a whole track set:
+load_track                Track(filename) of every track
+define_eep_stages         DefineEeps.define_eep_stages of every track
+interpolate_along_track   every EEP to EEP segment of every track
+interpolate_tpagb         the TP-AGB segment of every PARSEC+COLIBRI track
+process_track             TracksForMatch.process_track of every track
+interpolate_between_sets  the MATCH tracks of a set with themselves
+prepare_makemod           the makemod header of the MATCH grid
+
+python -m padova_tracks.benchmarks.bench_pipeline -n 10 -r 2000 -o bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import scipy
+
+from .synthetic import make_grid
+from ..fileio import get_files, tfm_indict
+from ..interpolate.interpolate import (interpolate_along_track,
+                                       interpolate_tpagb)
+from ..match import TracksForMatch
+from ..preprocessing.parsec_colibri import FirstTP, attach
+from ..tracks.track import Track, AGBTrack
+from ..utils import git_hash
+
+BENCHMARKS = ['load_track', 'define_eep_stages', 'interpolate_along_track',
+              'interpolate_tpagb', 'process_track',
+              'interpolate_between_sets', 'prepare_makemod']
+
+
+@contextlib.contextmanager
+def quiet():
+    """the pipeline prints a lot, keep it out of the benchmark output"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+class Grid(object):
+    """
+    A synthetic grid and the pieces the benchmarks share.
+
+    The last track set (prefix) is the one benchmarked.
+    """
+    def __init__(self, outdir, nmass=10, nrows=2000, ntps=10, mhef=1.8):
+        self.outdir = outdir
+        self.mhef = mhef
+        self.params = {'nmass': nmass, 'nrows': nrows, 'ntps': ntps}
+        with quiet():
+            self.prefixs = make_grid(outdir, nmass=nmass, nrows=nrows,
+                                     ntps=ntps, mhef=mhef)
+        self.prefix = self.prefixs[-1]
+        self.tracks_dir = os.path.join(outdir, 'tracks')
+        self.match_dir = os.path.join(self.tracks_dir, 'match')
+        self._tfms = {}
+        self._tpagb_files = None
+        self._matched = False
+
+    def tfm(self, prefix=None):
+        """TracksForMatch of prefix (default self.prefix)"""
+        prefix = prefix or self.prefix
+        if prefix not in self._tfms:
+            indict = tfm_indict()
+            indict.update(tracks_dir=self.tracks_dir, prefix=prefix)
+            with quiet():
+                self._tfms[prefix] = TracksForMatch(**indict)
+        return self._tfms[prefix]
+
+    def track_files(self, prefix=None):
+        """PARSEC track files of prefix"""
+        prefix = prefix or self.prefix
+        return sorted(get_files(os.path.join(self.tracks_dir, prefix), '*.*'))
+
+    def load_tracks(self, filenames=None):
+        """Tracks ready for define_eep_stages (as TracksForMatch has them)"""
+        filenames = filenames or self.track_files()
+        tracks = [Track(f) for f in filenames]
+        for track in tracks:
+            track.iptcri = np.zeros(len(self.tfm().eep_list), dtype=int)
+        return tracks
+
+    def eep_tracks(self, filenames=None):
+        """Tracks with EEPs defined"""
+        tfm = self.tfm()
+        tracks = self.load_tracks(filenames)
+        with quiet():
+            [tfm.define_eep_stages(track) for track in tracks]
+        return [t for t in tracks if t.flag is None]
+
+    def tpagb_files(self):
+        """PARSEC+COLIBRI tracks of self.prefix (stitched once)"""
+        if self._tpagb_files is not None:
+            return self._tpagb_files
+        tfm = self.tfm()
+        outdir = os.path.join(self.outdir, 'tpagb', self.prefix)
+        os.makedirs(outdir, exist_ok=True)
+        firsttp = FirstTP(os.path.join(self.outdir, '1tp', '{0:s}.INP'.format(
+            'Z{0:g}Y{1:g}'.format(tfm.tracks[0].Z, tfm.tracks[0].Y))))
+        cdir = os.path.join(self.outdir, 'colibri', 'Z{0:g}_Y{1:g}'.format(
+            tfm.tracks[0].Z, tfm.tracks[0].Y))
+        files = []
+        with quiet():
+            for onetpm in np.atleast_1d(firsttp.data):
+                parsec, = [f for f in self.track_files() if f.endswith(
+                    'M{0:.3f}.PMS'.format(onetpm['mass']))]
+                colibri = get_files(cdir, 'agb_{0:.3f}_*'.format(
+                    onetpm['mass']))[0]
+                output = os.path.join(outdir,
+                                      os.path.split(parsec)[1] + '.TPAGB')
+                attach(Track(parsec), AGBTrack(colibri), onetpm, output,
+                       diag=False)
+                files.append(output)
+        self._tpagb_files = files
+        return files
+
+    def match_tracks(self):
+        """write the MATCH tracks of every prefix (once)"""
+        if self._matched:
+            return self.match_dir
+        for prefix in self.prefixs:
+            tfm = self.tfm(prefix)
+            with quiet():
+                for track in tfm.tracks:
+                    track.iptcri = np.zeros(len(tfm.eep_list), dtype=int)
+                    tfm.define_eep_stages(track)
+                tfm.match_interpolation()
+        self._matched = True
+        return self.match_dir
+
+
+def segments(tfm, tracks, tpagb=False):
+    """
+    (track, inds, nticks, mess) of each EEP to EEP segment as in
+    TracksForMatch.process_track, only the TP-AGB ones if tpagb.
+    """
+    segs = []
+    for track in tracks:
+        nticks = tfm.nticks_hb if track.hb else tfm.nticks
+        eeps = {v: k for k, v in track.pdict.items()}
+        for i in range(len(track.iptcri) - 1):
+            if track.iptcri[i + 1] == 0:
+                break
+            if tpagb != (eeps[i] == 'TPAGB_BEG'):
+                continue
+            inds = np.arange(track.iptcri[i], track.iptcri[i + 1])
+            mess = '{0:.3f} {1:s}={2:d} {3:s}={4:d}'.format(
+                track.mass, eeps[i], track.iptcri[i], eeps[i + 1],
+                track.iptcri[i + 1])
+            track.info[mess] = ''
+            segs.append((track, inds, nticks[i], mess))
+    return segs
+
+
+# Each bench_ function returns setup, func, and the number of items func
+# works through. setup() is not timed and returns the arguments of func.
+def bench_load_track(grid):
+    files = grid.track_files()
+    return (lambda: (files, ),
+            lambda files: [Track(f) for f in files], len(files))
+
+
+def bench_define_eep_stages(grid):
+    tfm = grid.tfm()
+    return (lambda: (grid.load_tracks(), ),
+            lambda tracks: [tfm.define_eep_stages(t) for t in tracks],
+            len(grid.track_files()))
+
+
+def bench_interpolate_along_track(grid):
+    segs = segments(grid.tfm(), grid.eep_tracks())
+
+    def func(segs):
+        return [interpolate_along_track(track, inds, nticks, mess=mess)
+                for track, inds, nticks, mess in segs]
+    return lambda: (segs, ), func, len(segs)
+
+
+def bench_interpolate_tpagb(grid):
+    tracks = grid.eep_tracks(grid.tpagb_files())
+    segs = segments(grid.tfm(), tracks, tpagb=True)
+    [track.get_tps() for track in tracks]
+
+    def func(segs):
+        return [interpolate_tpagb(track, inds, nticks, mess=mess)
+                for track, inds, nticks, mess in segs]
+    return lambda: (segs, ), func, len(segs)
+
+
+def bench_process_track(grid):
+    tfm = grid.tfm()
+    tracks = grid.eep_tracks()
+    outdir = tempfile.mkdtemp(dir=grid.outdir)
+
+    def func(tracks):
+        return [tfm.process_track(t, os.path.join(outdir, t.name + '.dat'))
+                for t in tracks]
+    return lambda: (tracks, ), func, len(tracks)
+
+
+def bench_interpolate_between_sets(grid):
+    from ..interpolate.interpolate_match_grid import interpolate_between_sets
+    match_dir = os.path.join(grid.match_tracks(), grid.prefix)
+    outdir = os.path.join(grid.outdir, 'between_sets')
+    nfiles = len(get_files(match_dir, '*.dat'))
+
+    def func(match_dir):
+        return interpolate_between_sets(match_dir, match_dir, outdir,
+                                        grid.mhef, overwrite=True)
+    return lambda: (match_dir, ), func, nfiles
+
+
+def bench_prepare_makemod(grid):
+    from ..prepare_makemod import prepare_makemod
+    match_dir = grid.match_tracks()
+
+    def func(sub):
+        here = os.getcwd()
+        os.chdir(grid.tracks_dir)
+        try:
+            return prepare_makemod(sub=sub)
+        finally:
+            os.chdir(here)
+    return (lambda: (os.path.split(match_dir)[1], ), func,
+            len(grid.prefixs))
+
+
+def run_benchmark(setup, func, repeat=3):
+    """wall times of repeat calls of func(*setup())"""
+    times = []
+    for _ in range(repeat):
+        with quiet():
+            args = setup()
+            t0 = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - t0)
+    return times
+
+
+def environment():
+    """versions of what is being benchmarked"""
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'machine': platform.machine(),
+            'git_hash': git_hash()}
+
+
+def run_benchmarks(grid, names=None, repeat=3):
+    """
+    Run the benchmarks names (default BENCHMARKS) on grid.
+
+    Returns
+    -------
+    dict of name: {best, median, mean, std, repeat, nitems, times} (s)
+    """
+    names = names or BENCHMARKS
+    results = {}
+    for name in names:
+        setup, func, nitems = globals()['bench_' + name](grid)
+        times = run_benchmark(setup, func, repeat=repeat)
+        results[name] = {'best': float(np.min(times)),
+                         'median': float(np.median(times)),
+                         'mean': float(np.mean(times)),
+                         'std': float(np.std(times)),
+                         'repeat': repeat, 'nitems': nitems,
+                         'times': times}
+        print('{0:s}: {1:.4f}s best of {2:d} ({3:d} items)'.format(
+            name, np.min(times), repeat, nitems))
+    return results
+
+
+def main(argv):
+    """Main function for bench_pipeline"""
+    parser = argparse.ArgumentParser(
+        description="benchmark the parsec2match pipeline on a synthetic grid")
+
+    parser.add_argument('-n', '--nmass', type=int, default=10,
+                        help='number of masses in each track set')
+
+    parser.add_argument('-r', '--nrows', type=int, default=2000,
+                        help='rows of each synthetic track')
+
+    parser.add_argument('-t', '--ntps', type=int, default=10,
+                        help='thermal pulses of each COLIBRI track')
+
+    parser.add_argument('-R', '--repeat', type=int, default=3,
+                        help='number of repeats of each benchmark')
+
+    parser.add_argument('-b', '--benchmarks', type=str, default=None,
+                        help='comma separated benchmarks to run '
+                             '(default all: {0:s})'.format(
+                                 ','.join(BENCHMARKS)))
+
+    parser.add_argument('-d', '--grid_dir', type=str, default=None,
+                        help='write (and keep) the grid here')
+
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+                        help='write results to this json file')
+
+    args = parser.parse_args(argv)
+
+    names = None
+    if args.benchmarks is not None:
+        names = args.benchmarks.split(',')
+        unknown = [n for n in names if n not in BENCHMARKS]
+        assert len(unknown) == 0, 'unknown benchmarks {0!s}'.format(unknown)
+
+    outdir = args.grid_dir or tempfile.mkdtemp(prefix='padova_bench_')
+    try:
+        grid = Grid(outdir, nmass=args.nmass, nrows=args.nrows,
+                    ntps=args.ntps)
+        results = {'grid': grid.params, 'environment': environment(),
+                   'benchmarks': run_benchmarks(grid, names=names,
+                                                repeat=args.repeat)}
+    finally:
+        if args.grid_dir is None:
+            shutil.rmtree(outdir)
+
+    if args.outfile is not None:
+        with open(args.outfile, 'w') as out:
+            json.dump(results, out, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+"""
+Benchmark writing MATCH track files with fileio.savetxt against the
+np.savetxt it replaced (same bytes), and the time of the formatting alone.
+
+python -m padova_tracks.benchmarks.bench_writer -n 2000 -r 1500
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from ..fileio import savetxt
+
+HEADER = 'logAge Mass logTe Mbol logg C/O'
+
+
+def synthetic_tracks(ntracks=2000, nrows=1500, seed=0):
+    """ntracks MATCH-like (logAge Mass logTe Mbol logg C/O) arrays"""
+    rng = np.random.RandomState(seed)
+    tracks = []
+    for _ in range(ntracks):
+        track = np.column_stack([np.sort(rng.uniform(5, 10.2, nrows)),
+                                 rng.uniform(0.1, 12, nrows),
+                                 rng.uniform(3.4, 4.7, nrows),
+                                 rng.uniform(-5, 12, nrows),
+                                 rng.uniform(-1, 8, nrows),
+                                 np.zeros(nrows)])
+        tracks.append(track)
+    return tracks
+
+
+def write_all(func, tracks, outdir, fmt='%.10f'):
+    """wall time of writing every track with func"""
+    t0 = time.perf_counter()
+    for i, track in enumerate(tracks):
+        func(os.path.join(outdir, 'match_{0:05d}.dat'.format(i)), track,
+             header=HEADER, fmt=fmt)
+    return time.perf_counter() - t0
+
+
+def format_all(func, tracks, fmt='%.10f'):
+    """wall time of formatting every track with func (no disk)"""
+    t0 = time.perf_counter()
+    for track in tracks:
+        func(io.StringIO(), track, header=HEADER, fmt=fmt)
+    return time.perf_counter() - t0
+
+
+def main(argv):
+    """Main function for bench_writer"""
+    parser = argparse.ArgumentParser(description="benchmark fileio.savetxt")
+
+    parser.add_argument('-n', '--ntracks', type=int, default=2000,
+                        help='number of tracks')
+
+    parser.add_argument('-r', '--nrows', type=int, default=1500,
+                        help='rows of each track')
+
+    parser.add_argument('-R', '--repeat', type=int, default=3,
+                        help='number of repeats (best is reported)')
+
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+                        help='write results to this json file')
+
+    args = parser.parse_args(argv)
+
+    tracks = synthetic_tracks(args.ntracks, args.nrows)
+    outdir = tempfile.mkdtemp(prefix='padova_writer_')
+    results = {'ntracks': args.ntracks, 'nrows': args.nrows}
+    try:
+        for name, func in [('np.savetxt', np.savetxt),
+                           ('fileio.savetxt', savetxt)]:
+            results[name] = {
+                'write': min(write_all(func, tracks, outdir)
+                             for _ in range(args.repeat)),
+                'format': min(format_all(func, tracks)
+                              for _ in range(args.repeat))}
+            print('{0:s}: write {1:.3f}s format {2:.3f}s'.format(
+                name, results[name]['write'], results[name]['format']))
+
+        # same bytes
+        new = io.StringIO()
+        old = io.StringIO()
+        savetxt(new, tracks[0], header=HEADER, fmt='%.10f')
+        np.savetxt(old, tracks[0], header=HEADER, fmt='%.10f')
+        assert new.getvalue() == old.getvalue(), 'output differs'
+    finally:
+        shutil.rmtree(outdir)
+
+    if args.outfile is not None:
+        with open(args.outfile, 'w') as out:
+            json.dump(results, out, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,361 @@
+"""
+Performance regression gate of the pipeline entry points.
+
+Runs parsec2match.main, track_set.main and interpolate_match_grid.main on
+a synthetic grid (see benchmarks.synthetic), each repeat in a fresh
+process so its peak memory (max RSS) is its own. The result of each
+commit is kept in results_dir/<git hash>.json and compared against a
+baseline (default: the latest result of another commit run on the same
+grid). An entry point regresses if
+
+    its median time is more than time_tol slower than the baseline and
+    the times are significantly slower (one sided Mann-Whitney U, p <=
+    alpha, if both runs have at least 3 repeats), or
+    its peak memory is more than mem_tol larger than the baseline.
+
+The exit status is 1 if anything regressed.
+
+python -m padova_tracks.benchmarks.regression -R 5
+python -m padova_tracks.benchmarks.regression -c results/<hash>.json -b <hash>
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .bench_pipeline import environment, quiet
+from .synthetic import make_grid
+from ..fileio import get_files
+from ..utils import git_hash
+
+ENTRY_POINTS = ['parsec2match', 'track_set', 'interpolate_match_grid']
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+OVS = [0.4, 0.6]
+
+
+class Workspace(object):
+    """
+    A synthetic grid and the inputs of each entry point.
+
+    outdir/tracks          PARSEC tracks (see make_grid)
+    outdir/parsec2match.json  parsec2match input file
+    outdir/tracks/match    MATCH tracks (written once, read by track_set)
+    outdir/interp/ov*      copies of the MATCH tracks at two overshoots and
+                           the MHeF file for interpolate_match_grid
+    """
+    def __init__(self, outdir, nmass=10, nrows=2000, mhef=1.8):
+        self.outdir = outdir
+        self.params = {'nmass': nmass, 'nrows': nrows, 'mhef': mhef}
+        with quiet():
+            self.prefixs = make_grid(outdir, nmass=nmass, nrows=nrows,
+                                     mhef=mhef, agb=False)
+        self.tracks_dir = os.path.join(outdir, 'tracks')
+        self.match_dir = os.path.join(self.tracks_dir, 'match')
+        self.interp_dir = os.path.join(outdir, 'interp')
+        self.infile = self.write_input()
+        self.ntracks = len(get_files(os.path.join(self.tracks_dir,
+                                                  self.prefixs[0]), '*.*'))
+
+        # track_set and interpolate_match_grid need MATCH tracks
+        _run_entry(self.job('parsec2match'))
+        self.write_interp()
+
+    def write_input(self):
+        """parsec2match input file of the whole grid"""
+        infile = os.path.join(self.outdir, 'parsec2match.json')
+        with open(infile, 'w') as out:
+            json.dump({'tracks_dir': self.tracks_dir,
+                       'prefixs': self.prefixs,
+                       'overwrite_match': True}, out, indent=1)
+        return infile
+
+    def write_interp(self):
+        """MATCH track sets at OVS and their MHeF file"""
+        for ov in OVS:
+            for prefix in self.prefixs:
+                newset = prefix.replace('OV0.5', 'OV{0:.1f}'.format(ov))
+                dest = os.path.join(self.interp_dir, 'ov{0:.2f}'.format(ov),
+                                    newset)
+                shutil.copytree(os.path.join(self.match_dir, prefix), dest)
+        zs = [float(p.split('_Z')[1].split('_')[0]) for p in self.prefixs]
+        line = '# OV ' + ' '.join(['Z{0:g}'.format(z) for z in zs]) + '\n'
+        for ov in [OVS[0], np.mean(OVS), OVS[1]]:
+            line += ' '.join(['{0:.2f}'.format(i) for i in
+                              [ov] + [self.params['mhef']] * len(zs)])
+            line += '\n'
+        self.mhef_file = os.path.join(self.interp_dir, 'MHeF_interp.dat')
+        with open(self.mhef_file, 'w') as out:
+            out.write(line)
+
+    def job(self, name):
+        """(name, argv, cwd, files to remove before running) of an entry"""
+        if name == 'parsec2match':
+            return (name, [self.infile], self.outdir, [])
+        if name == 'track_set':
+            outfile = os.path.join(self.outdir, 'eeptrack.dat')
+            return (name, ['-m', '-p', self.prefixs[0], '-o', outfile],
+                    self.match_dir, [outfile])
+        if name == 'interpolate_match_grid':
+            newsub = os.path.join(self.interp_dir,
+                                  'ov{0:.2f}'.format(np.mean(OVS)))
+            return (name, ['-m', self.mhef_file] +
+                    ['ov{0:.2f}'.format(ov) for ov in OVS],
+                    self.interp_dir, [newsub])
+        raise ValueError('unknown entry point {0:s}'.format(name))
+
+    def nitems(self, name):
+        """tracks each entry point works through (for throughput)"""
+        if name == 'track_set':
+            return self.ntracks
+        return self.ntracks * len(self.prefixs)
+
+
+def _entry_point(name):
+    if name == 'parsec2match':
+        from ..parsec2match import main
+    elif name == 'track_set':
+        from ..tracks.track_set import main
+    else:
+        from ..interpolate.interpolate_match_grid import main
+    return main
+
+
+def _run_entry(job):
+    """run an entry point (in a fresh process), return seconds, max RSS (MB)"""
+    name, argv, cwd, clean = job
+    for path in clean:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
+            os.remove(path)
+    main = _entry_point(name)
+    here = os.getcwd()
+    os.chdir(cwd)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            main(argv)
+            seconds = time.perf_counter() - t0
+    finally:
+        os.chdir(here)
+    # ru_maxrss is in kB on linux, bytes on macOS
+    scale = 1024. ** 2 if sys.platform == 'darwin' else 1024.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return seconds, maxrss
+
+
+def run_entry(job, repeat=3):
+    """times and max RSS of repeat runs, each in its own process"""
+    ctx = multiprocessing.get_context('spawn')
+    times = []
+    rss = []
+    for _ in range(repeat):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                    mp_context=ctx) as pool:
+            seconds, maxrss = pool.submit(_run_entry, job).result()
+        times.append(seconds)
+        rss.append(maxrss)
+    return times, rss
+
+
+def run(workspace, names=None, repeat=3):
+    """run the entry points names (default ENTRY_POINTS) on workspace"""
+    names = names or ENTRY_POINTS
+    entries = {}
+    for name in names:
+        times, rss = run_entry(workspace.job(name), repeat=repeat)
+        nitems = workspace.nitems(name)
+        entries[name] = {'times': times, 'max_rss': rss,
+                         'median': float(np.median(times)),
+                         'peak_rss': float(np.max(rss)),
+                         'nitems': nitems,
+                         'throughput': nitems / float(np.median(times))}
+        print('{0:s}: {1:.3f}s median of {2:d}, {3:.1f} tracks/s, '
+              '{4:.0f} MB'.format(name, entries[name]['median'], repeat,
+                                  entries[name]['throughput'],
+                                  entries[name]['peak_rss']))
+    return {'commit': git_hash(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+            'grid': workspace.params, 'environment': environment(),
+            'entries': entries}
+
+
+def save_result(result, results_dir=RESULTS_DIR):
+    """write result to results_dir/<commit>.json (a rerun replaces it)"""
+    os.makedirs(results_dir, exist_ok=True)
+    outfile = os.path.join(results_dir, '{0:s}.json'.format(result['commit']))
+    with open(outfile, 'w') as out:
+        json.dump(result, out, indent=1)
+    return outfile
+
+
+def load_history(results_dir=RESULTS_DIR):
+    """all saved results, oldest first"""
+    history = []
+    for filename in glob.glob(os.path.join(results_dir, '*.json')):
+        with open(filename, 'r') as inp:
+            history.append(json.load(inp))
+    return sorted(history, key=lambda r: r['date'])
+
+
+def find_baseline(result, history, commit=None):
+    """
+    The result of commit (or the latest of another commit) with the same
+    grid as result, None if there is none.
+    """
+    same = [r for r in history if r['grid'] == result['grid']]
+    if commit is not None:
+        same = [r for r in same if r['commit'].startswith(commit)]
+        return same[-1] if len(same) > 0 else None
+    same = [r for r in same if r['commit'] != result['commit']]
+    return same[-1] if len(same) > 0 else None
+
+
+def slower(times, base_times):
+    """
+    p value that times are slower than base_times (Mann-Whitney U), 0 if
+    there are too few repeats to tell.
+    """
+    if len(times) < 3 or len(base_times) < 3:
+        return 0.
+    from scipy.stats import mannwhitneyu
+    return float(mannwhitneyu(times, base_times, alternative='greater')[1])
+
+
+def compare(result, baseline, time_tol=0.1, mem_tol=0.1, alpha=0.05):
+    """
+    Compare result to baseline.
+
+    Parameters
+    ----------
+    time_tol, mem_tol : float
+        allowed fractional increase of the median time and the peak RSS
+    alpha : float
+        significance level of the time increase
+
+    Returns
+    -------
+    list of regression messages (empty if none)
+    """
+    regressions = []
+    fmt = '{0:32s} {1:>10s} {2:>10s} {3:>8s}'
+    print('compared to {0:s} ({1:s})'.format(baseline['commit'],
+                                             baseline['date']))
+    print(fmt.format('', 'baseline', 'this', 'change'))
+    for name, entry in result['entries'].items():
+        base = baseline['entries'].get(name)
+        if base is None:
+            continue
+        dtime = entry['median'] / base['median'] - 1
+        dmem = entry['peak_rss'] / base['peak_rss'] - 1
+        pval = slower(entry['times'], base['times'])
+        print(fmt.format(name + ' time', '{0:.3f}s'.format(base['median']),
+                         '{0:.3f}s'.format(entry['median']),
+                         '{0:+.1%}'.format(dtime)))
+        print(fmt.format(name + ' max RSS',
+                         '{0:.0f}MB'.format(base['peak_rss']),
+                         '{0:.0f}MB'.format(entry['peak_rss']),
+                         '{0:+.1%}'.format(dmem)))
+        if dtime > time_tol and pval <= alpha:
+            regressions.append(
+                '{0:s} throughput {1:.1f} -> {2:.1f} tracks/s (p={3:.3g})'
+                .format(name, base['throughput'], entry['throughput'], pval))
+        if dmem > mem_tol:
+            regressions.append('{0:s} peak memory {1:.0f} -> {2:.0f} MB'
+                               .format(name, base['peak_rss'],
+                                       entry['peak_rss']))
+    return regressions
+
+
+def main(argv):
+    """Main function for regression"""
+    parser = argparse.ArgumentParser(
+        description="benchmark the pipeline entry points and compare to a "
+                    "baseline, exit 1 on a regression")
+
+    parser.add_argument('-n', '--nmass', type=int, default=10,
+                        help='number of masses in each track set')
+
+    parser.add_argument('-r', '--nrows', type=int, default=2000,
+                        help='rows of each synthetic track')
+
+    parser.add_argument('-R', '--repeat', type=int, default=5,
+                        help='runs of each entry point')
+
+    parser.add_argument('-e', '--entries', type=str, default=None,
+                        help='comma separated entry points (default all: '
+                             '{0:s})'.format(','.join(ENTRY_POINTS)))
+
+    parser.add_argument('-o', '--results_dir', type=str, default=RESULTS_DIR,
+                        help='where the result of each commit is kept')
+
+    parser.add_argument('-b', '--baseline', type=str, default=None,
+                        help='commit to compare to (default latest other)')
+
+    parser.add_argument('-c', '--compare', type=str, default=None,
+                        help='compare this result file instead of running')
+
+    parser.add_argument('--no_save', action='store_true',
+                        help='do not keep this run in results_dir')
+
+    parser.add_argument('--time_tol', type=float, default=0.1,
+                        help='allowed fractional slow down')
+
+    parser.add_argument('--mem_tol', type=float, default=0.1,
+                        help='allowed fractional peak memory increase')
+
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='significance level of a slow down')
+
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as inp:
+            result = json.load(inp)
+    else:
+        names = None
+        if args.entries is not None:
+            names = args.entries.split(',')
+            unknown = [n for n in names if n not in ENTRY_POINTS]
+            assert len(unknown) == 0, \
+                'unknown entry points {0!s}'.format(unknown)
+        outdir = tempfile.mkdtemp(prefix='padova_regression_')
+        try:
+            workspace = Workspace(outdir, nmass=args.nmass, nrows=args.nrows)
+            result = run(workspace, names=names, repeat=args.repeat)
+        finally:
+            shutil.rmtree(outdir)
+
+    history = load_history(args.results_dir)
+    if args.compare is None and not args.no_save:
+        print('wrote {0:s}'.format(save_result(result, args.results_dir)))
+
+    baseline = find_baseline(result, history, commit=args.baseline)
+    if baseline is None:
+        print('no baseline with the same grid in {0:s}'.format(
+            args.results_dir))
+        return
+
+    regressions = compare(result, baseline, time_tol=args.time_tol,
+                          mem_tol=args.mem_tol, alpha=args.alpha)
+    if len(regressions) > 0:
+        print('REGRESSION')
+        print('\n'.join(regressions))
+        sys.exit(1)
+    print('no regressions')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
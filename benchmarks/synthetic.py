@@ -0,0 +1,446 @@
+"""
+Synthetic PARSEC/COLIBRI track grids for the benchmarks.
+
+The tracks are not physical, they only have the morphology (and file
+formats) the pipeline expects: monotonically increasing age, XCEN/YCEN
+burning, an RGB tip, core He burning and (optionally) thermal pulses.
+Each COLIBRI track starts at the first thermal pulse (1TP) of its PARSEC
+track so parsec_colibri.attach can stitch them.
+
+python -m padova_tracks.benchmarks.synthetic <outdir> -n 10 -r 2000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from ..eep.critical_point import Eep
+
+PARSEC_COLS = ['MODE', 'AGE', 'MASS', 'LOG_L', 'LOG_TE', 'LOG_R', 'LOG_RHc',
+               'LOG_Pc', 'XCEN', 'YCEN', 'XC_cen', 'XO_cen', 'LX', 'LY',
+               'QHEL', 'QH1', 'QH2', 'QHE1', 'QHE2', 'CI1', 'CF1', 'CI2',
+               'CF2', 'CONV', 'Dtime']
+
+COLIBRI_COLS = ['age/yr', 'M_*', 'lg L_*', 'lg T_*', 'M', 'M_c', 'Z', 'NTP',
+                'step', 'status', 'PHI_TP', 'C/O', 'Pmod', 'P0', 'P1',
+                'dMdt', 'Mdust']
+
+PARSEC_FMT = 'Z{0:g}Y{1:g}OUTA1.74_F7_M{2:.3f}{3:s}'
+
+# fraction of rows in each phase: PMS, MS, SGB+RGB, CHeB, EAGB
+PHASES = np.array([0.1, 0.3, 0.2, 0.3, 0.1])
+
+
+def ms_lifetime(mass):
+    """rough main sequence lifetime in yr"""
+    return 1e10 * mass ** -2.5
+
+
+def _ramp(n, a, b, power=1.):
+    """n points from a to b (endpoint excluded) with a power law shape"""
+    return a + (b - a) * np.linspace(0, 1, n, endpoint=False) ** power
+
+
+def _phase_lengths(nrows, fracs):
+    lens = np.array(np.round(fracs / np.sum(fracs) * nrows), dtype=int)
+    lens[-1] = nrows - np.sum(lens[:-1])
+    return lens
+
+
+def parsec_iptcri(nrows=2000, kind='full'):
+    """
+    EEP rows of parsec_track(mass, nrows=nrows, kind=kind), in the order of
+    Eep().eep_list (or eep_list_hb if kind is 'hb'), 0 if not on the track.
+    """
+    if kind == 'hb':
+        nheb, _ = _phase_lengths(nrows, PHASES[3:])
+        # HE_BEG (the first model older than 0.2 yr) END_CHEB TPAGB_BEG FIN
+        return np.array([1, nheb - 1, nrows - 1, 0])
+
+    iptcri = np.zeros(len(Eep().eep_list), dtype=int)
+    npms, nms, nrgb, nheb, _ = _phase_lengths(nrows, PHASES)
+    if kind == 'vlowmass':
+        npms, nms = _phase_lengths(nrows, PHASES[:2])
+        nrgb = nheb = 0
+    elif kind == 'lowmass':
+        npms, nms, nrgb = _phase_lengths(nrows, PHASES[:3])
+        nheb = 0
+
+    # PMS_BEG (the first model older than 0.2 yr) MS_BEG MS_TMIN MS_TO
+    iptcri[:3] = [1, npms, npms + nms // 3]
+    if kind == 'vlowmass':
+        return iptcri
+    iptcri[3] = npms + nms - 1
+    # RG_TIP
+    iptcri[4] = npms + nms + nrgb - 1
+    if kind == 'lowmass':
+        return iptcri
+    # HE_BEG END_CHEB TPAGB_BEG (the last PARSEC row)
+    nign = max(nheb // 10, 4)
+    iptcri[5:8] = [npms + nms + nrgb + nign, npms + nms + nrgb + nheb - 1,
+                   nrows - 1]
+    return iptcri
+
+
+def parsec_track(mass, Z=0.014, nrows=2000, kind='full'):
+    """
+    Data of a synthetic PARSEC track as a (nrows, ncols) array.
+
+    kind : str
+        'full' (through the EAGB), 'lowmass' (ends at the RGB tip),
+        'vlowmass' (never reaches the MSTO), 'hb' (ZAHB to the EAGB)
+    """
+    x0 = 0.7
+    y0 = 1. - Z - x0
+    ycen_ms = 1. - Z
+    tms = ms_lifetime(mass)
+    logl0 = 4. * np.log10(mass)
+    logt0 = 3.76 + 0.15 * np.log10(mass)
+
+    if kind == 'hb':
+        lens = _phase_lengths(nrows, PHASES[3:])
+        nheb, neagb = lens
+        age = np.concatenate([[0.1], np.linspace(1e3, 1e8, nheb - 1),
+                              np.linspace(1e8, 1.2e8, neagb + 1)[1:]])
+        ycen = np.concatenate([np.linspace(ycen_ms, 1e-4, nheb),
+                               np.zeros(neagb)])
+        logl = np.concatenate([_ramp(nheb, 1.6, 1.9),
+                               _ramp(neagb, 1.9, 3.0)])
+        logt = np.concatenate([_ramp(nheb, 3.70, 3.66),
+                               _ramp(neagb, 3.66, 3.55)])
+        logr = np.concatenate([_ramp(nheb, 1.0, 1.1), _ramp(neagb, 1.1, 2.)])
+        # a dip in radius just after the ZAHB
+        logr[:nheb // 10] -= np.linspace(0., 0.05, nheb // 10)
+        xcen = np.zeros(nrows)
+        lx = np.zeros(nrows) + 0.5
+        ly = np.concatenate([np.ones(nheb), np.zeros(neagb)]) * 0.5
+    else:
+        lens = _phase_lengths(nrows, PHASES)
+        npms, nms, nrgb, nheb, neagb = lens
+        if kind == 'vlowmass':
+            lens = _phase_lengths(nrows, PHASES[:2])
+            npms, nms = lens
+            nrgb = nheb = neagb = 0
+        elif kind == 'lowmass':
+            lens = _phase_lengths(nrows, PHASES[:3])
+            npms, nms, nrgb = lens
+            nheb = neagb = 0
+
+        tpms = 0.01 * tms
+        age = np.concatenate([[0.1], np.logspace(2, np.log10(tpms), npms - 1),
+                              np.linspace(tpms, tms, nms + 1)[1:]])
+        if kind == 'vlowmass':
+            xf = 0.3
+        else:
+            xf = 0.
+        xcen = np.concatenate([np.zeros(npms) + x0,
+                               x0 - (x0 - xf) *
+                               np.linspace(0, 1, nms) ** 0.8])
+        lx = np.concatenate([np.linspace(0.1, 0.99, npms),
+                             np.ones(nms)])
+        logl = np.concatenate([_ramp(npms, logl0 + 1., logl0),
+                               _ramp(nms, logl0, logl0 + 0.3)])
+        logt = np.concatenate([_ramp(npms, logt0 - 0.1, logt0),
+                               _ramp(nms, logt0, logt0 + 0.02)])
+        logr = np.concatenate([_ramp(npms, 0.5, 0.), _ramp(nms, 0., 0.2)])
+        ycen = 1. - Z - xcen
+        ly = np.zeros(npms + nms)
+        if nrgb > 0:
+            age = np.append(age, np.linspace(tms, 1.1 * tms, nrgb + 1)[1:])
+            xcen = np.append(xcen, np.zeros(nrgb))
+            ycen = np.append(ycen, np.zeros(nrgb) + ycen_ms)
+            lx = np.append(lx, np.ones(nrgb))
+            ly = np.append(ly, np.zeros(nrgb))
+            logl = np.append(logl, _ramp(nrgb + 1, logl0 + 0.3,
+                                         logl0 + 3.0, 2.)[1:])
+            logt = np.append(logt, _ramp(nrgb + 1, logt0 + 0.02,
+                                         logt0 - 0.15, 0.5)[1:])
+            logr = np.append(logr, _ramp(nrgb + 1, 0.2, 2.0, 2.)[1:])
+        if nheb > 0:
+            age = np.append(age, np.linspace(1.1 * tms, 1.2 * tms,
+                                             nheb + 1)[1:])
+            # slow start of core He burning (sets HE_BEG)
+            nign = max(nheb // 10, 4)
+            ycen = np.append(ycen, np.concatenate(
+                [np.linspace(ycen_ms, ycen_ms - 0.04, nign, endpoint=False),
+                 np.linspace(ycen_ms - 0.04, 1e-4, nheb - nign)]))
+            xcen = np.append(xcen, np.zeros(nheb))
+            lx = np.append(lx, np.zeros(nheb) + 0.5)
+            ly = np.append(ly, np.zeros(nheb) + 0.5)
+            logl = np.append(logl, _ramp(nheb, logl0 + 2.0, logl0 + 2.2))
+            logt = np.append(logt, _ramp(nheb, logt0 - 0.05, logt0 - 0.08))
+            hlogr = _ramp(nheb, 1.0, 1.1)
+            ndip = max(nheb // 10, 4)
+            hlogr[:ndip] -= np.linspace(0., 0.05, ndip)
+            logr = np.append(logr, hlogr)
+        if neagb > 0:
+            age = np.append(age, np.linspace(1.2 * tms, 1.22 * tms,
+                                             neagb + 1)[1:])
+            ycen = np.append(ycen, np.zeros(neagb))
+            xcen = np.append(xcen, np.zeros(neagb))
+            lx = np.append(lx, np.zeros(neagb) + 0.5)
+            ly = np.append(ly, np.zeros(neagb))
+            logl = np.append(logl, _ramp(neagb + 1, logl0 + 2.2,
+                                         logl0 + 3.3)[1:])
+            logt = np.append(logt, _ramp(neagb + 1, logt0 - 0.08,
+                                         logt0 - 0.2)[1:])
+            logr = np.append(logr, _ramp(neagb + 1, 1.1, 2.2)[1:])
+
+    nrows = len(age)
+    # remove exact duplicates in the HRD
+    wiggle = 1e-4 * np.sin(np.arange(nrows) / 7.)
+    logl = logl + wiggle
+    logt = logt + 0.3 * wiggle
+    dtime = np.append(np.diff(age), 0.)
+    qhel = np.linspace(0.1, 0.5, nrows) * (ycen < ycen_ms - 0.01)
+    data = np.column_stack([
+        np.arange(nrows) + 1,            # MODE
+        age,                             # AGE
+        np.zeros(nrows) + mass,          # MASS
+        logl,                            # LOG_L
+        logt,                            # LOG_TE
+        logr,                            # LOG_R
+        np.linspace(2., 5., nrows),      # LOG_RHc
+        np.linspace(17., 20., nrows),    # LOG_Pc
+        xcen,                            # XCEN
+        ycen,                            # YCEN
+        (1. - ycen - xcen) * 0.6,        # XC_cen
+        (1. - ycen - xcen) * 0.4,        # XO_cen
+        lx,                              # LX
+        ly,                              # LY
+        qhel,                            # QHEL
+        np.zeros(nrows) + 0.1,           # QH1
+        np.zeros(nrows) + 0.2,           # QH2
+        np.zeros(nrows) + 0.05,          # QHE1
+        np.zeros(nrows) + 0.08,          # QHE2
+        np.zeros(nrows),                 # CI1
+        np.linspace(0.3, 0.1, nrows),    # CF1
+        np.zeros(nrows) + 0.7,           # CI2
+        np.ones(nrows),                  # CF2
+        np.zeros(nrows) + 0.05,          # CONV
+        dtime])                          # Dtime
+    return data
+
+
+def parsec_header(mass, Z, Y, alfov=0.5):
+    """PARSEC-like header lines"""
+    lines = [' PARSEC v1.2S synthetic track\n',
+             ' ALFOV {0:.2f}\n'.format(alfov),
+             ' MASS={0:.4f} Z={1:g} Y={2:g} ALFOV={3:.2f} '
+             'AGELIMIT=1.3E10\n'.format(mass, Z, Y, alfov),
+             ' BEGIN TRACK\n']
+    return lines
+
+
+def write_parsec_track(filename, data, mass, Z, Y):
+    """write a PARSEC formatted file"""
+    fmt = '%i ' + ' '.join(['%.8e'] * (data.shape[1] - 1))
+    with open(filename, 'w') as out:
+        out.writelines(parsec_header(mass, Z, Y))
+        out.write('# ' + ' '.join(PARSEC_COLS) + '\n')
+        np.savetxt(out, data, fmt=fmt)
+        out.write(' END OF TRACK\n')
+        out.write(' synthetic footer\n')
+    return filename
+
+
+def colibri_track(mass, Z=0.014, nrows=2000, ntps=10, logl0=3.3,
+                  logt0=3.55):
+    """
+    Data of a synthetic COLIBRI (TP-AGB) track of ntps thermal pulses that
+    starts at logl0, logt0 (the 1TP).
+    """
+    # The first two lines are zero age (see combine_parsec_colibri)
+    ntp = np.repeat(np.arange(1, ntps + 1), int(np.ceil(nrows / ntps)))
+    ntp = np.array(ntp[:nrows], dtype=float)
+    dage = np.linspace(0., 1e6 * mass, nrows)
+    dage[1] = 0.
+    phi = np.zeros(nrows)
+    status = np.zeros(nrows)
+    for i in np.unique(ntp):
+        itp, = np.nonzero(ntp == i)
+        phi[itp] = np.linspace(0, 1, len(itp))
+        status[itp] = 6 + (np.arange(len(itp)) % 3)
+        status[itp[:2]] = 3
+    logl = logl0 + 0.1 + 0.5 * np.linspace(0, 1, nrows) - \
+        0.1 * (1. - phi) ** 3
+    logt = logt0 - 0.1 * np.linspace(0, 1, nrows) + 0.01 * phi
+    mact = mass - 0.3 * mass * np.linspace(0, 1, nrows) ** 3
+    co = 0.5 + 1.5 * np.linspace(0, 1, nrows)
+    pmod = np.where(np.arange(nrows) % 5 == 0, 1., 0.)
+    pmod[:2] = np.nan
+    dmdt = -7. + 3. * np.linspace(0, 1, nrows)
+    mdust = np.where(np.linspace(0, 1, nrows) > 0.5, dmdt, -99.)
+    data = np.column_stack([
+        dage,                                   # age/yr
+        mact,                                   # M_*
+        logl,                                   # lg L_*
+        logt,                                   # lg T_*
+        mact,                                   # M
+        np.linspace(0.5, 0.6, nrows),           # M_c
+        np.zeros(nrows) + Z,                    # Z
+        ntp,                                    # NTP
+        np.arange(nrows) + 1.,                  # step
+        status,                                 # status
+        phi,                                    # PHI_TP
+        co,                                     # C/O
+        pmod,                                   # Pmod
+        np.linspace(100, 500, nrows),           # P0
+        np.linspace(50, 300, nrows),            # P1
+        dmdt,                                   # dMdt
+        mdust])                                 # Mdust
+    return data
+
+
+def write_colibri_track(filename, data):
+    """write a COLIBRI formatted file"""
+    with open(filename, 'w') as out:
+        out.write('# ' + '  '.join(COLIBRI_COLS) + '\n')
+        np.savetxt(out, data, fmt='%.10g')
+    return filename
+
+
+def write_firsttp(filename, Z, masses, tracks):
+    """1TP .INP file: the HRD location of the first thermal pulse"""
+    with open(filename, 'w') as out:
+        out.write('#   z0    m1    l1    te1    mc1\n')
+        for mass, data in zip(masses, tracks):
+            out.write('{0:g} {1:.3f} {2:.6f} {3:.6f} 0.55\n'
+                      .format(Z, mass, data[-1, 3], data[-1, 4]))
+    return filename
+
+
+def write_ptcri(filename, masses, iptcris, eep_list):
+    """ptcri file: i mass kind EEP1 ... EEPn fname (see CriticalPoint)"""
+    with open(filename, 'w') as out:
+        out.write('# synthetic ptcri file\n')
+        out.write('# i mass kind {0:s} fname\n'.format(' '.join(eep_list)))
+        for i, (mass, iptcri) in enumerate(zip(masses, iptcris)):
+            out.write('{0:d} {1:.3f} 1 {2:s} M{1:.3f}.PMS\n'
+                      .format(i + 1, mass,
+                              ' '.join('{:d}'.format(p) for p in iptcri)))
+    return filename
+
+
+def make_grid(outdir, zs=(0.004, 0.014), nmass=10, nrows=2000, mmin=0.5,
+              mmax=5., mhef=1.8, mvlow=0.6, agb=True, ntps=10, ext='.PMS',
+              hb_ext='.PMS.HB'):
+    """
+    Write a synthetic grid.
+
+    outdir/tracks/<prefix>/*<ext>, *<hb_ext> PARSEC tracks
+    outdir/ptcri/p2m_<prefix>.dat, p2m_hb_<prefix>.dat EEP files
+    outdir/colibri/Z<z>_Y<y>/agb_<m>_Z<z>_Mdot50.dat COLIBRI tracks
+    outdir/1tp/Z<z>Y<y>.INP first TP files
+
+    Parameters
+    ----------
+    zs : list
+        metallicities (one track set each)
+    nmass, mmin, mmax : int, float, float
+        nmass masses log spaced between mmin and mmax
+    nrows : int
+        rows of each PARSEC and COLIBRI track
+    mhef, mvlow : float
+        masses above mhef are full tracks (and have COLIBRI tracks),
+        masses between mvlow and mhef end at the RGB tip and have an HB
+        track, masses below mvlow never reach the MSTO.
+    agb : bool
+        write the COLIBRI and 1TP files
+    ntps : int
+        thermal pulses of each COLIBRI track
+
+    Returns the list of prefixes.
+    """
+    eep = Eep()
+    masses = np.round(np.geomspace(mmin, mmax, nmass), 3)
+    ptcri_dir = os.path.join(outdir, 'ptcri')
+    os.makedirs(ptcri_dir, exist_ok=True)
+    prefixs = []
+    for Z in zs:
+        Y = np.round(0.249 + 1.78 * Z, 3)
+        prefix = 'SYN_OV0.5_Z{0:g}_Y{1:g}'.format(Z, Y)
+        prefixs.append(prefix)
+        tdir = os.path.join(outdir, 'tracks', prefix)
+        os.makedirs(tdir, exist_ok=True)
+        iptcris = []
+        hbmasses = []
+        hbiptcris = []
+        for mass in masses:
+            if mass < mvlow:
+                kind = 'vlowmass'
+            elif mass <= mhef:
+                kind = 'lowmass'
+            else:
+                kind = 'full'
+            name = PARSEC_FMT.format(Z, Y, mass, ext)
+            write_parsec_track(os.path.join(tdir, name),
+                               parsec_track(mass, Z=Z, nrows=nrows, kind=kind),
+                               mass, Z, Y)
+            iptcris.append(parsec_iptcri(nrows=nrows, kind=kind))
+            if mvlow <= mass <= mhef:
+                name = PARSEC_FMT.format(Z, Y, mass, hb_ext)
+                write_parsec_track(os.path.join(tdir, name),
+                                   parsec_track(mass, Z=Z, nrows=nrows,
+                                                kind='hb'),
+                                   mass, Z, Y)
+                hbmasses.append(mass)
+                hbiptcris.append(parsec_iptcri(nrows=nrows, kind='hb'))
+
+        write_ptcri(os.path.join(ptcri_dir, 'p2m_{0:s}.dat'.format(prefix)),
+                    masses, iptcris, eep.eep_list)
+        write_ptcri(os.path.join(ptcri_dir,
+                                 'p2m_hb_{0:s}.dat'.format(prefix)),
+                    hbmasses, hbiptcris, eep.eep_list_hb)
+        if not agb:
+            continue
+
+        cdir = os.path.join(outdir, 'colibri', 'Z{0:g}_Y{1:g}'.format(Z, Y))
+        os.makedirs(cdir, exist_ok=True)
+        agbmasses = masses[masses > mhef]
+        ptracks = [parsec_track(m, Z=Z, nrows=nrows) for m in agbmasses]
+        for mass, ptrack in zip(agbmasses, ptracks):
+            name = 'agb_{0:.3f}_Z{1:.5f}_Mdot50.dat'.format(mass, Z)
+            write_colibri_track(os.path.join(cdir, name),
+                                colibri_track(mass, Z=Z, nrows=nrows,
+                                              ntps=ntps,
+                                              logl0=ptrack[-1, 3],
+                                              logt0=ptrack[-1, 4]))
+        tpdir = os.path.join(outdir, '1tp')
+        os.makedirs(tpdir, exist_ok=True)
+        write_firsttp(os.path.join(tpdir, 'Z{0:g}Y{1:g}.INP'.format(Z, Y)),
+                      Z, agbmasses, ptracks)
+    return prefixs
+
+
+def main(argv):
+    """Main function for synthetic"""
+    parser = argparse.ArgumentParser(description="Write a synthetic grid")
+
+    parser.add_argument('outdir', type=str,
+                        help='output directory')
+
+    parser.add_argument('-z', '--zs', type=str, default='0.004,0.014',
+                        help='comma separated metallicities')
+
+    parser.add_argument('-n', '--nmass', type=int, default=10,
+                        help='number of masses')
+
+    parser.add_argument('-r', '--nrows', type=int, default=2000,
+                        help='rows of each track')
+
+    parser.add_argument('-t', '--ntps', type=int, default=10,
+                        help='thermal pulses of each COLIBRI track')
+
+    parser.add_argument('--no_agb', action='store_true',
+                        help='do not write COLIBRI and 1TP files')
+
+    args = parser.parse_args(argv)
+    zs = [float(z) for z in args.zs.split(',')]
+    print(make_grid(args.outdir, zs=zs, nmass=args.nmass, nrows=args.nrows,
+                    agb=not args.no_agb, ntps=args.ntps))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -24,6 +24,10 @@ xo_cen = 'XO_cen'
 # plot extension
 EXT = '.png'
 
+# most points drawn per figure, longer lines are decimated
+# (see graphics.utils.decimate). 0 or None to draw every point
+max_plot_points = 20000
+
 # what you would like them to be:
 logL = 'logL'
 logT = 'logT'
@@ -38,6 +38,10 @@ class Eep(object):
         self.nms = np.sum(eep_lengths[:trans])
         self.trans = eep_lengths[trans]
 
+        # row of each EEP in a MATCH interpolated track
+        self.eep_offsets = np.insert(np.cumsum(eep_lengths), 0, 0)
+        self.eep_offsets_hb = np.insert(np.cumsum(eep_lengths_hb), 0, 0)
+
     def attach_eeps(self, track):
         """set pdict attribute to track instance of dictionary eep, index"""
         def eepdict(elist):
@@ -1 +1,4 @@
 from .fileio import *
+from .match_archive import *
+from .schema import *
+from .writer import *
@@ -4,13 +4,19 @@ import glob
 import json
 from ..utils import is_numeric
 import collections
+import functools
 from ast import literal_eval
 
 import logging
 
+import numpy as np
+
 __all__ = ['ensure_dir', 'ensure_file', 'get_files', 'load_input', 'get_dirs',
            'load_eepdefs', 'replace_ext', 'tfm_indict', 'ts_indict',
-           'save_ptcri']
+           'save_ptcri', 'write_table', 'format_rows', 'savetxt']
+
+# rows formatted per % call in savetxt
+CHUNK_ROWS = 20000
 
 
 def save_ptcri(line, loc=None, prefix=None):
@@ -45,16 +51,22 @@ def save_ptcri(line, loc=None, prefix=None):
     return filename
 
 
+@functools.lru_cache()
+def _read_inputs(name):
+    '''read a json file in inputs/ once'''
+    base = os.path.split(os.path.split(__file__)[0])[0]
+    inp_par = os.path.join(base, 'inputs', name)
+    with open(inp_par, 'r') as inp:
+        return json.load(inp)
+
+
 def tfm_indict():
     '''
     Load default inputs, the eep lists, and number of equally spaced points
     between eeps. Input file will overwrite these. These should be all possible
-    input options.
+    input options (see fileio.schema for their types).
     '''
-    base = os.path.split(os.path.split(__file__)[0])[0]
-    inp_par = os.path.join(base, 'inputs/tracks4match.json')
-    with open(inp_par, 'r') as inp:
-        indict = json.load(inp)
+    indict = dict(_read_inputs('tracks4match.json'))
 
     # Set default locations to here
     # for k, v in indict.items():
@@ -81,13 +93,9 @@ def ts_indict():
     '''
     Load default inputs, the eep lists, and number of equally spaced points
     between eeps. Input file will overwrite these. These should be all possible
-    input options.
+    input options (see fileio.schema for their types).
     '''
-    base = os.path.split(os.path.split(__file__)[0])[0]
-    inp_par = os.path.join(base, 'inputs/trackset.json')
-    with open(inp_par, 'r') as inp:
-        indict = json.load(inp)
-    return indict
+    return dict(_read_inputs('trackset.json'))
 
 
 def load_input(filename, comment_char='#', list_sep=',', default_dict=None):
@@ -186,7 +194,8 @@ def ensure_dir(f):
 
     d = os.path.dirname(f)
     if not os.path.isdir(d):
-        os.makedirs(d)
+        # exist_ok: another process may make it first
+        os.makedirs(d, exist_ok=True)
         logging.info('made dirs: {}'.format(d))
 
 
@@ -224,3 +233,82 @@ def get_files(src, search_string):
     files = [os.path.join(src, f)
              for f in files if ensure_file(os.path.join(src, f), mad=False)]
     return files
+
+
+def _row_format(fmt, ncols, delimiter=' '):
+    """the format of a whole row (as np.savetxt interprets fmt)"""
+    if not isinstance(fmt, str):
+        assert len(fmt) == ncols, \
+            'fmt has {0:d} formats for {1:d} columns'.format(len(fmt), ncols)
+        return delimiter.join(fmt)
+    nfmt = fmt.count('%')
+    if nfmt == 1:
+        return delimiter.join([fmt] * ncols)
+    assert nfmt == ncols, \
+        'fmt has {0:d} formats for {1:d} columns'.format(nfmt, ncols)
+    return fmt
+
+
+def format_rows(data, fmt='%.18e', delimiter=' ', newline='\n'):
+    """
+    Text of the rows of a 2-D array, the same text np.savetxt writes but
+    formatted in one % call instead of one per row.
+    """
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+    line = _row_format(fmt, data.shape[1], delimiter=delimiter) + newline
+    return (line * len(data)) % tuple(data.ravel().tolist())
+
+
+def savetxt(fname, data, fmt='%.18e', delimiter=' ', newline='\n',
+            header='', comments='# ', chunk_rows=CHUNK_ROWS):
+    """
+    np.savetxt (byte for byte) of a 2-D array of floats or ints, formatting
+    chunk_rows rows at a time with format_rows.
+
+    Parameters
+    ----------
+    fname : str or file
+        filename or open text file
+    fmt, delimiter, newline, header, comments :
+        as np.savetxt
+    chunk_rows : int
+        rows formatted at a time (bounds the memory of the text)
+    """
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+
+    text = []
+    if len(header) > 0:
+        header = header.replace('\n', '\n' + comments)
+        text.append(comments + header + newline)
+
+    def write(out):
+        out.write(''.join(text))
+        for i in range(0, len(data), chunk_rows):
+            out.write(format_rows(data[i:i + chunk_rows], fmt=fmt,
+                                  delimiter=delimiter, newline=newline))
+
+    if hasattr(fname, 'write'):
+        write(fname)
+    else:
+        with open(fname, 'w') as out:
+            write(out)
+    return fname
+
+
+def write_table(filename, data, columns=None, fmt='%r'):
+    """
+    Write a record array as a space separated table with a header line of
+    column names. Every value is written with fmt (default: the shortest
+    text that reads back exactly, nan as nan) in one write.
+    """
+    columns = columns or data.dtype.names
+    arr = np.column_stack([np.asarray(data[c], dtype=float)
+                           for c in columns])
+    line = ' '.join([fmt] * len(columns)) + '\n'
+    with open(filename, 'w') as out:
+        out.write(' '.join(columns) + '\n')
+        out.write((line * len(arr)) % tuple(arr.ravel().tolist()))
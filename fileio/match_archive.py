@@ -0,0 +1,212 @@
+"""
+Columnar archive of MATCH interpolated tracks.
+
+One archive holds every MATCH track of a prefix:
+    <base>.bin  raw little-endian float64 block (all tracks, nrows x 6)
+    <base>.json index: column names, EEP tick offsets, and per track
+                name, mass, Z, hb, row offset and number of rows.
+
+The .bin block is memory-mapped on read so a track is a view of the block
+and never a text parse.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+__all__ = ['ArchiveWriter', 'MatchArchive', 'archive_to_match',
+           'archive_name']
+
+ARCHIVE_VERSION = 1
+MATCH_COLUMNS = ['logAge', 'Mass', 'logTe', 'Mbol', 'logg', 'C/O']
+MATCH_HEADER = ' '.join(MATCH_COLUMNS)
+
+
+def archive_name(filename):
+    """strip .bin or .json from an archive filename"""
+    base, ext = os.path.splitext(filename)
+    if ext in ['.bin', '.json']:
+        return base
+    return filename
+
+
+class ArchiveWriter(object):
+    """
+    Append MATCH tracks to an archive one at a time.
+
+    The data block is streamed to <base>.bin.tmp as tracks are added. On
+    close the index is written and both files are renamed over <base>.bin
+    and <base>.json (the old index is removed first), so an archive without
+    its index is incomplete and will not be read. Until then (or after
+    abort) the previous archive is untouched.
+    """
+    def __init__(self, base, prefix=None, eep=None):
+        from ..eep.critical_point import Eep
+        self.base = archive_name(base)
+        self.prefix = prefix or os.path.split(self.base)[1]
+        self.eep = eep or Eep()
+        self.tracks = []
+        self.nrows = 0
+        self.ncols = len(MATCH_COLUMNS)
+        self._bin = open(self.base + '.bin.tmp', 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def abort(self):
+        """drop what was added, keep the previous archive (if any)"""
+        if self._bin.closed:
+            return
+        self._bin.close()
+        os.remove(self.base + '.bin.tmp')
+
+    def add(self, name, mass, Z, hb, data):
+        """add a (nticks, 6) MATCH track to the archive"""
+        data = np.ascontiguousarray(data, dtype='<f8')
+        assert data.ndim == 2 and data.shape[1] == self.ncols, \
+            'MATCH tracks must have {0:d} columns'.format(self.ncols)
+        self._bin.write(data.tobytes())
+        self.tracks.append({'name': name, 'mass': float(mass), 'Z': float(Z),
+                            'hb': bool(hb), 'offset': self.nrows,
+                            'nrows': len(data)})
+        self.nrows += len(data)
+
+    def close(self):
+        """flush the data block and write the index"""
+        if self._bin.closed:
+            return
+        self._bin.close()
+        index = {'version': ARCHIVE_VERSION,
+                 'prefix': self.prefix,
+                 'columns': MATCH_COLUMNS,
+                 'dtype': '<f8',
+                 'nrows': self.nrows,
+                 'eep_list': list(self.eep.eep_list),
+                 'nticks': [int(n) for n in self.eep.nticks],
+                 'eep_offsets': [int(o) for o in self.eep.eep_offsets],
+                 'eep_list_hb': list(self.eep.eep_list_hb),
+                 'nticks_hb': [int(n) for n in self.eep.nticks_hb],
+                 'eep_offsets_hb': [int(o) for o in self.eep.eep_offsets_hb],
+                 'tracks': self.tracks}
+        with open(self.base + '.json.tmp', 'w') as out:
+            json.dump(index, out, indent=1)
+
+        # never leave the old index with the new block
+        if os.path.isfile(self.base + '.json'):
+            os.remove(self.base + '.json')
+        os.replace(self.base + '.bin.tmp', self.base + '.bin')
+        os.replace(self.base + '.json.tmp', self.base + '.json')
+
+
+class MatchArchive(object):
+    """
+    Read-only view of a MATCH track archive.
+
+    Attributes
+    ----------
+    data : np.memmap
+        (nrows, 6) block of every track
+    names, masses, Zs, hbs, offsets, nrows : arrays, one entry per track
+    """
+    def __init__(self, filename):
+        self.base = archive_name(filename)
+        with open(self.base + '.json', 'r') as inp:
+            self.index = json.load(inp)
+
+        self.prefix = self.index['prefix']
+        self.columns = self.index['columns']
+        tracks = self.index['tracks']
+        self.names = np.array([t['name'] for t in tracks])
+        self.masses = np.array([t['mass'] for t in tracks], dtype=float)
+        self.Zs = np.array([t['Z'] for t in tracks], dtype=float)
+        self.hbs = np.array([t['hb'] for t in tracks], dtype=bool)
+        self.offsets = np.array([t['offset'] for t in tracks], dtype=int)
+        self.nrows = np.array([t['nrows'] for t in tracks], dtype=int)
+        self.eep_offsets = np.array(self.index['eep_offsets'], dtype=int)
+        self.eep_offsets_hb = np.array(self.index['eep_offsets_hb'],
+                                       dtype=int)
+
+        shape = (self.index['nrows'], len(self.columns))
+        if shape[0] > 0:
+            self.data = np.memmap(self.base + '.bin', mode='r',
+                                  dtype=self.index['dtype'], shape=shape)
+        else:
+            self.data = np.zeros(shape)
+
+    def __len__(self):
+        return len(self.names)
+
+    def track(self, i):
+        """(nrows, 6) view of the ith track"""
+        return self.data[self.offsets[i]: self.offsets[i] + self.nrows[i]]
+
+    def select(self, mass=None, hb=None, tol=1e-4):
+        """indices of tracks by mass and/or hb"""
+        sel = np.ones(len(self), dtype=bool)
+        if mass is not None:
+            sel &= np.abs(self.masses - mass) < tol
+        if hb is not None:
+            sel &= self.hbs == hb
+        return np.nonzero(sel)[0]
+
+    def column(self, col):
+        """column index by name (see MATCH_COLUMNS)"""
+        return self.columns.index(col)
+
+    def to_match(self, outdir, fmt='%.10f', intpfmt='match_{0:s}.dat'):
+        """write each track in the legacy MATCH text format"""
+        return archive_to_match(self, outdir, fmt=fmt, intpfmt=intpfmt)
+
+
+def archive_to_match(archive, outdir, fmt='%.10f',
+                     intpfmt='match_{0:s}.dat'):
+    """
+    Export an archive to one text file per track (as TracksForMatch does
+    without an archive) e.g., for MATCH's makemod.
+
+    Returns
+    -------
+    list of filenames written
+    """
+    from .fileIO import ensure_dir, savetxt
+    if isinstance(archive, str):
+        archive = MatchArchive(archive)
+    ensure_dir(outdir)
+    header = ' '.join(archive.columns)
+    outfiles = []
+    for i, name in enumerate(archive.names):
+        outfile = os.path.join(outdir, intpfmt.format(name))
+        savetxt(outfile, archive.track(i), header=header, fmt=fmt)
+        outfiles.append(outfile)
+    return outfiles
+
+
+def main(argv):
+    """Main function for match_archive: export an archive to text files"""
+    parser = argparse.ArgumentParser(
+        description="Write MATCH track files from a MATCH track archive")
+
+    parser.add_argument('archive', type=str, nargs='*',
+                        help='archive(s) (.json, .bin, or base name)')
+
+    parser.add_argument('-o', '--outdir', type=str, default=None,
+                        help='output directory (default: archive location)')
+
+    args = parser.parse_args(argv)
+
+    for archive in args.archive:
+        outdir = args.outdir or os.path.split(archive_name(archive))[0]
+        outfiles = archive_to_match(archive, outdir or os.getcwd())
+        print('wrote {0:d} files to {1:s}'.format(len(outfiles), outdir))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
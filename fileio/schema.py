@@ -0,0 +1,183 @@
+"""
+Schema of the parsec2match input file.
+
+The defaults are inputs/trackset.json updated by inputs/tracks4match.json.
+INPUT_SCHEMA gives the type of every key, so load_config converts each
+value directly (no type guessing) and checks the whole input once, before
+any track is loaded.
+
+An input file is either json or lines of
+key   value
+where lists are comma separated and lines starting with # are skipped.
+"""
+import json
+import os
+
+from .fileIO import tfm_indict, ts_indict
+
+__all__ = ['INPUT_SCHEMA', 'input_defaults', 'load_config', 'parse_value',
+           'validate_config']
+
+# key: type, [type] is a list of type. Any key may be None (null).
+INPUT_SCHEMA = {
+    # inputs/tracks4match.json
+    'do_interpolation': bool,
+    'debug': bool,
+    'prefixs': [str],
+    'plot_dir': str,
+    'outfile_dir': str,
+    'diag_plot': bool,
+    'overwrite_match': bool,
+    'prepare_makemod': bool,
+    'track_diag_plot': bool,
+    'log_dir': str,
+    'log_jsonl': bool,
+    'output_format': str,
+    'workers': int,
+    'writers': int,
+    'max_plot_points': int,
+    'profile_stages': [str],
+    'profiler': str,
+    'memory_profile': str,
+    'low_memory': bool,
+    'tracks_dir': str,
+    # inputs/trackset.json
+    'masses': [float],
+    'match': bool,
+    'agb': bool,
+    'cache': bool,
+    'cache_dir': str,
+    'trust_cache': bool,
+    'stream': bool}
+
+CHOICES = {'output_format': ['text', 'archive', 'both'],
+           'profiler': ['cprofile', 'pyinstrument'],
+           'memory_profile': [None, 'tracemalloc', 'rss']}
+
+NONE_STRINGS = ['', 'None', 'none', 'null']
+
+
+def input_defaults():
+    """default input dictionary (trackset.json updated by tracks4match.json)"""
+    indict = ts_indict()
+    indict.update(tfm_indict())
+    return indict
+
+
+def parse_value(val, kind):
+    """convert the str val of an input file line to kind (see INPUT_SCHEMA)"""
+    val = val.replace(' ', '').replace('[', '').replace(']', '')
+    val = val.replace('\'', '').replace('"', '')
+    if val in NONE_STRINGS:
+        return None
+
+    if isinstance(kind, list):
+        return [parse_value(v, kind[0]) for v in val.split(',') if len(v) > 0]
+
+    if kind is bool:
+        err = 'expected True or False, got {0:s}'.format(val)
+        assert val.lower() in ['true', 'false'], err
+        return val.lower() == 'true'
+    return kind(val)
+
+
+def _is_kind(val, kind):
+    """is val (e.g., from json) of kind"""
+    if val is None:
+        return True
+    if isinstance(kind, list):
+        return isinstance(val, list) and all(_is_kind(v, kind[0])
+                                             for v in val)
+    if kind is float:
+        return isinstance(val, (int, float)) and not isinstance(val, bool)
+    if kind is int:
+        return isinstance(val, int) and not isinstance(val, bool)
+    return isinstance(val, kind)
+
+
+def validate_config(indict):
+    """
+    Check an input dictionary, raise AssertionError on the first problem.
+
+    Also expands prefixs 'all' to every track set directory in tracks_dir.
+    """
+    unknown = [k for k in indict.keys() if k not in INPUT_SCHEMA]
+    assert len(unknown) == 0, 'unknown input key(s): {0!s}'.format(unknown)
+
+    if isinstance(indict['prefixs'], str):
+        indict['prefixs'] = [indict['prefixs']]
+
+    for key, kind in INPUT_SCHEMA.items():
+        err = '{0:s} must be {1!s}, got {2!r}'.format(key, kind, indict[key])
+        assert _is_kind(indict[key], kind), err
+
+    for key, choices in CHOICES.items():
+        err = '{0:s} must be one of {1!s}'.format(key, choices)
+        assert indict[key] in choices, err
+
+    tracks_dir = indict['tracks_dir']
+    assert tracks_dir is not None, 'tracks_dir not set'
+    assert os.path.isdir(tracks_dir), \
+        'tracks_dir not found: {0:s}'.format(tracks_dir)
+
+    prefixs = indict['prefixs']
+    assert prefixs is not None, 'prefixs (track subdirectories) not set'
+    if prefixs == ['all']:
+        # find all dirs in tracks dir skip .DS_Store and crap
+        prefixs = sorted([d for d in os.listdir(tracks_dir)
+                          if os.path.isdir(os.path.join(tracks_dir, d)) and
+                          not d.startswith('.')])
+    missing = [p for p in prefixs
+               if not os.path.isdir(os.path.join(tracks_dir, p))]
+    assert len(missing) == 0, \
+        'prefixs not found in {0:s}: {1!s}'.format(tracks_dir, missing)
+    indict['prefixs'] = prefixs
+
+    assert indict['workers'] is None or indict['workers'] >= 1, \
+        'workers must be >= 1'
+    assert indict['writers'] is None or indict['writers'] >= 0, \
+        'writers must be >= 0'
+    assert indict['max_plot_points'] is None or \
+        indict['max_plot_points'] >= 0, 'max_plot_points must be >= 0'
+    return indict
+
+
+def load_config(filename, comment_char='#', defaults=None):
+    """
+    Read and check a parsec2match input file.
+
+    Parameters
+    ----------
+    filename : str
+        json file or key value lines
+    comment_char : str
+        skip lines that start with comment_char
+    defaults : dict
+        default values (default input_defaults())
+
+    Returns
+    -------
+    indict : dict
+        defaults updated by filename
+    """
+    indict = input_defaults() if defaults is None else dict(defaults)
+
+    if filename.endswith('.json'):
+        with open(filename, 'r') as inp:
+            indict.update(json.load(inp))
+        return validate_config(indict)
+
+    with open(filename, 'r') as inp:
+        for line in inp:
+            line = line.strip()
+            if len(line) == 0 or line.startswith(comment_char):
+                continue
+            key, _, val = line.partition(' ')
+            assert key in INPUT_SCHEMA, \
+                '{0:s}: unknown input key {1:s}'.format(filename, key)
+            try:
+                indict[key] = parse_value(val, INPUT_SCHEMA[key])
+            except (AssertionError, ValueError) as err:
+                raise ValueError('{0:s}: {1:s} {2!s}'.format(filename, key,
+                                                            err))
+    return validate_config(indict)
@@ -0,0 +1,168 @@
+"""
+Atomic and background writing of output files.
+
+Every file is written to a hidden temporary file in its destination
+directory and renamed over the destination when complete (os.replace), so
+a crash leaves either the old file or the new one, never half of one
+(only stray .<name>.*.tmp files).
+
+AsyncWriter does those writes in a pool of threads so the interpolation
+continues while output is flushed. At most max_pending writes are queued,
+submitting more blocks until one is done (back-pressure).
+
+    with AsyncWriter(workers=2) as writer:
+        writer.savetxt(outfile, data, header=header, fmt='%.10f')
+        writer.write_text(logfile, text)
+        writer.savefig(fig, figname)
+"""
+import concurrent.futures
+import io
+import os
+import tempfile
+import threading
+
+from .fileIO import savetxt
+
+__all__ = ['AsyncWriter', 'atomic_savefig', 'atomic_write']
+
+# mkstemp files are 0600, outputs get the usual permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(filename, data, mode='w', fsync=False):
+    """
+    Write data to filename through a temporary file and a rename.
+
+    Parameters
+    ----------
+    filename : str
+        destination
+    data : str, bytes, or function
+        what to write, or a function that writes to the open file
+    mode : str
+        'w' (text) or 'wb' (bytes)
+    fsync : bool
+        also flush the file to disk before the rename (survives power
+        loss, not only a crash of the process, but is slower)
+    """
+    dirname, base = os.path.split(os.path.abspath(filename))
+    fdesc, tmp = tempfile.mkstemp(prefix='.{0:s}.'.format(base),
+                                  suffix='.tmp', dir=dirname)
+    try:
+        with os.fdopen(fdesc, mode) as out:
+            if callable(data):
+                data(out)
+            else:
+                out.write(data)
+            if fsync:
+                out.flush()
+                os.fsync(out.fileno())
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        raise
+    return filename
+
+
+def _render_figure(fig, filename, **kwargs):
+    """the bytes of fig saved as filename would be"""
+    kwargs.setdefault('format', os.path.splitext(filename)[1][1:] or None)
+    buf = io.BytesIO()
+    fig.savefig(buf, **kwargs)
+    return buf.getvalue()
+
+
+def atomic_savefig(fig, filename, **kwargs):
+    """fig.savefig(filename, **kwargs) through atomic_write"""
+    return atomic_write(filename, _render_figure(fig, filename, **kwargs),
+                        mode='wb')
+
+
+class AsyncWriter(object):
+    """
+    Write files atomically in background threads.
+
+    Parameters
+    ----------
+    workers : int
+        writer threads, 0 writes (atomically) in the calling thread
+    max_pending : int
+        most writes queued or in progress before submitting blocks
+    fsync : bool
+        see atomic_write
+
+    A failed write is raised by the next submit or by close.
+    """
+    def __init__(self, workers=1, max_pending=16, fsync=False):
+        self.workers = workers
+        self.fsync = fsync
+        self.errors = []
+        self._pool = None
+        if workers > 0:
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='AsyncWriter')
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+
+    def _raise(self):
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def _done(self, future):
+        self._slots.release()
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+
+    def submit(self, filename, data, mode='w'):
+        """atomic_write(filename, data, mode) in the background"""
+        self._raise()
+        if self._pool is None:
+            return atomic_write(filename, data, mode=mode, fsync=self.fsync)
+        # back-pressure: wait for a slot
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(atomic_write, filename, data,
+                                       mode=mode, fsync=self.fsync)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return filename
+
+    def savetxt(self, filename, data, **kwargs):
+        """fileio.savetxt(filename, data, **kwargs), data must not change"""
+        return self.submit(filename,
+                           lambda out: savetxt(out, data, **kwargs))
+
+    def write_text(self, filename, text):
+        """write the str text to filename"""
+        return self.submit(filename, text)
+
+    def savefig(self, fig, filename, **kwargs):
+        """
+        fig.savefig(filename, **kwargs): the figure is drawn now (matplotlib
+        is not thread safe), only the file is written in the background.
+        """
+        return self.submit(filename, _render_figure(fig, filename, **kwargs),
+                           mode='wb')
+
+    def close(self):
+        """wait for every write, raise the first failure"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None and self._pool is not None:
+            # already failing, finish the writes but keep that error
+            self._pool.shutdown(wait=True)
+            self._pool = None
+            return False
+        self.close()
+        return False
@@ -0,0 +1,207 @@
+"""
+Diagnostic plots of the MATCH interpolation, apart from the interpolation.
+
+TracksForMatch.match_interpolation saves what the figures need of each
+track and its MATCH interpolation (save_diag_data, one .npz per track in
+<plot_dir>/data) and then calls render_diag_plots, which draws every
+figure from those files in a pool of processes with the Agg backend.
+
+To redraw without interpolating again:
+    python -m padova_tracks.graphics.diag_plots <plot_dir> -n 4
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from ..config import logL, logT, age
+from ..fileio import ensure_dir, get_files
+from ..utils import parallel_map
+from .utils import agg_worker
+
+__all__ = ['DiagTrack', 'save_diag_data', 'load_diag_data',
+           'render_diag_plots']
+
+DIAG_COLUMNS = [logT, logL, age]
+DATA_DIR = 'data'
+XCOLS = [logT, age]
+
+
+class DiagTrack(object):
+    """The attributes of a Track that match_parsec and plot_tracks use"""
+    def __init__(self, data, iptcri, name='', prefix='', mass=np.nan,
+                 Z=np.nan, Y=np.nan, hb=False, match=False):
+        self.data = data
+        self.iptcri = iptcri
+        self.name = name
+        self.base = prefix
+        self.mass = mass
+        self.Z = Z
+        self.Y = Y
+        self.hb = hb
+        self.match = match
+        self.flag = None
+
+
+def save_diag_data(track, match_track, data_dir, prefix=''):
+    """save the columns of track and match_track the plots need"""
+    def columns(t):
+        return np.column_stack([t.data[c] for c in DIAG_COLUMNS])
+
+    ensure_dir(data_dir)
+    outfile = os.path.join(data_dir, track.name + '.npz')
+    np.savez(outfile, parsec=columns(track), iptcri=track.iptcri,
+             match=columns(match_track), match_iptcri=match_track.iptcri,
+             props=np.array([track.mass, track.Z, track.Y, track.hb]),
+             name=track.name, prefix=prefix)
+    return outfile
+
+
+def load_diag_data(filename):
+    """(track, match_track) DiagTracks from a save_diag_data file"""
+    with np.load(filename) as npz:
+        mass_, Z, Y, hb = npz['props']
+        kw = {'name': str(npz['name']), 'prefix': str(npz['prefix']),
+              'mass': mass_, 'Z': Z, 'Y': Y, 'hb': bool(hb)}
+        tracks = []
+        for key, match in [('parsec', False), ('match', True)]:
+            data = np.rec.fromarrays(npz[key].T, names=DIAG_COLUMNS)
+            iptcri = npz['match_iptcri' if match else 'iptcri']
+            tracks.append(DiagTrack(data, iptcri, match=match, **kw))
+    return tracks
+
+
+def _render(job):
+    """draw one figure (in a worker), return its name and time"""
+    from .graphics import match_parsec, plot_track_group
+
+    t0 = time.time()
+    kind, filenames, xcol, plot_dir, figname, max_points = job
+    tracks = [load_diag_data(f) for f in filenames]
+    if kind == 'track':
+        (track, match_track), = tracks
+        ensure_dir(plot_dir)
+        match_parsec(track, plot_dir=plot_dir, xcol=xcol,
+                     match_track=match_track, save=True, title=True,
+                     max_points=max_points)
+    else:
+        plot_track_group([t[0] for t in tracks], [t[1] for t in tracks],
+                         xcol, figname, tracks[0][0].base,
+                         max_points=max_points)
+    return figname, time.time() - t0
+
+
+def diag_plot_jobs(plot_dir, data_dir=None, track_plots=True,
+                   set_plots=True, max_points=None, filenames=None):
+    """list the figures of saved data filenames (default: all in data_dir)"""
+    from .graphics import mass_groups
+    if filenames is None:
+        data_dir = data_dir or os.path.join(plot_dir, DATA_DIR)
+        filenames = get_files(data_dir, '*.npz')
+    filenames = sorted(filenames)
+    jobs = []
+    if track_plots:
+        # (as TracksForMatch did inline)
+        for filename in filenames:
+            for xcol in XCOLS:
+                # match_parsec names the figure, this is a label
+                figname = '{0:s} {1:s}'.format(os.path.split(filename)[1],
+                                               xcol)
+                jobs.append(('track', [filename], xcol,
+                             os.path.join(plot_dir, xcol.lower()), figname,
+                             max_points))
+
+    if set_plots:
+        # (as plot_tracks)
+        props = [load_diag_data(f)[0] for f in filenames]
+        for hb in [False, True]:
+            inds = [i for i, t in enumerate(props) if t.hb == hb]
+            if len(inds) == 0:
+                continue
+            isort = np.array(inds)[np.argsort([props[i].mass for i in inds])]
+            extra = 'hb_' if hb else ''
+            prefix = props[isort[0]].base
+            for mextra, its in mass_groups([props[i].mass for i in isort],
+                                           hb=hb):
+                group = [filenames[i] for i in isort[its]]
+                for xcol in XCOLS:
+                    figname = os.path.join(plot_dir, '{0:s}{1:s}{2:s}_{3:s}'
+                                           '.png'.format(extra, xcol, mextra,
+                                                         prefix))
+                    jobs.append(('set', group, xcol, plot_dir, figname,
+                                 max_points))
+    return jobs
+
+
+def render_diag_plots(plot_dir, data_dir=None, workers=1, track_plots=True,
+                      set_plots=True, max_points=None, filenames=None):
+    """
+    Draw the diagnostic figures from the saved data.
+
+    Parameters
+    ----------
+    plot_dir : str
+        TracksForMatch.plot_dir
+    data_dir : str
+        location of save_diag_data files (default plot_dir/data)
+    filenames : list
+        the save_diag_data files to draw (default every file in data_dir,
+        which may hold files of earlier runs)
+    workers : int
+        number of processes
+    track_plots, set_plots : bool
+        draw the per-track (track_diag_plot) and/or the mass binned
+        (diag_plot) figures
+    max_points : int
+        point budget of each figure (default config.max_plot_points, 0 to
+        draw every point)
+
+    Returns
+    -------
+    list of (figure, seconds)
+    """
+    jobs = diag_plot_jobs(plot_dir, data_dir=data_dir,
+                          track_plots=track_plots, set_plots=set_plots,
+                          max_points=max_points, filenames=filenames)
+    return parallel_map(_render, jobs, workers=workers,
+                        initializer=agg_worker)
+
+
+def main(argv):
+    """Main function for diag_plots"""
+    parser = argparse.ArgumentParser(
+        description="Draw MATCH interpolation diagnostic plots")
+
+    parser.add_argument('plot_dir', type=str,
+                        help='TracksForMatch plot_dir')
+
+    parser.add_argument('-d', '--data_dir', type=str, default=None,
+                        help='saved data location (default plot_dir/data)')
+
+    parser.add_argument('-n', '--workers', type=int, default=1,
+                        help='number of processes')
+
+    parser.add_argument('-p', '--max_points', type=int, default=None,
+                        help='point budget of each figure (0 for all)')
+
+    parser.add_argument('--no_track_plots', action='store_true',
+                        help='skip the figure of each track')
+
+    parser.add_argument('--no_set_plots', action='store_true',
+                        help='skip the mass binned figures')
+
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    figs = render_diag_plots(args.plot_dir, data_dir=args.data_dir,
+                             workers=args.workers,
+                             track_plots=not args.no_track_plots,
+                             set_plots=not args.no_set_plots,
+                             max_points=args.max_points)
+    print('{0:d} figures in {1:.1f}s'.format(len(figs), time.time() - t0))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
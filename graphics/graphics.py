@@ -3,10 +3,11 @@ import seaborn
 import matplotlib.pyplot as plt
 import numpy as np
 
-from .utils import discrete_colors
+from .utils import discrete_colors, decimate, tp_boundaries
 
-from ..config import logL, logT, mass, age
+from ..config import logL, logT, mass, age, max_plot_points
 from ..eep.critical_point import Eep
+from ..fileio import atomic_savefig
 from ..utils import column_to_data
 
 seaborn.set()
@@ -113,23 +114,40 @@ def vw93_plot(agbtrack, agescale=1e5, outfile=None, xlim=None, ylims=None,
     return fig, axs
 
 
-def hrd(track, ax=None, inds=None, reverse=None, plt_kw=None):
+def hrd(track, ax=None, inds=None, reverse=None, plt_kw=None,
+        max_points=None):
     '''
     make an hrd.
     written for interactive use (usually in pdb)
+    max_points: decimate the track to about max_points
+        (default config.max_plot_points, 0 for all points), the eeps, inds
+        and the thermal pulse boundaries are kept.
     '''
     plt_kw = plt_kw or {}
     reverse = reverse or ''
+    if max_points is None:
+        max_points = max_plot_points
     if ax is None:
         _, ax = plt.subplots()
 
-    l, = ax.plot(track.data[logT], track.data[logL], **plt_kw)
+    keep = tp_boundaries(track.data)
+    if hasattr(track, 'iptcri'):
+        keep = np.concatenate([keep, track.iptcri[track.iptcri > 0]])
+    if inds is not None and len(inds) < 30:
+        keep = np.concatenate([keep, inds])
+    dinds = decimate(track.data[logT], track.data[logL], max_points,
+                     keep=keep)
+    l, = ax.plot(track.data[logT][dinds], track.data[logL][dinds], **plt_kw)
 
     if inds is not None:
         if len(inds) < 30:
             ax.plot(track.data[logT][inds], track.data[logL][inds], 'o',
                     color=l.get_color(), alpha=0.4)
         else:
+            inds = np.asarray(inds)
+            inds = inds[decimate(track.data[logT][inds],
+                                 track.data[logL][inds], max_points,
+                                 keep=np.nonzero(np.isin(inds, keep))[0])]
             ax.plot(track.data[logT][inds], track.data[logL][inds],
                     alpha=0.4, lw=3)
 
@@ -144,8 +162,47 @@ def hrd(track, ax=None, inds=None, reverse=None, plt_kw=None):
     return ax
 
 
+def mass_groups(masses, hb=False):
+    """
+    Split masses into the plot_tracks mass bins.
+
+    Returns
+    -------
+    list of (filename extra, indices of masses) of the non-empty bins
+    """
+    mass_split = [0, 1, 1.4, 3, 12, 50, 1000]
+    if hb:
+        mass_split = [0, 0.7, 0.9, 1.4, 2, 6, 1000]
+    mextras = ['_lowest', '_vlow', '_low', '_inte', '_high', '_vhigh']
+    binds = np.digitize(masses, bins=mass_split)
+    return [(mextras[b - 1], np.nonzero(binds == b)[0])
+            for b in np.unique(binds)]
+
+
+def plot_track_group(tracks, match_tracks, xcol, figname, prefix,
+                     max_points=None):
+    """
+    one plot_tracks figure: tracks (and MATCH tracks) in xcol vs logL
+    max_points (default config.max_plot_points) is shared by the tracks.
+    """
+    if max_points is None:
+        max_points = max_plot_points
+    if max_points:
+        max_points = max(max_points // len(tracks), 100)
+    fig, ax = plt.subplots(figsize=(12, 8))
+    for track, match_track in zip(tracks, match_tracks):
+        ax = match_parsec(track, match_track=match_track, ax=ax, xcol=xcol,
+                          max_points=max_points)
+
+    ax.set_title(r'$%s$' % prefix.replace('_', r'\ '))
+    ax.invert_xaxis()
+    atomic_savefig(fig, figname)
+    plt.close(fig)
+    return figname
+
+
 def plot_tracks(tracks, xcols=[logT, age], extra=None, hb=False, mextras=None,
-                split=True, plot_dir=None, match_tracks=None):
+                split=True, plot_dir=None, match_tracks=None, max_points=None):
     '''
     pat_kw go to plot all tracks default:
         'eep_list': Eep.eep_list,
@@ -155,14 +212,20 @@ def plot_tracks(tracks, xcols=[logT, age], extra=None, hb=False, mextras=None,
     mass_split is a list to split masses length == 3 (I'm lazy)
     extras is the filename extra associated with each mass split
        length == mass_split + 1
+    max_points is the point budget of each figure (see plot_track_group)
+    (see graphics.diag_plots to render these in parallel)
     '''
     extra = extra or ''
-    line_pltkw, mline_pltkw, point_pltkw, mpoint_pltkw = plot_kws()
-    tracks = np.array([t for t in tracks if t.flag is None])
+    tracks = [t for t in tracks if t.flag is None and t.hb == hb]
 
-    if match_tracks is not None:
-        match_tracks = np.asarray(match_tracks)
-        assert len(tracks) == len(match_tracks)
+    if match_tracks is None:
+        match_tracks = [None] * len(tracks)
+    else:
+        match_tracks = [m for m in match_tracks if m is not None and
+                        m.hb == hb]
+    assert len(tracks) == len(match_tracks)
+    if len(tracks) == 0:
+        return
 
     if hasattr(tracks, 'prefix'):
         prefix = tracks.prefix
@@ -173,34 +236,20 @@ def plot_tracks(tracks, xcols=[logT, age], extra=None, hb=False, mextras=None,
         extra = extra + '_'
 
     if split:
-        mass_split = [0, 1, 1.4, 3, 12, 50, 1000]
         if hb:
             extra += 'hb_'
-            mass_split = [0, 0.7, 0.9, 1.4, 2, 6, 1000]
-
-        mextras = ['_lowest', '_vlow', '_low', '_inte', '_high', '_vhigh']
-        masses = [t.mass for t in tracks]
-        binds = np.digitize(masses, bins=mass_split)
-        _, udx = np.unique(binds, return_index=True)
-        tracks_pplot = np.array([np.arange(udx[i], udx[i+1])
-                                 for i in range(len(udx)-1)])
+        groups = mass_groups([t.mass for t in tracks], hb=hb)
     else:
-        tracks_pplot = np.array([tracks])
-
-    for i, its in enumerate(tracks_pplot):
-        for j, _ in enumerate(xcols):
-            fig, ax = plt.subplots(figsize=(12, 8))
-            for k in its:
-                ax = match_parsec(tracks[k], match_track=match_tracks[k],
-                                  ax=ax, xcol=xcols[j])
-
-            ax.set_title(r'$%s$' % prefix.replace('_', r'\ '))
-            ax.invert_xaxis()
-            figname = '%s%s%s_%s.png' % (extra, xcols[j], mextras[i], prefix)
+        groups = [('', np.arange(len(tracks)))]
+
+    for mextra, its in groups:
+        for xcol in xcols:
+            figname = '%s%s%s_%s.png' % (extra, xcol, mextra, prefix)
             if plot_dir is not None:
                 figname = os.path.join(plot_dir, figname)
-            plt.savefig(figname)
-            plt.close('all')
+            plot_track_group([tracks[k] for k in its],
+                             [match_tracks[k] for k in its], xcol, figname,
+                             prefix, max_points=max_points)
     return
 
 
@@ -214,8 +263,11 @@ def plot_kws():
 
 
 def match_parsec(track, plot_dir=None, xcol=logT, ycol=logL, match_track=None,
-                 ax=None, title=False, save=False):
-    '''plot the track, the interpolation, with eeps'''
+                 ax=None, title=False, save=False, max_points=None):
+    '''
+    plot the track, the interpolation, with eeps
+    max_points is the point budget of each line (see plot_track)
+    '''
     if track.flag is not None:
         return
 
@@ -225,12 +277,13 @@ def match_parsec(track, plot_dir=None, xcol=logT, ycol=logL, match_track=None,
         fig, ax = plt.subplots(figsize=(12, 8))
     # parsec track
     ax = plot_track(track, xcol, ycol, ax=ax, plt_kw=line_pltkw,
-                    plt_point_kw=point_pltkw)
+                    plt_point_kw=point_pltkw, max_points=max_points)
 
     if match_track is not None:
         # overplot the match interpolation
-        ax = plot_track(track, xcol, ycol, ax=ax, plt_kw=mline_pltkw,
-                        plt_point_kw=mpoint_pltkw)
+        ax = plot_track(match_track, xcol, ycol, ax=ax, plt_kw=mline_pltkw,
+                        plt_point_kw=mpoint_pltkw, add_mass=False,
+                        max_points=max_points)
 
     xlab = '${}$'.format(xcol.replace('_', r'\ '))
     ylab = '${}$'.format(ycol.replace('_', r'\ '))
@@ -240,7 +293,7 @@ def match_parsec(track, plot_dir=None, xcol=logT, ycol=logL, match_track=None,
     if title:
         title = 'M = {0:.3f} Z = {1:.4f} Y = {2:.4f}'.format(track.mass,
                                                              track.Z, track.Y)
-        fig.suptitle(title)
+        ax.get_figure().suptitle(title)
     if save:
         extra = ''
         ax.invert_xaxis()
@@ -253,14 +306,15 @@ def match_parsec(track, plot_dir=None, xcol=logT, ycol=logL, match_track=None,
         if plot_dir is not None:
             figname = os.path.join(plot_dir, figname)
 
-        plt.savefig(figname)
+        atomic_savefig(plt.gcf(), figname)
         plt.close()
     return ax
 
 
 def plot_track(track, xcol, ycol, reverse=None, ax=None, inds=None,
                plt_kw=None, clean=False, yscale='linear',
-               xscale='linear', add_mass=True, plt_point_kw=None):
+               xscale='linear', add_mass=True, plt_point_kw=None,
+               max_points=None):
     '''
     ainds is passed to annotate plot, and is to only plot a subset of crit
     points.
@@ -268,10 +322,15 @@ def plot_track(track, xcol, ycol, reverse=None, ax=None, inds=None,
     plot helpers:
     reverse 'xy', 'x', or 'y' will flip that axis
 
+    max_points: decimate the line to about max_points
+        (default config.max_plot_points, 0 for all points), the eeps and
+        thermal pulse boundaries are kept (see graphics.utils.decimate).
     '''
     plt_kw = plt_kw or {}
     plt_point_kw = plt_point_kw or {}
     reverse = reverse or ''
+    if max_points is None:
+        max_points = max_plot_points
 
     if isinstance(track, str):
         from ..tracks.track import Track
@@ -283,35 +342,44 @@ def plot_track(track, xcol, ycol, reverse=None, ax=None, inds=None,
 
     xdata = track.data[xcol]
     ydata = track.data[ycol]
+    if track.match and xcol == age:
+        # match tracks have log age
+        xdata = 10 ** xdata
 
     if ax is None:
         fig, ax = plt.subplots()
 
+    pinds = np.array([], dtype=int)
+    if hasattr(track, 'iptcri'):
+        pinds = track.iptcri[track.iptcri > 0]
+    elif track.match:
+        eep = Eep()
+        nticks = eep.nticks
+        if track.hb:
+            nticks = eep.nticks_hb
+        pinds = np.insert(np.cumsum(nticks), 0, 1) - 1
+    keep = np.concatenate([tp_boundaries(track.data), pinds])
+
     if inds is not None:
+        # keep is in track rows, decimate works in positions of inds
+        inds = np.asarray(inds)
+        inds = inds[decimate(xdata[inds], ydata[inds], max_points,
+                             keep=np.nonzero(np.isin(inds, keep))[0])]
         ax.plot(xdata[inds], ydata[inds], **plt_kw)
     else:
-        ax.plot(xdata, ydata, **plt_kw)
+        dinds = decimate(xdata, ydata, max_points, keep=keep)
+        ax.plot(xdata[dinds], ydata[dinds], **plt_kw)
 
-        if hasattr(track, 'iptcri'):
-            pinds = track.iptcri[track.iptcri > 0]
+        if len(pinds) > 0:
             ax.plot(xdata[pinds], ydata[pinds], **plt_point_kw)
 
-            if add_mass:
-                try:
-                    ind = pinds[3]
-                except:
-                    ind = pinds[1]
-                ax.annotate(r'${0:g}$'.format(track.mass),
-                            (xdata[ind], ydata[ind]), fontsize=10)
-        elif track.match:
-            if xcol == age:
-                xdata = 10 ** t.data[xcol]
-            eep = Eep()
-            nticks = eep.nticks
-            if track.hb:
-                nticks = eep.nticks_hb
-            minds = np.insert(np.cumsum(nticks), 0, 1) - 1
-            ax.plot(xdata[minds], ydata[minds], **plt_point_kw)
+        if hasattr(track, 'iptcri') and add_mass:
+            try:
+                ind = pinds[3]
+            except:
+                ind = pinds[1]
+            ax.annotate(r'${0:g}$'.format(track.mass),
+                        (xdata[ind], ydata[ind]), fontsize=10)
 
     if 'x' in reverse:
         ax.invert_xaxis()
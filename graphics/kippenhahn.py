@@ -1,27 +1,81 @@
+"""
+Kippenhahn diagrams of PARSEC tracks.
+
+kippenhahn draws one track, kippenhahn_set draws every track of a set in a
+pool of processes:
+    python -m padova_tracks.graphics.kippenhahn <tracks_dir> -p <prefix> -n 4
+"""
+import argparse
+import os
+import sys
+import time
+
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import numpy as np
+from matplotlib.ticker import MaxNLocator, NullFormatter
 
 from .graphics import annotate_plot
+from .utils import agg_worker
 
-from ..config import logT, ycen, xc_cen, xo_cen, age
+from ..config import logT, ycen, xc_cen, xo_cen, age, EXT
 from ..eep.critical_point import Eep
-from ..utils import add_ptcris
+from ..fileio import ensure_dir, get_files
+from ..utils import add_ptcris, parallel_map
 
 
-def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
-               four_tops=False, xscale='linear', between_ptcris=[0, -2],
-               khd_dict=None, ax=None, norm=None, annotate=False,
-               legend=False, fusion=True, convection=True):
-    pinds = add_ptcris(track, between_ptcris)
-    norm = norm or ''
+def khd_data(track, heb_only=True, between_ptcris=[0, -2]):
+    """
+    The rows and masks of a Kippenhahn diagram, computed once per track.
+
+    Returns
+    -------
+    dict of
+    inds : the rows of track.data to plot (core HeB if heb_only, otherwise
+        between the between_ptcris EEPs)
+    p1, p2 : (index of inds) the drop and rise of the inner convective zone
+    conv1_beg, conv1_end : where to fill the inner convective zone before p1
+        and after p2
+    hburn, heburn : where the H and He burning regions have width
+    muc : central mean molecular weight
+    """
+    data = track.data
     if heb_only:
         # Core HeB:
-        inds, = np.nonzero((track.data['LY'] > 0) & (track.data.QHE1 == 0))
+        inds, = np.nonzero((data['LY'] > 0) & (data['QHE1'] == 0))
     else:
+        pinds = add_ptcris(track, between_ptcris)
         inds = np.arange(pinds[pinds > 0][0], pinds[pinds > 0][-1])
 
-    pinds = add_ptcris(track, between_ptcris)
+    cf1 = data['CF1'][inds]
+    p1, p2 = 0, 0
+    if len(cf1) > 1:
+        dcf1 = np.diff(cf1)
+        p1 = np.argmin(dcf1)
+        p2 = np.argmax(dcf1)
+    return {'inds': inds, 'p1': p1, 'p2': p2,
+            'conv1_beg': cf1[:p1] > 0.2,
+            'conv1_end': cf1[p2:] < 0.2,
+            'hburn': data['QH2'][inds] > data['QH1'][inds],
+            'heburn': data['QHE2'][inds] > data['QHE1'][inds],
+            'muc': track.calc_core_mu()[inds]}
+
+
+def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
+               four_tops=False, xscale='linear', between_ptcris=[0, -2],
+               khd_dict=None, ax=None, norm=None, annotate=False,
+               legend=False, fusion=True, convection=True, kdata=None):
+    """
+    Kippenhahn diagram of track.
+    kdata is khd_data(track, heb_only, between_ptcris), computed if None.
+    """
+    norm = norm or ''
+    if kdata is None:
+        kdata = khd_data(track, heb_only=heb_only,
+                         between_ptcris=between_ptcris)
+    inds = kdata['inds']
+    p1 = kdata['p1']
+    p2 = kdata['p2']
     xdata = track.data[age][inds]
 
     if xscale == 'linear':
@@ -35,21 +89,18 @@ def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
         xlab = r'$\log \rm{Age (yr)}$'
 
     if four_tops:
-        track.calc_core_mu()
-        fig, (ax1, ax2, ax3) = plt.subplots(nrows=3, sharex=True,
-                                            figsize=(8, 8))
+        fig = plt.figure(figsize=(8, 8))
         gs = gridspec.GridSpec(8, 2)
-        sm_axs = [plt.subplot(gs[i, 0:]) for i in range(4)]
-        ax = plt.subplot(gs[4:, 0:])
+        sm_axs = [fig.add_subplot(gs[i, 0:]) for i in range(4)]
+        ax = fig.add_subplot(gs[4:, 0:])
         ycols = [logT, '', 'LOG_RHc', 'LOG_Pc']
-        ycolls = ['$\log T_{eff}$', '$\mu_c$', '$\\rho_c$', '$\log P_c$']
+        ycolls = [r'\log T_{eff}', r'\mu_c', r'\rho_c', r'\log P_c']
 
         for smax, ycol, ycoll in zip(sm_axs, ycols, ycolls):
             if len(ycol) == 0:
-                ydata = track.muc[inds]
+                ydata = kdata['muc']
             else:
                 ydata = track.data[ycol][inds]
-                smax.plot(xdata, ydata, lw=3, color='black', label=ycoll)
 
             smax.plot(xdata, ydata, lw=3, color='black', label=ycoll)
             smax.set_ylabel('$%s$' % ycoll)
@@ -63,9 +114,6 @@ def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
         axs = [ax]
 
     ax.set_xscale(xscale)
-    # discontinuities in conv...
-    p1 = np.argmin((np.diff(track.data.CF1[inds])))
-    p2 = np.argmax(np.diff(track.data.CF1[inds]))
     # convections
     fbkw = {'edgecolor': 'none', 'alpha': 0.4, 'zorder': 1}
     conv_kw = fbkw.copy()
@@ -74,12 +122,12 @@ def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
         ax.fill_between(xdata[:p1],
                         track.data.CI1[inds[:p1]],
                         track.data.CF1[inds[:p1]],
-                        where=track.data.CF1[inds[:p1]] > 0.2,
+                        where=kdata['conv1_beg'],
                         **conv_kw)
         ax.fill_between(xdata[p2:],
                         track.data.CI1[inds[p2:]],
                         track.data.CF1[inds[p2:]],
-                        where=track.data.CF1[inds[p2:]] < 0.2,
+                        where=kdata['conv1_end'],
                         **conv_kw)
         ax.fill_between(xdata,
                         track.data.CI2[inds],
@@ -88,11 +136,11 @@ def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
     if fusion:
         ax.fill_between(xdata,
                         track.data.QH1[inds],
-                        track.data.QH2[inds],
+                        track.data.QH2[inds], where=kdata['hburn'],
                         color='navy', label=r'$H$', **fbkw)
         ax.fill_between(xdata,
                         track.data.QHE1[inds],
-                        track.data.QHE2[inds],
+                        track.data.QHE2[inds], where=kdata['heburn'],
                         color='darkred', label=r'$^4He$', **fbkw)
 
     zorder = 100
@@ -125,9 +173,8 @@ def kippenhahn(track, col_keys=None, heb_only=True, ptcri=None,
     if annotate:
         ptcri_names = \
             Eep().eep_list[between_ptcris[0]: between_ptcris[1] + 1]
-        self.annotate_plot(track, ax, '', '', xdata=xdata, ydata=xdata,
-                           ptcri_names=ptcri_names, khd=True, inds=inds,
-                           lw=2)
+        annotate_plot(track, ax, '', '', xdata=xdata, ydata=xdata,
+                      ptcri_names=ptcri_names, khd=True, inds=inds, lw=2)
     # [a.set_xlim(xdata[pinds[0]], xdata[pinds[-1]]) for a in axs]
 
     # for a in axs:
@@ -172,3 +219,117 @@ def plot_linestyles(column):
         print(('%s line_style format not supported' % column))
         ls = '-'
     return ls
+
+
+def _khd_figure(job):
+    """draw one kippenhahn_set figure (in a worker), return its name and time"""
+    from ..tracks.track import Track
+
+    t0 = time.time()
+    filename, figname, ptcri_file, cache, kwargs = job
+    track = Track(filename, ptcri_file=ptcri_file, cache=cache)
+    if track.flag is not None:
+        print('skipping {0:s}: {1:s}'.format(track.name, track.flag))
+        return None, time.time() - t0
+
+    kdata = khd_data(track, heb_only=kwargs.get('heb_only', True),
+                     between_ptcris=kwargs.get('between_ptcris', [0, -2]))
+    if len(kdata['inds']) < 3:
+        print('skipping {0:s}: nothing to plot'.format(track.name))
+        return None, time.time() - t0
+
+    axs = kippenhahn(track, kdata=kdata, **kwargs)
+    fig = axs[0].get_figure()
+    fig.suptitle('M = {0:.3f} Z = {1:.4f}'.format(track.mass, track.Z))
+    fig.savefig(figname)
+    plt.close(fig)
+    return figname, time.time() - t0
+
+
+def kippenhahn_set(tracks_dir, prefix=None, outdir=None, workers=1,
+                   ptcri_file=None, cache=False, search='*.*', **kwargs):
+    """
+    Kippenhahn diagrams of every track of a set, in parallel.
+
+    Parameters
+    ----------
+    tracks_dir : str
+        location of the track set directories (or the set if prefix is None)
+    prefix : str
+        track set directory name
+    outdir : str
+        where to write the figures (default tracks_dir/kippenhahn/prefix)
+    workers : int
+        number of processes
+    ptcri_file : str
+        EEP file (needed if heb_only=False)
+    cache : bool or str
+        passed to Track
+    search : str
+        track file search string
+    kwargs : passed to kippenhahn
+
+    Returns
+    -------
+    list of (figure, seconds), figure is None if the track was skipped
+    """
+    tracks_base = tracks_dir
+    if prefix is not None:
+        tracks_base = os.path.join(tracks_dir, prefix)
+    outdir = outdir or os.path.join(tracks_dir, 'kippenhahn', prefix or '')
+    ensure_dir(outdir)
+
+    jobs = []
+    for filename in sorted(get_files(tracks_base, search)):
+        figname = os.path.join(outdir, 'khd_{0:s}{1:s}'.format(
+            os.path.split(filename)[1], EXT))
+        jobs.append((filename, figname, ptcri_file, cache, kwargs))
+    return parallel_map(_khd_figure, jobs, workers=workers,
+                        initializer=agg_worker)
+
+
+def main(argv):
+    """Main function for kippenhahn"""
+    parser = argparse.ArgumentParser(
+        description="Kippenhahn diagrams of a track set")
+
+    parser.add_argument('tracks_dir', type=str,
+                        help='location of the track set(s)')
+
+    parser.add_argument('-p', '--prefix', type=str, default=None,
+                        help='track set directory in tracks_dir')
+
+    parser.add_argument('-o', '--outdir', type=str, default=None,
+                        help='output directory')
+
+    parser.add_argument('-n', '--workers', type=int, default=1,
+                        help='number of processes')
+
+    parser.add_argument('-f', '--ptcri_file', type=str, default=None,
+                        help='EEP file (needed with --full)')
+
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help='use the track cache')
+
+    parser.add_argument('--full', action='store_true',
+                        help='plot between the EEPs, not only core HeB')
+
+    parser.add_argument('--four_tops', action='store_true',
+                        help='add logTe, mu_c, rho_c, and P_c panels')
+
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    figs = kippenhahn_set(args.tracks_dir, prefix=args.prefix,
+                          outdir=args.outdir, workers=args.workers,
+                          ptcri_file=args.ptcri_file, cache=args.cache,
+                          heb_only=not args.full, four_tops=args.four_tops)
+    for figname, sec in figs:
+        if figname is not None:
+            print('{0:.2f}s {1:s}'.format(sec, figname))
+    nfigs = len([f for f, _ in figs if f is not None])
+    print('{0:d} figures in {1:.1f}s'.format(nfigs, time.time() - t0))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,6 +3,14 @@ import matplotlib.pyplot as plt
 from ..utils import maxmin
 
 
+def agg_worker():
+    """
+    parallel_map initializer of plotting workers: draw without a display.
+    (Run serially the caller's backend is kept.)
+    """
+    plt.switch_backend('Agg')
+
+
 def points_inside_poly(points, all_verts):
     """nxutils depreciated call modified to the approved call in mpl"""
     from matplotlib.path import Path
@@ -49,6 +57,64 @@ def stitch_cmap(cmap1, cmap2, stitch_frac=0.5, dfrac=0.001):
     return new_cmap
 
 
+def tp_boundaries(data):
+    """indices of data where the thermal pulse number (NTP) changes"""
+    if data.dtype.names is None or 'NTP' not in data.dtype.names:
+        return np.array([], dtype=int)
+    ntp = data['NTP']
+    finite = np.isfinite(ntp)
+    change = np.nonzero(finite[1:] & (np.diff(ntp) != 0))[0] + 1
+    return np.unique(np.concatenate([np.nonzero(finite)[0][:1], change]))
+
+
+def decimate(xdata, ydata, npoints, keep=None):
+    """
+    Indices of a shape preserving subset of a line of about npoints.
+
+    The line is cut into npoints / 4 runs of consecutive points and each run
+    keeps its points of min and max x and y, so loops and spikes (e.g.,
+    thermal pulses) survive. The first and last points and the indices in
+    keep (e.g., iptcri and tp_boundaries) are always kept.
+
+    Parameters
+    ----------
+    xdata, ydata : arrays
+        the line
+    npoints : int
+        point budget, if 0 or None or the line is shorter, all indices are
+        returned
+    keep : array of ints
+        indices to keep
+
+    Returns
+    -------
+    sorted array of indices of xdata, ydata
+    """
+    npts = len(xdata)
+    if not npoints or npts <= npoints:
+        return np.arange(npts)
+
+    nruns = max(int(npoints) // 4, 1)
+    size = int(np.ceil(npts / nruns))
+    nruns = int(np.ceil(npts / size))
+    pad = nruns * size - npts
+    start = np.arange(nruns) * size
+
+    inds = [np.array([0, npts - 1])]
+    for arr in [xdata, ydata]:
+        arr = np.asarray(arr, dtype=float)
+        finite = np.isfinite(arr)
+        for fill, argfunc in [(np.inf, np.argmin), (-np.inf, np.argmax)]:
+            runs = np.append(np.where(finite, arr, fill),
+                             np.full(pad, fill)).reshape(nruns, size)
+            inds.append(start + argfunc(runs, axis=1))
+
+    if keep is not None:
+        inds.append(np.asarray(keep, dtype=int))
+    inds = np.unique(np.concatenate(inds))
+    return inds[(inds >= 0) & (inds < npts)]
+
+
 def arrow_on_line(ax, xarr, yarr, index, plt_kw={}):
     """put (a) FancyArrow(s) at xarr[index], yarr[index]"""
     from matplotlib.patches import FancyArrow
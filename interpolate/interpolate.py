@@ -192,11 +192,7 @@ def interpolate_along_track(track, inds, nticks, zcol=None, mess=None,
                               linear=linear)
 
     if zcol is None:
-        # np.array or pd.DataFrame
-        try:
-            massnew = np.repeat(mass_[0], len(lagenew))
-        except KeyError:
-            massnew = np.repeat(mass_.iloc[0], len(lagenew))
+        massnew = np.repeat(mass_[0], len(lagenew))
 
     if linear:
         lagenew = np.log10(lagenew)
@@ -242,11 +238,7 @@ def call_interp1d(track, inds, nticks, mess=None, linear=False):
     if not linear:
         lage = np.log10(track.data[age][inds])
 
-    # np.array or pd.DataFrame
-    try:
-        lagenew = np.linspace(lage[0], lage[-1], nticks)
-    except KeyError:
-        lagenew = np.linspace(lage.iloc[0], lage.iloc[-1], nticks)
+    lagenew = np.linspace(lage[0], lage[-1], nticks)
 
     # arbitrary threshold to care about mass loss on the track.
     threshold = 0.01
@@ -255,11 +247,7 @@ def call_interp1d(track, inds, nticks, mess=None, linear=False):
         fage_m = interp1d(lage, mass_, bounds_error=0)
         massnew = fage_m(lagenew)
     else:
-        # np.array or pd.DataFrame
-        try:
-            massnew = np.repeat(mass_.iloc[0], len(lagenew))
-        except KeyError:
-            massnew = np.repeat(mass_[0], len(lagenew))
+        massnew = np.repeat(mass_[0], len(lagenew))
 
     if len(np.nonzero(np.diff(logl))[0]) == 0:
         # all logls are the same
@@ -282,7 +270,7 @@ def call_interp1d(track, inds, nticks, mess=None, linear=False):
 
 
 def interpolate_tpagb(track, inds, nticks, mess=None, zcol=None,
-                      zmsg='', outdir=None, diag=False):
+                      zmsg='', outdir=None, diag=False, writer=None):
     """
     Statistically, np.choice(track.data.age[inds], nticks) is enough to
     populate the TP-AGB tracks for MATCH.
@@ -409,8 +397,12 @@ def interpolate_tpagb(track, inds, nticks, mess=None, zcol=None,
         outfile = '{}_tpagb_diag.png'.format(track.name)
         if outdir is not None:
             outfile = os.path.join(outdir, outfile)
-        fig.savefig(outfile)
-        fig1.savefig(outfile.replace('.png', '_hrd.png'))
+        if writer is None:
+            fig.savefig(outfile)
+            fig1.savefig(outfile.replace('.png', '_hrd.png'))
+        else:
+            writer.savefig(fig, outfile)
+            writer.savefig(fig1, outfile.replace('.png', '_hrd.png'))
         plt.close('all')
 
     return np.log10(lagenews), lnews, tenews, massnews
@@ -148,7 +148,8 @@ def interpolate_between_sets(match_dir1, match_dir2, outdir, mhef,
                              overwrite=False, plot=False,
                              truth_track_loc='', frac=2.):
     def strip_m(s):
-        return float(s.split('_M')[-1].replace('.dat', '').replace('.HB', ''))
+        m = s.split('_M')[-1].replace('.dat', '').replace('.HB', '')
+        return float(m.replace('.PMS', ''))
 
     def strip_z(s):
         return float(s.split('Z')[-1].split('Y')[0].replace('_', ''))
@@ -273,8 +274,7 @@ def interpolate_between_sets(match_dir1, match_dir2, outdir, mhef,
             plt.close()
         outfile = os.path.join(outdir, tname1s[i])
         if not os.path.isfile(outfile) or overwrite:
-            # np.savetxt(outfile, track, header=header, fmt='%.8f')
-            np.savetxt(outfile, track, header=header, fmt='%.8f')
+            fileio.savetxt(outfile, track, header=header, fmt='%.8f')
         # print('wrote {}'.format(outfile))
 
 
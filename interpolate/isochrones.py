@@ -0,0 +1,189 @@
+"""
+Isochrones from EEP-aligned (MATCH) tracks.
+
+All MATCH tracks have the same number of points between EEPs, so row j of
+every track is the same evolutionary point. An isochrone of age t is made
+by interpolating, at each row j, between the two adjacent masses whose
+ages at row j bracket t (linear in log age). The loop is over mass
+intervals; each step is vectorized over all rows and a batch of ages.
+"""
+import numpy as np
+
+from ..config import age, mass, logT, logL
+from ..eep.critical_point import Eep
+
+__all__ = ['IsochroneBuilder', 'ISOCHRONE_DTYPE']
+
+# MATCH track columns (also the archive columns)
+ILAGE, IMASS, ILOGTE, IMBOL, ILOGG, ICO = range(6)
+
+# Named as in CMD tables (see parsec2fsps)
+ISOCHRONE_DTYPE = [('logageyr', float), ('M_ini', float), ('M_act', float),
+                   ('logL', float), ('logT', float), ('logg', float),
+                   ('CO', float), ('stage', float), ('slope', float),
+                   ('eep', int)]
+
+# Stage of each segment (keyed by the EEP that begins it) using the CMD
+# phase numbers: 0 PMS 1 MS 3 RGB 4 HEB 7 EAGB 8 TPAGB. The subgiant branch
+# is not an EEP, so MS_TO to RG_TIP is all RGB.
+STAGES = {'PMS_BEG': 0, 'MS_BEG': 1, 'MS_TMIN': 1, 'MS_TO': 3, 'RG_TIP': 4,
+          'HE_BEG': 4, 'END_CHEB': 7, 'TPAGB_BEG': 8, 'FIN': 8}
+
+
+class IsochroneBuilder(object):
+    """
+    Interpolate isochrones from one metallicity of MATCH tracks.
+
+    Parameters
+    ----------
+    masses : array (nmass)
+        initial masses
+    tracks : array (nmass, nrows, 6)
+        MATCH tracks (logAge Mass logTe Mbol logg C/O) NaN padded
+    Z : float
+        metallicity (carried to the output only)
+    """
+    def __init__(self, masses, tracks, Z=None, eep=None):
+        isort = np.argsort(masses)
+        self.masses = np.asarray(masses, dtype=float)[isort]
+        self.tracks = np.asarray(tracks, dtype=float)[isort]
+        self.Z = Z
+        self.eep = eep or Eep()
+
+        nrows = self.tracks.shape[1]
+        stages = np.zeros(nrows)
+        for i, eep_name in enumerate(self.eep.eep_list[:-1]):
+            stages[self.eep.eep_offsets[i]: self.eep.eep_offsets[i + 1]] = \
+                STAGES[eep_name]
+        self.stages = stages
+
+    @classmethod
+    def from_arrays(cls, masses, tracks, hbmasses=None, hbtracks=None,
+                    Z=None, eep=None):
+        """
+        Parameters
+        ----------
+        masses, hbmasses : lists of initial masses
+        tracks, hbtracks : lists of (nrows, 6) MATCH track arrays
+
+        HB tracks are attached (rg_tip_heb_transition) to the non-HB track
+        of the same mass that ends at the RGB tip.
+        """
+        from .interpolate_match_grid import rg_tip_heb_transition
+        eep = eep or Eep()
+        hbmasses = np.asarray(hbmasses if hbmasses is not None else [])
+        if hbtracks is None:
+            hbtracks = []
+        full = []
+        for mass_, track in zip(masses, tracks):
+            track = np.array(track, dtype=float)
+            ihb, = np.nonzero(np.abs(hbmasses - mass_) < 1e-4)
+            if len(ihb) > 0 and len(track) == eep.nms:
+                hbtrack = np.array(hbtracks[ihb[0]], dtype=float)
+                track = rg_tip_heb_transition(hbtrack, track)
+            full.append(track)
+
+        nrows = np.max([len(t) for t in full])
+        data = np.full((len(full), nrows, 6), np.nan)
+        for i, track in enumerate(full):
+            data[i, :len(track)] = track
+        return cls(masses, data, Z=Z, eep=eep)
+
+    @classmethod
+    def from_tracks(cls, match_tracks, eep=None):
+        """from padova_tracks.Track objects (match=True) of one Z"""
+        def columns(track):
+            return np.column_stack([track.data[age], track.data[mass],
+                                    track.data[logT],
+                                    4.77 - 2.5 * track.data[logL],
+                                    track.data['logg'], track.data['CO']])
+
+        tracks = [t for t in match_tracks if t is not None]
+        Z, = np.unique([t.Z for t in tracks])
+        kw = {}
+        for hb in [False, True]:
+            pref = 'hb' if hb else ''
+            ts = [t for t in tracks if t.hb == hb]
+            kw[pref + 'masses'] = [t.mass for t in ts]
+            kw[pref + 'tracks'] = [columns(t) for t in ts]
+        return cls.from_arrays(Z=Z, eep=eep, **kw)
+
+    @classmethod
+    def from_grid(cls, grid, Z, eep=None):
+        """from a tracks.grid_index.GridIndex at one Z"""
+        cols = ['logAge', 'Mass', 'logTe', 'Mbol', 'logg', 'C/O']
+        kw = {}
+        for hb in [False, True]:
+            pref = 'hb' if hb else ''
+            inds = grid.select(Z=Z, hb=hb)
+            kw[pref + 'masses'] = grid.mass[inds]
+            kw[pref + 'tracks'] = [grid.values(i, cols, np.arange(n))[0]
+                                   for i, n in zip(inds, grid.nrows[inds])]
+        return cls.from_arrays(Z=Z, eep=eep, **kw)
+
+    def _batch(self, logages):
+        """interpolate a batch of isochrones, (nages, nrows, ...) arrays"""
+        nages = len(logages)
+        nrows = self.tracks.shape[1]
+        lage = logages[:, None]
+        mini = np.full((nages, nrows), np.nan)
+        vals = np.full((nages, nrows, 6), np.nan)
+        for k in range(len(self.masses) - 1):
+            t0 = self.tracks[k]
+            t1 = self.tracks[k + 1]
+            a0 = t0[:, ILAGE]
+            a1 = t1[:, ILAGE]
+            lo = np.fmin(a0, a1)
+            hi = np.fmax(a0, a1)
+            # lowest mass interval wins if more than one brackets the age
+            sel = (lage >= lo) & (lage <= hi) & np.isnan(mini)
+            if not sel.any():
+                continue
+            da = a1 - a0
+            da[da == 0] = np.inf
+            frac = (lage - a0) / da
+            frac[~sel] = 0.
+            mini[sel] = (self.masses[k] +
+                         frac * (self.masses[k + 1] - self.masses[k]))[sel]
+            vals[sel] = (t0 + frac[..., None] * (t1 - t0))[sel]
+        return mini, vals
+
+    def isochrones(self, logages, batch=50):
+        """
+        Isochrones at logages.
+
+        Parameters
+        ----------
+        logages : array
+            log10 age (yr), any order
+        batch : int
+            number of ages interpolated at once (memory is
+            batch * nrows * 6 floats)
+
+        Returns
+        -------
+        np.recarray with ISOCHRONE_DTYPE, sorted by age then EEP row (empty
+        if logages is).
+        """
+        logages = np.sort(np.atleast_1d(np.asarray(logages, dtype=float)))
+        tabs = [np.zeros(0, dtype=ISOCHRONE_DTYPE)]
+        for i in range(0, len(logages), batch):
+            lages = logages[i: i + batch]
+            mini, vals = self._batch(lages)
+            iage, irow = np.nonzero(np.isfinite(mini) &
+                                    np.all(np.isfinite(vals), axis=2))
+            tab = np.zeros(len(iage), dtype=ISOCHRONE_DTYPE)
+            v = vals[iage, irow]
+            tab['logageyr'] = lages[iage]
+            tab['M_ini'] = mini[iage, irow]
+            tab['M_act'] = v[:, IMASS]
+            tab['logL'] = (4.77 - v[:, IMBOL]) / 2.5
+            tab['logT'] = v[:, ILOGTE]
+            tab['logg'] = v[:, ILOGG]
+            tab['CO'] = v[:, ICO]
+            tab['stage'] = self.stages[irow]
+            # CMD tables flag the TP-AGB with a non-zero slope
+            tab['slope'] = self.stages[irow] == STAGES['TPAGB_BEG']
+            tab['eep'] = irow
+            tabs.append(tab)
+        return np.concatenate(tabs).view(np.recarray)
@@ -1,5 +1,6 @@
 """Interpolate tracks for match and check the interpolations"""
 
+import json
 import numpy as np
 import os
 
@@ -12,7 +13,8 @@ from .eep.critical_point import Eep
 from .interpolate.interpolate import interpolate_along_track
 from .tracks.track_set import TrackSet
 from .tracks.track import Track
-from .graphics.graphics import match_parsec, plot_tracks
+from .graphics.diag_plots import save_diag_data, render_diag_plots
+from .profiling import stage, record
 
 
 class TracksForMatch(TrackSet, DefineEeps):
@@ -31,6 +33,17 @@ class TracksForMatch(TrackSet, DefineEeps):
                 track.iptcri = np.zeros(len(self.eep_list), dtype=int)
         self.set_directories()
 
+    def stream_tracks(self):
+        """
+        Load and define the EEPs of the tracks one at a time (see
+        TrackSet.iter_tracks), e.g., match_interpolation(self.stream_tracks())
+        """
+        for track in self.iter_tracks():
+            track.iptcri = np.zeros(len(self.eep_list), dtype=int)
+            with stage('define_eep_stages', track=track.name):
+                self.define_eep_stages(track)
+            yield track
+
     def set_directories(self):
         """define output directory structure and filename formats"""
 
@@ -48,72 +61,151 @@ class TracksForMatch(TrackSet, DefineEeps):
 
         self.intpfmt = 'match_{0:s}.dat'  # track.name here
         self.logfmt = 'match_interp_{0:s}.log'
+        self.archivefmt = 'match_{0:s}'  # self.prefix here
+
+        err = 'output_format must be text, archive, or both'
+        assert self.output_format in ['text', 'archive', 'both'], err
 
         if hasattr(self, 'hbtracks'):
             self.hblogfmt = 'match_interp_hb_{0:s}.log'
 
-    def match_interpolation(self):
+    def match_interpolation(self, tracks=None):
         """
         Call the MATCH interpolator, make diagnostic plots
 
         This function writes two file types:
         match_interp logfile: Any error collections from define_eep or here.
-        """
-        # to pass the flags to another class
-        flag_dict = {}
-        info_dict = {}
-        self.mtracks = []
 
-        filename = self.logfmt
+        Diagnostic plots are drawn after all tracks are interpolated, with
+        self.workers processes (see graphics.diag_plots).
 
-        tpagb_plotdir = os.path.join(self.plot_dir, 'tpagb')
-        fileio.ensure_dir(tpagb_plotdir)
-        tpagb_kw = {'diag': self.track_diag_plot, 'outdir': tpagb_plotdir}
+        If self.output_format is 'archive' or 'both' all MATCH tracks are also
+        written to one archive (see fileio.match_archive) which is rewritten
+        each call.
 
-        for track in self.tracks:
-            mkey = 'M{0:.3f}'.format(track.mass)
-            flag_dict[mkey] = track.flag
-
-            if track.flag is not None:
-                print('skipping track M={0:.3f} because of flag: {1:s}'
-                      .format(track.mass, track.flag))
-                info_dict[mkey] = track.flag
-                continue
+        The MATCH files, the log, and the TP-AGB diagnostic figures are
+        written atomically by self.writers background threads (see
+        fileio.writer), all are complete when this returns.
 
-            # interpolate tracks for match
-            mfn = self.intpfmt.format(track.name)
-            outfile = os.path.join(self.outfile_dir, mfn)
+        With self.low_memory each MATCH track is checked as soon as it is
+        made, then it and the data of its track are dropped (self.mtracks
+        stays empty): memory is released track by track instead of holding
+        every MATCH track of the prefix until the end.
 
-            if not self.overwrite_match and os.path.isfile(outfile):
-                print('not overwriting {0:s}'.format(outfile))
-                continue
-            match_track = self.process_track(track, outfile, tpagb_kw=tpagb_kw)
+        Parameters
+        ----------
+        tracks : iterable of Tracks with EEPs defined
+            default self.tracks. A generator (e.g., self.stream_tracks())
+            is consumed one track at a time and is always low_memory: only
+            the flags and info of each track are kept.
+        """
+        # to pass the flags to another class
+        flag_dict = {}
+        log = InterpLog(eep=self, prefix=self.prefix)
+        self.mtracks = []
+        self.match_info = {}
+        self.check_report = []
 
-            info_dict[mkey] = track.info
+        filename = self.logfmt
 
-            if self.track_diag_plot:
-                # make diagnostic plots
-                for xcol in [logT, age]:
-                    plot_dir = os.path.join(self.plot_dir, xcol.lower())
-                    fileio.ensure_dir(plot_dir)
-                    match_parsec(track, plot_dir=plot_dir, xcol=xcol,
-                                 match_track=match_track, save=True,
-                                 title=True)
+        archive = None
+        if self.output_format != 'text':
+            archive = fileio.ArchiveWriter(
+                os.path.join(self.outfile_dir,
+                             self.archivefmt.format(self.prefix)),
+                prefix=self.prefix, eep=self)
 
-            self.mtracks.append(match_track)
+        writer = fileio.AsyncWriter(workers=self.writers or 0)
 
-        if self.diag_plot:
-            dp_kw = {'plot_dir': self.plot_dir,
-                     'match_tracks': self.mtracks}
-            plot_tracks(self.tracks, hb=False, **dp_kw)
-            plot_tracks(self.tracks, hb=True, **dp_kw)
+        tpagb_plotdir = os.path.join(self.plot_dir, 'tpagb')
+        fileio.ensure_dir(tpagb_plotdir)
+        tpagb_kw = {'diag': self.track_diag_plot, 'outdir': tpagb_plotdir,
+                    'writer': writer}
+        diag_data = os.path.join(self.plot_dir, 'data')
+        # only the tracks of this call are drawn
+        diag_files = []
+
+        low_memory = self.low_memory
+        if tracks is None:
+            tracks = self.tracks
+        elif not isinstance(tracks, (list, tuple)):
+            low_memory = True
+
+        try:
+            for track in tracks:
+                mkey = 'M{0:.3f}'.format(track.mass)
+                flag_dict[mkey] = track.flag
+
+                if track.flag is not None:
+                    print('skipping track M={0:.3f} because of flag: {1:s}'
+                          .format(track.mass, track.flag))
+                    log.add_track(track, info=track.flag)
+                    continue
+
+                # interpolate tracks for match
+                mfn = self.intpfmt.format(track.name)
+                outfile = os.path.join(self.outfile_dir, mfn)
+
+                if not self.overwrite_match and os.path.isfile(outfile) and \
+                        archive is None:
+                    print('not overwriting {0:s}'.format(outfile))
+                    continue
+                with stage('interpolate', track=track.name):
+                    match_track = self.process_track(track, outfile,
+                                                     tpagb_kw=tpagb_kw,
+                                                     archive=archive,
+                                                     writer=writer)
+
+                log.add_track(track)
+
+                if self.track_diag_plot or self.diag_plot:
+                    # plots are made from saved arrays after the loop
+                    with stage('save_diag_data', track=track.name):
+                        diag_files.append(
+                            save_diag_data(track, match_track, diag_data,
+                                           prefix=self.prefix))
+
+                if low_memory:
+                    with stage('check_tracks', track=track.name):
+                        self.check_track(match_track, flag_dict)
+                    track.data = None
+                    continue
+                self.mtracks.append(match_track)
+        except BaseException:
+            if archive is not None:
+                # keep the previous archive, not part of this one
+                archive.abort()
+            raise
+
+        if archive is not None:
+            with stage('write_archive'):
+                archive.close()
+
+        if self.track_diag_plot or self.diag_plot:
+            with stage('plot'):
+                figs = render_diag_plots(self.plot_dir, data_dir=diag_data,
+                                         filenames=diag_files,
+                                         workers=self.workers,
+                                         track_plots=self.track_diag_plot,
+                                         set_plots=self.diag_plot,
+                                         max_points=self.max_plot_points)
+            # (drawn in the workers)
+            for figname, seconds in figs:
+                record('plot_figure', seconds, figure=figname)
 
         logfile = os.path.join(self.log_dir,
                                filename.format(self.prefix.lower()))
-        write_log(logfile, info_dict)
-        return self.check_tracks(flag_dict)
-
-    def process_track(self, track, outfile, tpagb_kw=None):
+        write_log(logfile, log, writer=writer, jsonl=self.log_jsonl)
+        with stage('flush_writes'):
+            writer.close()
+        if low_memory:
+            self.print_check_report()
+            return flag_dict
+        with stage('check_tracks'):
+            return self.check_tracks(flag_dict)
+
+    def process_track(self, track, outfile, tpagb_kw=None, archive=None,
+                      writer=None):
         """
         Do MATCH interpolation, save files
 
@@ -126,6 +218,13 @@ class TracksForMatch(TrackSet, DefineEeps):
             MATCH interpolated filename to write to
         hb : bool default is False
             specification of a Horizontal Branch track
+        archive : fileio.ArchiveWriter
+            also (or with output_format='archive', only) add the MATCH
+            track to this archive (even if outfile exists and is not
+            overwritten, see overwrite_match)
+        writer : fileio.AsyncWriter
+            write outfile with this writer (default: now, with
+            fileio.savetxt)
 
         Returns
         -------
@@ -174,9 +273,11 @@ class TracksForMatch(TrackSet, DefineEeps):
                     'Interp failed: {0:d} inds between eeps.'.format(len(inds))
                 continue
 
-            lagenew, lnew, tenew, massnew = \
-                interpolate_along_track(track, inds, nticks[i], mess=mess,
-                                        tpagb_kw=tpagb_kw)
+            with stage('interpolate_segment', track=track.name,
+                       segment=this_eep):
+                lagenew, lnew, tenew, massnew = \
+                    interpolate_along_track(track, inds, nticks[i], mess=mess,
+                                            tpagb_kw=tpagb_kw)
 
             conew = np.zeros(len(massnew))
             # should we care about the C/O interpolation?
@@ -212,7 +313,7 @@ class TracksForMatch(TrackSet, DefineEeps):
                 import pdb
                 pdb.set_trace()
 
-            if np.sum(lagenew) > 0:
+            if np.sum(np.isnan(lagenew)) > 0:
                 import pdb
                 pdb.set_trace()
 
@@ -252,7 +353,23 @@ class TracksForMatch(TrackSet, DefineEeps):
                 pdb.set_trace()
 
         to_write = np.column_stack([logage, mass_, logte, mbol, logg, co])
-        np.savetxt(outfile, to_write, header=header, fmt='%.10f')
+        write_text = self.output_format != 'archive'
+        if write_text and not self.overwrite_match and \
+                os.path.isfile(outfile):
+            # (still added to the archive)
+            print('not overwriting {0:s}'.format(outfile))
+            write_text = False
+        with stage('write', track=track.name):
+            if write_text:
+                if writer is None:
+                    fileio.savetxt(outfile, to_write, header=header,
+                                   fmt='%.10f')
+                else:
+                    writer.savetxt(outfile, to_write, header=header,
+                                   fmt='%.10f')
+            if archive is not None:
+                archive.add(track.name, track.mass, track.Z, track.hb,
+                            to_write)
         return Track(outfile, track_data=to_write, match=True,
                      debug=self.debug)
 
@@ -262,86 +379,233 @@ class TracksForMatch(TrackSet, DefineEeps):
 
         Results go into self.match_info dictionary whose keys are set by
         M{:.3f}.format(track.mass) and values filled with a list of strings
-        with the information.
+        with the information, and one row per bad track in
+        self.check_report (see age_audit).
+
+        MATCH tracks with the same length (and HB or not) share a tick
+        layout, each such group is audited at once as a 2-D age array.
 
         If the track has already been flagged (track.flag), no test occurs.
 
         Parameters
         ----------
-        tracks: list of padova_tracks.Track objects
+        flag_dict : dict
+            flags of the tracks, updated in place
         """
-        def print_bad(err, ibad):
-            edges = np.cumsum(self.nticks) - 1
-            for i in ibad:
-                near = np.argmin(np.abs(i - edges))
-                print(i, near)
-                err += '{:s}\n'.format(np.array(self.eep_list)[near])
-                err += '{:f} {:d}\n'.format(t.data[age][i-1], i-1)
-                err += '{:f} {:d}\n'.format(t.data[age][i], i)
-                err += '{:f} {:d}\n'.format(t.data[age][i+1], i+1)
-            return err
         self.match_info = {}
+        self.check_report = []
+        groups = {}
         for t in self.mtracks:
-            err = ''
+            groups.setdefault((len(t.data), t.hb), []).append(t)
+        for (_, hb), tracks in groups.items():
+            self._audit_tracks(tracks, np.array([t.data[age]
+                                                 for t in tracks]), hb,
+                               flag_dict)
+        self.print_check_report()
+        return flag_dict
+
+    def check_track(self, t, flag_dict):
+        """check_tracks of one MATCH track (t), adds to self.check_report"""
+        if not hasattr(self, 'check_report'):
+            self.check_report = []
+        return self._audit_tracks([t], t.data[age][np.newaxis, :], t.hb,
+                                  flag_dict)
+
+    def _audit_tracks(self, tracks, ages, hb, flag_dict):
+        """age_audit of tracks (ages is their 2-D age array)"""
+        nticks, eep_list = self.nticks, self.eep_list
+        if hb:
+            nticks, eep_list = self.nticks_hb, self.eep_list_hb
+        flagged, itrack, irow, decreasing, eeps = \
+            age_audit(ages, nticks, eep_list)
+
+        for k in np.nonzero(flagged)[0]:
+            t = tracks[k]
             key = 'M{0:.3f}'.format(t.mass)
-            test = np.diff(t.data[age]) > 0
-            if False in test:
-                flag_dict[key] = 'age not monotonicly increasing on track'
-                # age where does age decrease
-                negs, = np.nonzero(np.diff(t.data[age]) < 0)
-                iden, = np.nonzero(np.diff(t.data[age]) == 0)
-                if len(negs) != 0:
-                    err = print_bad('Age decreasing increasing near ', negs)
-                # identical values of age
-                if len(iden) != 0:
-                    err = print_bad('{0:d} identical age value(s) near '
-                                    .format(len(iden)), iden)
-            if len(err) > 0:
-                print(t.mass, t.Z, 'HB?:', t.hb)
-                print(err)
+            flag_dict[key] = 'age not monotonicly increasing on track'
+            ibad, = np.nonzero(itrack == k)
+            if len(ibad) == 0:
+                # flagged for nan ages only
+                inan, = np.nonzero(np.isnan(ages[k]))
                 if key not in self.match_info:
-                    self.match_info[key] = err
+                    self.match_info[key] = \
+                        '{0:d} NaN age value(s), first at {1:d}\n'.format(
+                            len(inan), inan[0])
+                self.check_report.append((t.mass, t.Z, t.hb, 0, 0, inan[0],
+                                          'NaN ages'))
+                continue
+            err = ''
+            for dec, head in [(True, 'Age decreasing near '),
+                              (False, '{0:d} identical age value(s) near ')]:
+                these = ibad[decreasing[ibad] == dec]
+                if len(these) == 0:
+                    continue
+                err += head.format(len(these))
+                for j in these:
+                    i = irow[j]
+                    err += '{:s}\n'.format(eeps[j])
+                    err += ''.join(['{:f} {:d}\n'.format(ages[k, n], n)
+                                    for n in [i - 1, i, i + 1]])
+            if key not in self.match_info:
+                self.match_info[key] = err
+            ndec = int(np.sum(decreasing[ibad]))
+            self.check_report.append((t.mass, t.Z, t.hb, ndec,
+                                      len(ibad) - ndec, irow[ibad[0]],
+                                      eeps[ibad[0]]))
         return flag_dict
 
+    def print_check_report(self):
+        """print self.check_report as a table (if there are bad tracks)"""
+        report = getattr(self, 'check_report', [])
+        if len(report) == 0:
+            return
+        fmt = '{0:>7s} {1:>8s} {2:>3s} {3:>5s} {4:>5s} {5:>6s} {6:s}'
+        print(fmt.format('mass', 'Z', 'HB', 'ndec', 'nsame', 'first',
+                         'near EEP'))
+        for row in sorted(report):
+            print(fmt.format('{0:.3f}'.format(row[0]), '{0:g}'.format(row[1]),
+                             str(int(row[2])), *[str(r) for r in row[3:]]))
+
+
+def age_audit(ages, nticks, eep_list):
+    """
+    Find the non-monotonic ages of MATCH tracks with one tick layout.
+
+    Parameters
+    ----------
+    ages : 2-D array
+        ages of each track (one track per row)
+    nticks, eep_list : list
+        ticks between EEPs and EEP names of the layout
+
+    Returns
+    -------
+    flagged : bool array
+        tracks whose ages are not all increasing (includes nans)
+    itrack, irow : int arrays
+        one entry per age step that does not increase:
+        ages[itrack, irow + 1] <= ages[itrack, irow]
+    decreasing : bool array
+        the age decreases (else it is identical)
+    eeps : str array
+        the EEP whose tick edge is nearest irow
+    """
+    dage = np.diff(ages, axis=1)
+    flagged = ~np.all(dage > 0, axis=1)
+    itrack, irow = np.nonzero(dage <= 0)
+    decreasing = dage[itrack, irow] < 0
+
+    # nearest edge (the lower one on a tie)
+    edges = np.cumsum(nticks) - 1
+    j = np.clip(np.searchsorted(edges, irow), 1, len(edges) - 1)
+    near = np.where(irow - edges[j - 1] <= edges[j] - irow, j - 1, j)
+    eeps = np.array(eep_list)[near]
+    return flagged, itrack, irow, decreasing, eeps
+
 
-def write_log(logfile, info_dict):
-    """write interpolation dictionary to file"""
-    def sortbyval(d):
-        """sortes keys and values of dict by mass values"""
-        keys, vals = list(zip(*list(d.items())))
-        mkeys = np.array([k.replace('M', '') for k in list(d.keys())],
-                         dtype=float)
-        ikeys = np.argsort(mkeys)
-        skeys = np.array(keys)[ikeys]
-        svals = np.array(vals)[ikeys]
-        return skeys, svals
-
-    def sortbyeep(d, eep):
-        """sorts the eep names by eep.eep_list index order"""
-        keys, vals = list(zip(*list(d.items())))
-        all_inds = np.arange(len(keys))
-        # eep.eep_list has hb eeps as well as non-hb eeps.
-        inds = np.argsort([eep.eep_list.index(k) for k in keys
-                           if k in eep.eep_list])
-        not_eep = [i for i in all_inds if i not in inds]
-        if len(not_eep) > 0:
-            inds = np.concatenate([inds, not_eep])
-        skeys = np.array(keys)[inds]
-        svals = np.array(vals)[inds]
-        return skeys, svals
-
-    eep = Eep()
-    with open(logfile, 'w') as out:
-        # sort by mass
-        mass_, info = sortbyval(info_dict)
-        for m, d in zip(mass_, info):
-            out.write('# {0:s}\n'.format(m))
-            try:
-                # sort by EEP
-                keys, vals = sortbyeep(d, eep)
-            except AttributeError:
-                out.write('{0:s}\n'.format(d))
+class InterpLog(object):
+    """
+    The interpolation log of a track set as a table: one record (mass, hb,
+    key, value) per line of each track's info (or its flag).
+
+    Records are sorted once, by mass, HB, then EEP definitions (in EEP
+    order, see Eep.eep_list) before the other lines (in the order they were
+    added).
+    """
+    def __init__(self, eep=None, prefix=''):
+        eep = eep or Eep()
+        # rank of EEP names, anything else comes after them
+        self.ranks = {name: i for i, name in enumerate(eep.eep_list)}
+        self.prefix = prefix
+        self.records = []
+
+    def add(self, mass, hb, key, value):
+        """add one line (key may be '' for a line of only value)"""
+        rank = self.ranks.get(key, len(self.ranks))
+        self.records.append((mass, hb, rank, len(self.records), key,
+                             str(value)))
+
+    def add_track(self, track, info=None):
+        """add the info dict (default track.info) or flag of track"""
+        info = track.info if info is None else info
+        if not isinstance(info, dict):
+            return self.add(track.mass, track.hb, '', info)
+        for key, value in info.items():
+            self.add(track.mass, track.hb, key, value)
+
+    @classmethod
+    def from_info_dict(cls, info_dict, eep=None):
+        """InterpLog of {M<mass>: info dict or flag}"""
+        log = cls(eep=eep)
+        for mkey, info in info_dict.items():
+            mass_ = float(mkey.replace('M', ''))
+            if not isinstance(info, dict):
+                log.add(mass_, False, '', info)
                 continue
-            for k, v in zip(keys, vals):
-                out.write('{0:s}: {1:s}\n'.format(k, v))
+            for key, value in info.items():
+                log.add(mass_, False, key, value)
+        return log
+
+    def table(self):
+        """the sorted records as a structured array"""
+        dtype = [('mass', float), ('hb', bool), ('rank', int), ('order', int),
+                 ('key', object), ('value', object)]
+        tab = np.array(self.records, dtype=dtype)
+        return tab[np.lexsort((tab['order'], tab['rank'], tab['hb'],
+                               tab['mass']))]
+
+    def text(self):
+        """the text log: a # M<mass> [HB] line then key: value lines"""
+        lines = []
+        last = None
+        for rec in self.table():
+            if (rec['mass'], rec['hb']) != last:
+                last = (rec['mass'], rec['hb'])
+                lines.append('# M{0:.3f}{1:s}\n'.format(
+                    rec['mass'], ' HB' if rec['hb'] else ''))
+            if len(rec['key']) == 0:
+                lines.append('{0:s}\n'.format(rec['value']))
+            else:
+                lines.append('{0:s}: {1:s}\n'.format(rec['key'],
+                                                      rec['value']))
+        return ''.join(lines)
+
+    def jsonl(self):
+        """one json object (prefix, mass, hb, key, value) per line"""
+        return ''.join([json.dumps({'prefix': self.prefix,
+                                    'mass': float(rec['mass']),
+                                    'hb': bool(rec['hb']),
+                                    'key': rec['key'],
+                                    'value': rec['value']}) + '\n'
+                        for rec in self.table()])
+
+
+def write_log(logfile, log, writer=None, jsonl=False):
+    """
+    write the interpolation log to file (atomically, with writer if given,
+    see fileio.writer)
+
+    Parameters
+    ----------
+    logfile : str
+        text log filename
+    log : InterpLog or dict
+        the log or a {M<mass>: info dict or flag} dictionary
+    writer : fileio.AsyncWriter
+        write with this writer
+    jsonl : bool
+        also write the records to logfile with the extension .jsonl
+    """
+    if isinstance(log, dict):
+        log = InterpLog.from_info_dict(log)
+
+    outputs = [(logfile, log.text())]
+    if jsonl:
+        outputs.append((fileio.replace_ext(logfile, '.jsonl'), log.jsonl()))
+
+    for filename, text in outputs:
+        if writer is None:
+            fileio.atomic_write(filename, text)
+        else:
+            writer.write_text(filename, text)
     return
@@ -1,81 +1,277 @@
-from ezpadova import cmd
+"""
+Isochrones in the FSPS format.
+
+Isochrone tables come from a source, any object with
+    get_t_isochrones(logtmin, logtmax, dlogt, z)
+that returns a table with (at least) the CMD columns of FSPS_KEYS and
+'slope'. Sources:
+    CMDSource: the CMD web service (needs ezpadova and network access)
+    ArchiveSource: tables cached on disk (optionally filled by another
+                   source on a miss)
+    GridSource: interpolated from a local grid of MATCH tracks
+"""
+import argparse
+import functools
+import os
+import sys
+
 import numpy as np
 
+from .fileio import format_rows
+from .utils import parallel_map
+
+
+# these are the grid point Zs so cmd2.8 does not have to interpolate
+# (Z=0.05 might have been added)
+ZS = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.004, 0.006, 0.008, 0.01,
+      0.014, 0.017, 0.02, 0.03, 0.04, 0.06]
+
+FSPS_KEYS = ['logageyr', 'M_ini', 'M_act', 'logL', 'logT', 'logg', 'CO',
+             'stage']
+FSPS_HEADER = '# log(age) Mini Mact logl logt logg Composition Phase\n'
+FSPS_FMT = '%.2f %.8f %.4f %.4f %.4f %.4f %.4f %.4f'
+
+# cmd2.8 will not take lage >= 10.13
+AGEMIN = 5.5
+AGEMAX = 10.13
+DLOGT = 0.05
+
+# Leo's stage (index) to Charlie's phase, see redefine_phase
+PHASE_LUT = np.array([0., 0., 1., 2., 3., 3., 3., 4., 0., 6., 0.])
+
 
 def redefine_phase(tab):
-    # Evolutionary phases defined in the isochrones:
-    # 0: main sequence
-    # 1: sub giant branch
-    # 2: red giant branch
-    # 3: red horizontal branch / red clump (core He burning)
-    # 4: early asymptotic giant branch
-    # 5: thermally-pulsating AGB (composition sets C-rich vs. O-rich)
-    # 6: Post-AGB
-    # 7: blue stragglers
-    # 8: blue horizontal branch
-    # 9: Wolf-Rayet (composition sets WC vs. WN)
-    # -1: transition from RGB tip to HB
-
-    # Leo's -- Charlie's
-    # 0 PMS -- 0
-    # 1 MS -- 0
-    # 2 SUBGIANT -- 1
-    # 3 RGB -- 2
-    # 4 HEB -- 3
-    # 5 RHEB -- 3
-    # 6 BHEB -- 3
-    # 7 EAGB -- 4
-    # 8 TPAGB -- 5
-    # 9 POSTAGB -- 6
-    # 10 WD -- 0
-
-    tab['stage'][tab['stage'] == 1] = 0.
-    tab['stage'][tab['stage'] == 2] = 1.
-    tab['stage'][tab['stage'] == 3] = 2.
-    tab['stage'][tab['stage'] == 4] = 3.
-    tab['stage'][tab['stage'] == 5] = 3.
-    tab['stage'][tab['stage'] == 6] = 3.
-    tab['stage'][tab['stage'] == 7] = 4.
-    # don't trust cmd2.8's tp-agb
-    tab['stage'][tab['stage'] == 8] = 0.
-    tab['stage'][tab['stage'] == 9] = 6.
-    tab['stage'][tab['stage'] == 10] = 0.
-    itp, = np.nonzero(tab['slope'])
-    tab['stage'][itp] = 5.
+    """
+    Convert CMD (Leo's) stages to FSPS (Charlie's) phases in place.
+
+    Evolutionary phases defined in the isochrones:
+    0: main sequence
+    1: sub giant branch
+    2: red giant branch
+    3: red horizontal branch / red clump (core He burning)
+    4: early asymptotic giant branch
+    5: thermally-pulsating AGB (composition sets C-rich vs. O-rich)
+    6: Post-AGB
+    7: blue stragglers
+    8: blue horizontal branch
+    9: Wolf-Rayet (composition sets WC vs. WN)
+    -1: transition from RGB tip to HB
 
+    Leo's -- Charlie's
+    0 PMS -- 0
+    1 MS -- 0
+    2 SUBGIANT -- 1
+    3 RGB -- 2
+    4 HEB -- 3
+    5 RHEB -- 3
+    6 BHEB -- 3
+    7 EAGB -- 4
+    8 TPAGB -- 5 (don't trust cmd2.8's tp-agb: 0 unless slope != 0)
+    9 POSTAGB -- 6
+    10 WD -- 0
+    """
+    stage = tab['stage']
+    ilut, = np.nonzero(np.isin(stage, np.arange(len(PHASE_LUT))))
     # you never know...
-    tab['stage'][tab['stage'] > 10] = 0.
+    stage[stage > len(PHASE_LUT) - 1] = 0.
+    stage[ilut] = PHASE_LUT[stage[ilut].astype(int)]
+    stage[np.nonzero(tab['slope'])] = 5.
     return tab
 
 
-def isoch_for_fsps():
-    # these are the grid point Zs so cmd2.8 does not have to interpolate
-    # (Z=0.05 might have been added)
-    zs = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.004, 0.006, 0.008, 0.01,
-          0.014, 0.017,  0.02, 0.03, 0.04, 0.06]
-    header = '# log(age) Mini Mact logl logt logg Composition Phase\n'
-    fmt = '%.2f %.8f %.4f %.4f %.4f %.4f %.4f %.4f'
-
-    keys = ['logageyr', 'M_ini', 'M_act', 'logL', 'logT', 'logg', 'CO',
-            'stage']
-    agemin = 5.5
-    agemax = 10.13  # cmd2.8 will not take lage >= 10.13
-    for z in zs:
-        outfile = 'isoc_z{:.4f}.dat'.format(z)
-        tab = cmd.get_t_isochrones(agemin, agemax, 0.05, z,
-                                   model='parsec12s_r14')
-        tab = redefine_phase(tab)
-        _, aidx = np.unique(tab['logageyr'], return_index=True)
-        aidx = np.append(aidx, len(tab))
-        idxes = [np.arange(aidx[i], aidx[i+1]) for i in range(len(aidx)-1)]
-        with open(outfile, 'w') as outp:
-            for idx in idxes:
-                # stick in the header after each isochrone
-                outp.write(header)
-                np.savetxt(outp, tab[keys][idx], fmt=fmt)
-        print(('wrote {}'.format(outfile)))
-    return
+class CMDSource(object):
+    """Isochrones from CMD through ezpadova"""
+    def __init__(self, model='parsec12s_r14'):
+        self.model = model
+
+    def get_t_isochrones(self, logtmin, logtmax, dlogt, z):
+        from ezpadova import cmd
+        tab = cmd.get_t_isochrones(logtmin, logtmax, dlogt, z,
+                                   model=self.model)
+        keys = FSPS_KEYS + ['slope']
+        return np.rec.fromarrays([np.asarray(tab[k], dtype=float)
+                                  for k in keys], names=keys)
+
+
+class ArchiveSource(object):
+    """
+    Isochrone tables saved as .npy files in cache_dir.
+
+    If a table is not in cache_dir it is taken from fallback (e.g., a
+    CMDSource when online) and saved.
+    """
+    def __init__(self, cache_dir, fallback=None, model=None):
+        self.cache_dir = cache_dir
+        self.fallback = fallback
+        self.model = model or getattr(fallback, 'model', 'parsec12s_r14')
+
+    def cache_file(self, logtmin, logtmax, dlogt, z):
+        """name of the cached table"""
+        fname = '{0:s}_z{1:.4f}_t{2:.2f}_{3:.2f}_{4:.2f}.npy'.format(
+            self.model, z, logtmin, logtmax, dlogt)
+        return os.path.join(self.cache_dir, fname)
+
+    def cached_zs(self):
+        """Zs of the tables of self.model in cache_dir"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        pref = '{0:s}_z'.format(self.model)
+        return sorted(set([float(f[len(pref):].split('_t')[0])
+                           for f in os.listdir(self.cache_dir)
+                           if f.startswith(pref) and f.endswith('.npy')]))
+
+    @property
+    def zs(self):
+        """
+        Zs of the fallback (e.g., a GridSource) or else of the cached tables.
+        AttributeError if neither has any (isoch_for_fsps then uses ZS).
+        """
+        if hasattr(self.fallback, 'zs'):
+            return self.fallback.zs
+        zs = self.cached_zs()
+        if len(zs) == 0:
+            raise AttributeError('no Zs: no fallback grid and no tables of '
+                                 '{0:s} in {1:s}'.format(self.model,
+                                                         self.cache_dir))
+        return zs
+
+    def get_t_isochrones(self, logtmin, logtmax, dlogt, z):
+        cache_file = self.cache_file(logtmin, logtmax, dlogt, z)
+        if os.path.isfile(cache_file):
+            return np.load(cache_file).view(np.recarray)
+
+        assert self.fallback is not None, \
+            '{0:s} not found and no fallback source'.format(cache_file)
+        tab = self.fallback.get_t_isochrones(logtmin, logtmax, dlogt, z)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        np.save(cache_file, np.asarray(tab))
+        return tab
+
+
+class GridSource(object):
+    """
+    Isochrones interpolated from MATCH track archives
+    (see tracks.grid_index and interpolate.isochrones).
+
+    z must be a metallicity of the grid.
+    """
+    def __init__(self, match_loc, batch=50):
+        self.match_loc = match_loc
+        self.batch = batch
+        self.model = 'match_grid'
+        self._grid = None
+
+    def __getstate__(self):
+        # each process opens its own memory maps
+        state = self.__dict__.copy()
+        state['_grid'] = None
+        return state
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            from .tracks.grid_index import GridIndex
+            self._grid = GridIndex.from_dir(self.match_loc)
+        return self._grid
+
+    @property
+    def zs(self):
+        return list(np.unique(self.grid.Z))
+
+    def get_t_isochrones(self, logtmin, logtmax, dlogt, z):
+        from .interpolate.isochrones import IsochroneBuilder
+        assert np.min(np.abs(self.grid.Z - z)) < 1e-5, \
+            'Z={0:g} is not in the grid {1!s}'.format(z, self.zs)
+        logages = np.arange(logtmin, logtmax + 1e-6, dlogt)
+        builder = IsochroneBuilder.from_grid(self.grid, z)
+        return builder.isochrones(logages, batch=self.batch)
+
+
+def format_isochrones(tab, keys=FSPS_KEYS, header=FSPS_HEADER,
+                      fmt=FSPS_FMT):
+    """
+    The FSPS isochrone file of tab as one string: for each age (in the
+    order of tab, which is sorted by age) the header then one fmt line per
+    row. Same text as np.savetxt of each isochrone.
+    """
+    data = np.column_stack([np.asarray(tab[k], dtype=float) for k in keys])
+    _, aidx = np.unique(tab['logageyr'], return_index=True)
+    aidx = np.append(aidx, len(tab))
+    lines = []
+    for i in range(len(aidx) - 1):
+        lines.append(header)
+        lines.append(format_rows(data[aidx[i]:aidx[i + 1]], fmt=fmt))
+    return ''.join(lines)
+
+
+def write_fsps_isochrones(z, source=None, outdir=None, agemin=AGEMIN,
+                          agemax=AGEMAX, dlogt=DLOGT):
+    """write one Z of FSPS isochrones (isoc_z<z>.dat) from source"""
+    source = source or CMDSource()
+    outfile = os.path.join(outdir or os.getcwd(), 'isoc_z{:.4f}.dat'.format(z))
+    tab = source.get_t_isochrones(agemin, agemax, dlogt, z)
+    tab = redefine_phase(tab)
+    with open(outfile, 'w') as outp:
+        outp.write(format_isochrones(tab))
+    print(('wrote {}'.format(outfile)))
+    return outfile
+
+
+def isoch_for_fsps(zs=None, source=None, outdir=None, workers=1, **kwargs):
+    """
+    Write FSPS isochrones for each Z in zs (default: the source's grid
+    Zs or ZS) with workers processes. kwargs are passed to
+    write_fsps_isochrones.
+    """
+    source = source or CMDSource()
+    zs = zs or getattr(source, 'zs', ZS)
+    func = functools.partial(write_fsps_isochrones, source=source,
+                             outdir=outdir, **kwargs)
+    return parallel_map(func, zs, workers=workers)
+
+
+def main(argv):
+    """Main function for parsec2fsps"""
+    parser = argparse.ArgumentParser(description="Write FSPS isochrones")
+
+    parser.add_argument('-g', '--grid', type=str, default=None,
+                        help='interpolate isochrones from the MATCH track '
+                             'archives in this directory (offline)')
+
+    parser.add_argument('-c', '--cache', type=str, default=None,
+                        help='directory of cached isochrone tables')
+
+    parser.add_argument('--offline', action='store_true',
+                        help='with -c only use cached tables')
+
+    parser.add_argument('-z', '--zs', type=str, default=None,
+                        help='comma separated metallicities')
+
+    parser.add_argument('-o', '--outdir', type=str, default=None,
+                        help='output directory')
+
+    parser.add_argument('-n', '--workers', type=int, default=1,
+                        help='number of processes')
+
+    args = parser.parse_args(argv)
+
+    if args.grid is not None:
+        source = GridSource(args.grid)
+    else:
+        source = CMDSource()
+    if args.cache is not None:
+        fallback = None if args.offline else source
+        source = ArchiveSource(args.cache, fallback=fallback,
+                               model=source.model)
+
+    zs = None
+    if args.zs is not None:
+        zs = [float(z) for z in args.zs.split(',')]
+
+    isoch_for_fsps(zs=zs, source=source, outdir=args.outdir,
+                   workers=args.workers)
 
 
 if __name__ == "__main__":
-    isoch_for_fsps()
+    main(sys.argv[1:])
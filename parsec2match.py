@@ -9,15 +9,22 @@ This code calls padova_tracks:
 
 import argparse
 import os
+import shutil
 import sys
 
-from .fileio import load_input, tfm_indict
+from .fileio import load_config, input_defaults, ensure_dir, replace_ext
 from .match import TracksForMatch
-from .utils import add_version_info
+from .profiling import labelled, stage, start_report, stop_report
+from .utils import add_version_info, git_hash
 
 
 def parsec2match(infile, loud=False):
-    """Do an entire set and make the plots."""
+    """
+    Do an entire set and make the plots.
+
+    The time (and with memory_profile, the memory) of each stage (see
+    profiling) is written to log_dir/<infile>.report.json.
+    """
     if loud:
         print('setting prefixs')
     indict = load_parsec2match_inp(infile)
@@ -26,63 +33,76 @@ def parsec2match(infile, loud=False):
         loud = True
 
     prefixs = indict['prefixs']
-
-    for prefix in prefixs:
-        if loud:
-            print('Current mix: {}'.format(prefix))
-        indict['prefix'] = prefix
-
-        if loud:
-            print('loading Tracks')
-        tfm = TracksForMatch(**indict)
-
-        if loud:
-            print('defining eeps')
-        define_eeps(tfm)
-
-        # do the match interpolation (produce match output files)
-        if indict['do_interpolation']:
+    log_dir = indict['log_dir'] or os.path.join(indict['tracks_dir'], 'logs')
+    report = start_report(profile_stages=indict['profile_stages'],
+                          profile_dir=os.path.join(log_dir, 'profiles'),
+                          profiler=indict['profiler'],
+                          memory=indict['memory_profile'])
+    try:
+        for prefix in prefixs:
             if loud:
-                print('doing match interpolation')
-            indict['flag_dict'] = tfm.match_interpolation()
-
+                print('Current mix: {}'.format(prefix))
+            indict['prefix'] = prefix
+
+            with labelled(prefix=prefix):
+                if loud:
+                    print('loading Tracks')
+                with stage('load'):
+                    tfm = TracksForMatch(**indict)
+
+                if indict['stream']:
+                    # load, define eeps, interpolate, and write one track
+                    # at a time
+                    if loud:
+                        print('streaming tracks')
+                    with stage('match_interpolation'):
+                        if indict['do_interpolation']:
+                            indict['flag_dict'] = \
+                                tfm.match_interpolation(tfm.stream_tracks())
+                        else:
+                            for _ in tfm.stream_tracks():
+                                pass
+                    continue
+
+                if loud:
+                    print('defining eeps')
+                with stage('define_eeps'):
+                    define_eeps(tfm)
+
+                # do the match interpolation (produce match output files)
+                if indict['do_interpolation']:
+                    if loud:
+                        print('doing match interpolation')
+                    with stage('match_interpolation'):
+                        indict['flag_dict'] = tfm.match_interpolation()
+    finally:
+        stop_report()
+
+    ensure_dir(log_dir)
+    report_file = replace_ext(os.path.split(infile)[1], '.report.json')
+    indict['report'] = report.write(os.path.join(log_dir, report_file),
+                                    input_file=os.path.abspath(infile),
+                                    git_hash=git_hash())
+    if loud:
+        print('wrote {0:s}'.format(indict['report']))
     return indict
 
 
 def load_parsec2match_inp(infile):
     """
-    Find which prefixes (Z, Y mixes) to run.
+    Load and check the input file (see fileio.schema).
 
-    based on inputs.prefix or inputs.prefixs.
+    Find which prefixes (Z, Y mixes) to run based on inputs.prefixs
+    (track sub directory names, or all of them with 'all').
     """
-    # Prefixs = track sub directory names
-    indict = load_input(infile, default_dict=tfm_indict())
-    prefs = indict['prefixs']
-
-    assert prefs is not None, 'prefixs (track subdirectories) not set'
-
-    # tracks location
-    tracks_dir = indict['tracks_dir']
-
-    if prefs == 'all':
-        # find all dirs in tracks dir skip .DS_Store and crap
-        prefixs = [d for d in os.listdir(tracks_dir)
-                   if os.path.isdir(os.path.join(tracks_dir, d)) and
-                   not d.startswith('.')]  # FU .DS_Store
-    else:
-        # some subset listed in the input file (seperated by comma)
-        prefixs = prefs
-        if isinstance(prefixs, str):
-            prefixs = [prefs]
-
-    assert type(prefixs) == list, 'prefixs must be a list'
-    indict['prefixs'] = prefixs
-    return indict
+    return load_config(infile)
 
 
 def define_eeps(tfm, hb=False):
     """Add the ptcris to the tracks."""
-    [tfm.define_eep_stages(track) for track in tfm.tracks]
+    for track in tfm.tracks:
+        with stage('define_eep_stages', track=track.name):
+            tfm.define_eep_stages(track)
     # line = ''
 
     # define the eeps
@@ -109,10 +129,10 @@ def main(argv):
     args = parser.parse_args(argv)
 
     if args.input:
-        indict = tfm_indict()
+        indict = input_defaults()
         # if you are lazy and don't edit inputs/tracks4match.json
         for k, v in indict.items():
-            if k.endswith('dir'):
+            if k.endswith('dir') and k != 'cache_dir':
                 indict[k] = os.getcwd()
         indict['prefixs'] = [l for l in os.listdir('.') if os.path.isdir(l)]
 
@@ -127,9 +147,10 @@ def main(argv):
         return
     indict = parsec2match(args.infile, loud=args.loud)
 
+    # the .info file goes next to the run report
     fname = add_version_info(args.infile)
-    os.system('mv {} {}'.format(fname,
-                                os.path.join(indict['tracks_dir'], 'logs')))
+    log_dir = os.path.split(indict['report'])[0]
+    shutil.move(fname, os.path.join(log_dir, os.path.split(fname)[1]))
 
 
 if __name__ == '__main__':
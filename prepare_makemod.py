@@ -41,8 +41,8 @@ def prepare_makemod(prefixs=None, tracks_dir=None, sub=None):
     prefixs = np.array(prefixs)[np.argsort(allzs)]
 
     # limits of metallicity grid
-    modelIZmin = np.int(np.ceil(np.log10(np.min(zs) / zsun) * 10))
-    modelIZmax = np.int(np.floor(np.log10(np.max(zs) / zsun) * 10))
+    modelIZmin = int(np.ceil(np.log10(np.min(zs) / zsun) * 10))
+    modelIZmax = int(np.floor(np.log10(np.max(zs) / zsun) * 10))
 
     # metallicities
     zs_str = ','.join(np.array(zs, dtype=str))
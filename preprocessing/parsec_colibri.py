@@ -1,17 +1,19 @@
 """Modules to attach COLIBRI to PARSEC"""
 import argparse
+import functools
 import os
 import sys
 
 import matplotlib.pyplot as plt
 import seaborn
 import numpy as np
-import pandas as pd
 
-from ..config import logL, logT, mass, age
-from ..fileio import get_files, get_dirs, ensure_dir
-from ..utils import replace_, get_zy
-from ..tracks.track import Track, AGBTrack
+from ..config import logL, logT, mass, age, max_plot_points
+from ..fileio import get_files, get_dirs, ensure_dir, write_table
+from ..graphics.utils import decimate, tp_boundaries
+from ..utils import replace_, get_zy, parallel_map, nearest2d
+from ..tracks.cache import save_cache
+from ..tracks.track import Track, AGBTrack, scan_header
 
 seaborn.set()
 
@@ -74,10 +76,15 @@ def _getparsectracks(prc_track_loc, z, maxmass):
     return prc_tracks
 
 
-def combine_parsec_colibri(diag=False, agb_track_loc=None, prc_track_loc=None,
-                           first_tp_loc=None, outputloc=None, overwrite=False):
-    """Combine PARSEC and COLIRBI (call attach)"""
-    line = ''
+def combine_jobs(agb_track_loc=None, prc_track_loc=None, first_tp_loc=None,
+                 outputloc=None, overwrite=False):
+    """
+    List the (parsec_track, colibri_track, onetpm, output) to attach.
+
+    The overwrite check is done here, before any stitching, so each output
+    is owned by exactly one job.
+    """
+    jobs = []
     firsttps = get_files(first_tp_loc, '*.INP')
     for firsttp in firsttps:
         onetp = FirstTP(firsttp)
@@ -109,7 +116,6 @@ def combine_parsec_colibri(diag=False, agb_track_loc=None, prc_track_loc=None,
             os.path.join(outputloc,
                          os.path.split(os.path.split(prc_tracks[0])[0])[1])
         ensure_dir(new_track_dir)
-        # fmt = 'Z{:.4f}_Y{:.3f}_M{:.3f}.dat'
         print(new_track_dir)
         for mass_ in common_masses:
             iprc, = np.where(prc_masses == mass_)[0]
@@ -117,58 +123,108 @@ def combine_parsec_colibri(diag=False, agb_track_loc=None, prc_track_loc=None,
             iotp, = np.where(otp_masses == mass_)[0]
 
             parsec_track = prc_tracks[iprc]
-            colibri_track = all_agb_tracks[iagb]
-            onetpm = onetp.data[iotp]
-
-            output = os.path.join(new_track_dir, parsec_track + '.TPAGB')
+            output = os.path.join(new_track_dir,
+                                  os.path.split(parsec_track)[1] + '.TPAGB')
             if os.path.isfile(output) and not overwrite:
                 print(('not overwriting {}'.format(output)))
                 continue
+            jobs.append((parsec_track, all_agb_tracks[iagb],
+                         onetp.data[iotp], output))
+
+    outputs = [j[-1] for j in jobs]
+    assert len(set(outputs)) == len(outputs), 'Duplicate output files'
+    return jobs
+
+
+def stitch(job, diag=False, cache=False):
+    """load the PARSEC and COLIBRI tracks of a combine_jobs job and attach"""
+    parsec_track, colibri_track, onetpm, output = job
+    # load PARSEC Track
+    try:
+        parsec = Track(parsec_track)
+    except ValueError as e:
+        print(('Problem with {}'.format(parsec_track)))
+        print(e)
+        return ''
+    # Load COLIBRI Track
+    colibri = AGBTrack(colibri_track, cache=cache)
+    # First two lines are 0 age
+    colibri.data[age][1] = colibri.data[age][2] / 2
+    return attach(parsec, colibri, onetpm, output, diag=diag, cache=cache)
 
-            # load PARSEC Track
-            try:
-                parsec = Track(parsec_track)
-            except ValueError as e:
-                print(('Problem with {}'.format(parsec_track)))
-                print(e)
-                continue
-            # Load COLIBRI Track
-            colibri = AGBTrack(colibri_track)
-            # First two lines are 0 age
-            colibri.data[age].iloc[1] = colibri.data[age].iloc[2]/2
-            # fname = fmt.format(parsec.Z, parsec.Y, mass_)
-            line += attach(parsec, colibri, onetpm, output, diag=diag)
-        if diag:
-            with open('colibri_attach.log', 'w') as outp:
-                outp.write(line)
+
+def combine_parsec_colibri(diag=False, agb_track_loc=None, prc_track_loc=None,
+                           first_tp_loc=None, outputloc=None, overwrite=False,
+                           workers=1, cache=False):
+    """
+    Combine PARSEC and COLIRBI (call attach)
+
+    Each (Z, mass) is stitched independently, with workers > 1 they are
+    shared among that many processes. The diagnostic lines are in the
+    order of combine_jobs regardless.
+    """
+    jobs = combine_jobs(agb_track_loc=agb_track_loc,
+                        prc_track_loc=prc_track_loc,
+                        first_tp_loc=first_tp_loc, outputloc=outputloc,
+                        overwrite=overwrite)
+    lines = parallel_map(functools.partial(stitch, diag=diag, cache=cache),
+                         jobs, workers=workers)
+    if diag:
+        with open('colibri_attach.log', 'w') as outp:
+            outp.write(''.join(lines))
+    return lines
 
 
-def radius(x1, y1, x2, y2):
-    """dist = np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2) return argmin, min."""
-    dist = np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-    return np.argmin(dist), np.min(dist)
+# COLIBRI columns kept in the stitched track
+STITCH_COLUMNS = ['step', 'status', 'NTP', 'M_c', 'PHI_TP', 'C/O', 'Pmod',
+                  'P1', 'P0']
 
 
-def attach(parsec, colibri, onetpm, output, diag=True):
+def stitch_data(pdata, cdata, icmatch):
+    """
+    PARSEC record array pdata followed by the COLIBRI data cdata from
+    icmatch as one record array with the PARSEC columns and STITCH_COLUMNS.
+    Columns missing from either piece are nan.
+    """
+    pcols = list(pdata.dtype.names)
+    ccols = list(cdata.dtype.names)
+    columns = pcols + [c for c in STITCH_COLUMNS if c not in pcols]
+
+    nprc = len(pdata)
+    all_data = np.full(nprc + len(cdata) - icmatch, np.nan,
+                       dtype=[(c, float) for c in columns])
+    for col in columns:
+        if col in pcols:
+            all_data[col][:nprc] = pdata[col]
+        # COLIBRI mass is the M column (as in Track.load_track)
+        ccol = 'M' if col == mass and 'M' in ccols else col
+        if ccol in ccols:
+            all_data[col][nprc:] = cdata[ccol][icmatch:]
+    return all_data.view(np.recarray)
+
+
+def attach(parsec, colibri, onetpm, output, diag=True, cache=False):
     """
     Adopt PARSEC until a point in the TP-AGB with the same luminosity as 1TP
     and a Teff differing by less than 100 K.
+
+    If cache (True or a directory) the stitched track is also put in the
+    track cache (see tracks.cache) so loading it is not a text parse.
     """
     line = ''
     assert parsec.Z == colibri.Z == onetpm['z0'], 'Metallicity mismatch'
     assert parsec.mass == colibri.mass, 'Mass mismatch'
     ifin = -1
     print(('parsec: {0:s} + colibri: {1:s}'.format(parsec.name, colibri.name)))
-    ipmatch, _ = radius(parsec.data[:ifin][logT], parsec.data[:ifin][logL],
-                        onetpm[logT], onetpm[logL])
+    ipmatch, _ = nearest2d(parsec.data[:ifin][logT], parsec.data[:ifin][logL],
+                           onetpm[logT], onetpm[logL])
 
     colibri.data[age] += parsec.data[ipmatch][age]
 
     inds, = np.nonzero(colibri.data['NTP'] < 2)
 
-    im, _ = radius(colibri.data[logT].iloc[inds],
-                   colibri.data[logL].iloc[inds],
-                   onetpm[logT], onetpm[logL])
+    im, _ = nearest2d(colibri.data[logT][inds], colibri.data[logL][inds],
+                      onetpm[logT], onetpm[logL])
     icmatch = inds[im]
 
     ntp = colibri.data['NTP'][icmatch]
@@ -176,35 +232,32 @@ def attach(parsec, colibri, onetpm, output, diag=True):
         print(('Warning: might be missing some TP-AGB: ',
               'Colibri matched index={}, NTP={}'.format(icmatch, ntp)))
 
-    lmatch = parsec.data[logL][ipmatch] - colibri.data[logL].iloc[icmatch]
+    lmatch = parsec.data[logL][ipmatch] - colibri.data[logL][icmatch]
     tmatch = 10 ** parsec.data[logT][ipmatch] - \
-        10 ** colibri.data[logT].iloc[icmatch]
+        10 ** colibri.data[logT][icmatch]
     if np.abs(tmatch) > 100 or np.abs(lmatch) > 0.1:
         err = 'bad 1TP? {0} {1} {2} {3}\n'.format(parsec.Z, parsec.mass,
                                                   lmatch, tmatch)
         print(err)
         return err
-    ptrack = pd.DataFrame(parsec.data[:ipmatch - 1])
-    ctrack = pd.DataFrame(colibri.data.iloc[icmatch:])
-    # This allows pandas properly append the mass column.
-    # (Done in tracks.track.Track.load_track)
-    ctrack[mass] = ctrack['M']
-
-    all_data = pd.DataFrame()
-    all_data = all_data.append(ptrack, ignore_index=True)
-    all_data = all_data.append(ctrack, ignore_index=True)
-    columns = ptrack.columns
-    columns = np.concatenate([columns, ['step', 'status', 'NTP', 'M_c',
-                                        'PHI_TP', 'C/O', 'Pmod', 'P1', 'P0']])
+    all_data = stitch_data(parsec.data[:ipmatch - 1], colibri.data, icmatch)
     assert np.sum(np.isnan(all_data[mass])) == 0, \
         'nans in the {0:s} column. Would write to: {1:s}'.format(mass, output)
 
-    all_data.to_csv(output, sep=' ', na_rep='nan', columns=columns,
-                    index=False)
+    # write then rename so a partial file is never left at output
+    tmp = output + '.tmp'
+    write_table(tmp, all_data)
+    os.replace(tmp, output)
+    if cache:
+        # what Track(output, cache=cache) would parse
+        save_cache(output, all_data, meta={'header': [''], 'info': {},
+                                           'header_scan': scan_header(['']),
+                                           'col_keys': all_data.dtype.names},
+                   cache_dir=None if cache is True else cache)
     # print('wrote to {}'.format(output))
     if diag:
         # print('PARSEC idx: {} COLIBRI idx: {}'.format(ipmatch, icmatch))
-        line += print_diffs(colibri.data.iloc[icmatch],
+        line += print_diffs(colibri.data[icmatch],
                             parsec.data[:ifin][ipmatch])
         plot_hrd(all_data, colibri, parsec, icmatch, ipmatch, onetpm, output,
                  lmatch=lmatch, tmatch=tmatch)
@@ -216,24 +269,28 @@ def plot_hrd(all_data, colibri, parsec, icmatch, ipmatch, onetpm, output,
     """diagnostic HRD of the parsec and colibri attach point"""
     if outdir is None:
         outdir = 'colibi_parsec'
-    if not os.path.isdir(outdir):
-        os.mkdir(outdir)
+    ensure_dir(outdir)
     output = os.path.join(outdir, *os.path.split(output)[1:])
 
     fig, ax = plt.subplots()
     xcol, ycol = logT, logL
     lab = ['colibri', 'parsec']
+    # the point budget is shared by the three lines
+    npoints = max_plot_points and max_plot_points // 3
     ax.plot(onetpm[xcol], onetpm[ycol], 'o', ms=10, alpha=0.4, label='1TP')
-    ax.plot(all_data[xcol], all_data[ycol], lw=4, alpha=0.1, color='k')
+    dinds = decimate(all_data[xcol], all_data[ycol], npoints,
+                     keep=tp_boundaries(all_data))
+    ax.plot(all_data[xcol][dinds], all_data[ycol][dinds], lw=4, alpha=0.1,
+            color='k')
     for i, (track, idx) in enumerate(zip([colibri, parsec],
                                          [icmatch, ipmatch])):
         xdata = track.data[xcol]
         ydata = track.data[ycol]
-        l, = ax.plot(xdata, ydata, label=lab[i], alpha=0.6, lw=2)
-        try:
-            ax.plot(xdata[idx], ydata[idx], 'o', color=l.get_color())
-        except:
-            ax.plot(xdata.iloc[idx], ydata.iloc[idx], 'o', color=l.get_color())
+        keep = np.append(tp_boundaries(track.data), idx)
+        dinds = decimate(xdata, ydata, npoints, keep=keep)
+        l, = ax.plot(xdata[dinds], ydata[dinds], label=lab[i], alpha=0.6,
+                     lw=2)
+        ax.plot(xdata[idx], ydata[idx], 'o', color=l.get_color())
 
     ax.set_xlim(np.max(colibri.data[xcol]), np.min(colibri.data[xcol]))
     ax.set_ylim(np.min(colibri.data[ycol]), np.max(colibri.data[ycol]))
@@ -278,6 +335,13 @@ def main(argv):
     parser.add_argument('--overwrite', action='store_true',
                         help='overwrite existing output files')
 
+    parser.add_argument('-n', '--workers', type=int, default=1,
+                        help='number of processes')
+
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help='also write the stitched tracks to the track '
+                             'cache')
+
     parser.add_argument('-d', '--diag', action='store_true',
                         help='toggle diagnostics')
 
@@ -297,7 +361,9 @@ def main(argv):
                            first_tp_loc=args.first_tp_loc,
                            outputloc=args.outputloc,
                            diag=args.diag,
-                           overwrite=args.overwrite)
+                           overwrite=args.overwrite,
+                           workers=args.workers,
+                           cache=args.cache)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,350 @@
+"""
+Stage timers and profiles of a parsec2match run.
+
+    with stage('interpolate', track=track.name):
+        ...
+
+times the block when a RunReport is active (start_report) and does nothing
+otherwise, so library calls are not slowed down. Each timing is recorded
+with its labels (e.g., prefix, track, segment) and the report aggregates
+them per stage, per prefix, and per track. Stages may nest (e.g.,
+interpolate_segment is inside interpolate), their totals overlap.
+
+Stages listed in profile_stages (or 'all') are also run under cProfile (or
+pyinstrument) and each call is dumped to profile_dir.
+
+With memory='tracemalloc' (python allocations, slows the run down) or
+memory='rss' (resident set size sampled by a thread every rss_interval s)
+each timing also has mem_peak (the highest usage during the stage),
+mem_used (mem_peak above the usage when the stage started), and mem_delta
+(usage retained after the stage) in MB.
+"""
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+__all__ = ['RunReport', 'current_report', 'labelled', 'record', 'stage',
+           'start_report', 'stop_report']
+
+PROFILERS = ['cprofile', 'pyinstrument']
+MEMORY = ['tracemalloc', 'rss']
+MB = 1024. ** 2
+
+_REPORT = None
+
+
+def _stats(seconds):
+    seconds = np.asarray(seconds)
+    return {'n': len(seconds), 'total': float(np.sum(seconds)),
+            'mean': float(np.mean(seconds)), 'min': float(np.min(seconds)),
+            'max': float(np.max(seconds))}
+
+
+def rss():
+    """resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm', 'r') as inp:
+            return int(inp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # no /proc: the high-water mark is the best there is
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class TracemallocMemory(object):
+    """current and peak python allocations (bytes)"""
+    def __init__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+
+    def usage(self):
+        """(current, peak since the last reset_peak)"""
+        return tracemalloc.get_traced_memory()
+
+    def reset_peak(self):
+        tracemalloc.reset_peak()
+
+    def close(self):
+        if self.started:
+            tracemalloc.stop()
+
+
+class RssMemory(threading.Thread):
+    """current and peak resident set size (bytes) sampled every interval s"""
+    def __init__(self, interval=0.01):
+        threading.Thread.__init__(self, daemon=True)
+        self.interval = interval
+        self.peak = rss()
+        self._stop_event = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, rss())
+
+    def usage(self):
+        """(current, peak since the last reset_peak)"""
+        current = rss()
+        self.peak = max(self.peak, current)
+        return current, self.peak
+
+    def reset_peak(self):
+        self.peak = rss()
+
+    def close(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RunReport(object):
+    """
+    Collect stage timings (and profiles) of a run.
+
+    Parameters
+    ----------
+    profile_stages : list of str
+        stages to profile, ['all'] for every stage
+    profile_dir : str
+        where to write the profiles
+    profiler : str
+        cprofile (.prof files, see pstats or snakeviz) or pyinstrument
+        (.html files, if installed)
+    memory : str
+        also account memory of each stage with tracemalloc or rss sampling
+    rss_interval : float
+        seconds between rss samples
+    """
+    def __init__(self, profile_stages=None, profile_dir=None,
+                 profiler='cprofile', memory=None, rss_interval=0.01):
+        self.records = []
+        self.labels = {}
+        self.started = time.time()
+        self.profile_stages = profile_stages or []
+        self.profile_dir = profile_dir or os.getcwd()
+        self.profiler = profiler
+        self._profiling = False
+        self._ncalls = collections.Counter()
+        self.memory = memory
+        self.peak_memory = 0.
+        self._mem = None
+        self._mem_frames = []
+
+        err = 'profiler must be one of {0!s}'.format(PROFILERS)
+        assert profiler in PROFILERS, err
+        if profiler == 'pyinstrument' and len(self.profile_stages) > 0:
+            try:
+                import pyinstrument
+            except ImportError:
+                raise ImportError('profiler pyinstrument is not installed')
+
+        err = 'memory must be one of {0!s}'.format(MEMORY)
+        assert memory is None or memory in MEMORY, err
+        if memory == 'tracemalloc':
+            self._mem = TracemallocMemory()
+        elif memory == 'rss':
+            self._mem = RssMemory(interval=rss_interval)
+
+    def record(self, name, seconds, **labels):
+        """add a timing of stage name"""
+        rec = dict(self.labels)
+        rec.update(labels)
+        rec['stage'] = name
+        rec['seconds'] = float(seconds)
+        self.records.append(rec)
+
+    def _profiles(self, name):
+        if self._profiling:
+            # one profiler at a time: the outer stage profile has this one
+            return False
+        return name in self.profile_stages or 'all' in self.profile_stages
+
+    def _start_profile(self):
+        if self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+            prof = Profiler()
+            prof.start()
+        else:
+            prof = cProfile.Profile()
+            prof.enable()
+        self._profiling = True
+        return prof
+
+    def _stop_profile(self, prof, name):
+        self._profiling = False
+        self._ncalls[name] += 1
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir, exist_ok=True)
+        outfile = os.path.join(self.profile_dir, '{0:s}_{1:04d}'.format(
+            name, self._ncalls[name]))
+        if self.profiler == 'pyinstrument':
+            prof.stop()
+            with open(outfile + '.html', 'w') as out:
+                out.write(prof.output_html())
+        else:
+            prof.disable()
+            prof.dump_stats(outfile + '.prof')
+
+    def _start_memory(self):
+        current, peak = self._mem.usage()
+        # the enclosing stages keep their peak before it is reset
+        for frame in self._mem_frames:
+            frame[1] = max(frame[1], peak)
+        self._mem.reset_peak()
+        self._mem_frames.append([current, current])
+
+    def _stop_memory(self):
+        current, peak = self._mem.usage()
+        start, fpeak = self._mem_frames.pop()
+        fpeak = max(fpeak, peak)
+        for frame in self._mem_frames:
+            frame[1] = max(frame[1], fpeak)
+        self._mem.reset_peak()
+        self.peak_memory = max(self.peak_memory, fpeak / MB)
+        return {'mem_peak': fpeak / MB, 'mem_used': (fpeak - start) / MB,
+                'mem_delta': (current - start) / MB}
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        """time (and maybe profile and account memory of) the block"""
+        prof = None
+        if self._profiles(name):
+            prof = self._start_profile()
+        if self._mem is not None:
+            self._start_memory()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            if self._mem is not None:
+                labels.update(self._stop_memory())
+            if prof is not None:
+                self._stop_profile(prof, name)
+            self.record(name, seconds, **labels)
+
+    def close(self):
+        """stop memory accounting"""
+        if self._mem is not None:
+            self.peak_memory = max(self.peak_memory,
+                                   self._mem.usage()[1] / MB)
+            self._mem.close()
+            self._mem = None
+
+    def summary(self):
+        """
+        Aggregate the records.
+
+        Returns
+        -------
+        dict of
+        wall : seconds since the report started
+        stages : {stage: stats}
+        prefixs : {prefix: {stage: stats}}
+        tracks : {prefix: {track: {stage: total seconds}}}
+        where stats are n, total, mean, min, max seconds.
+        With memory accounting also
+        peak_memory : highest usage of the run (MB)
+        memory : {stage: {peak, used: highest mem_peak, mem_used,
+                          delta: total mem_delta}} (MB)
+        """
+        stages = collections.defaultdict(list)
+        prefixs = collections.defaultdict(lambda: collections.defaultdict(list))
+        tracks = collections.defaultdict(
+            lambda: collections.defaultdict(collections.Counter))
+        for rec in self.records:
+            name = rec['stage']
+            stages[name].append(rec['seconds'])
+            prefix = rec.get('prefix')
+            if prefix is not None:
+                prefixs[prefix][name].append(rec['seconds'])
+            if 'track' in rec:
+                tracks[prefix or ''][rec['track']][name] += rec['seconds']
+
+        summary = {'wall': time.time() - self.started,
+                   'stages': {k: _stats(v) for k, v in stages.items()},
+                   'prefixs': {p: {k: _stats(v) for k, v in d.items()}
+                               for p, d in prefixs.items()},
+                   'tracks': {p: {t: dict(c) for t, c in d.items()}
+                              for p, d in tracks.items()}}
+        if self.memory is not None:
+            memory = {}
+            for rec in self.records:
+                if 'mem_peak' not in rec:
+                    continue
+                mem = memory.setdefault(rec['stage'], {'peak': 0., 'used': 0.,
+                                                       'delta': 0.})
+                mem['peak'] = max(mem['peak'], rec['mem_peak'])
+                mem['used'] = max(mem['used'], rec['mem_used'])
+                mem['delta'] += rec['mem_delta']
+            summary['memory'] = memory
+            summary['peak_memory'] = self.peak_memory
+        return summary
+
+    def write(self, filename, **info):
+        """write info, the summary, and the records to a json file"""
+        report = {'started': time.strftime('%Y-%m-%d %H:%M:%S',
+                                           time.localtime(self.started))}
+        report.update(info)
+        report.update(self.summary())
+        report['records'] = self.records
+        with open(filename, 'w') as out:
+            json.dump(report, out, indent=1)
+        return filename
+
+
+def start_report(**kwargs):
+    """start (and return) the active RunReport, kwargs go to RunReport"""
+    global _REPORT
+    _REPORT = RunReport(**kwargs)
+    return _REPORT
+
+
+def stop_report():
+    """stop and return the active RunReport (or None)"""
+    global _REPORT
+    report, _REPORT = _REPORT, None
+    if report is not None:
+        report.close()
+    return report
+
+
+def current_report():
+    """the active RunReport or None"""
+    return _REPORT
+
+
+def stage(name, **labels):
+    """context manager to time a block as stage name, if a report is active"""
+    if _REPORT is None:
+        return contextlib.nullcontext()
+    return _REPORT.stage(name, **labels)
+
+
+def record(name, seconds, **labels):
+    """add a timing measured elsewhere (e.g., in a worker process)"""
+    if _REPORT is not None:
+        _REPORT.record(name, seconds, **labels)
+
+
+@contextlib.contextmanager
+def labelled(**labels):
+    """add labels (e.g., prefix) to the records made in the block"""
+    if _REPORT is None:
+        yield
+        return
+    old = dict(_REPORT.labels)
+    _REPORT.labels.update(labels)
+    try:
+        yield
+    finally:
+        _REPORT.labels = old
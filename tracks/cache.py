@@ -0,0 +1,84 @@
+'''
+Binary cache of parsed track files.
+
+A cached track is <name>.<tag>.npy (the data record array) and
+<name>.<tag>.json (everything else the parse produced, e.g., header lines),
+where tag names the reader (e.g., track or agb), in a
+.track_cache directory next to the source file or in cache_dir. The json
+also records the source size and mtime; if either changed the cache is
+stale and is ignored.
+'''
+import json
+import os
+
+import numpy as np
+
+__all__ = ['cache_files', 'load_cache', 'save_cache']
+
+CACHE_DIR = '.track_cache'
+# 2: track meta has header_scan (see tracks.track.scan_header)
+CACHE_VERSION = 2
+
+
+def cache_files(filename, cache_dir=None, tag='track'):
+    """(npy, json) cache filenames of filename"""
+    base, name = os.path.split(os.path.abspath(filename))
+    cache_dir = cache_dir or os.path.join(base, CACHE_DIR)
+    cache_base = os.path.join(cache_dir, '{0:s}.{1:s}'.format(name, tag))
+    return cache_base + '.npy', cache_base + '.json'
+
+
+def _source_stat(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def load_cache(filename, cache_dir=None, tag='track'):
+    """
+    Load the cached data of filename.
+
+    Returns
+    -------
+    data (np.recarray), meta (dict) or None, None if there is no cache or
+    it is stale.
+    """
+    npy, meta_file = cache_files(filename, cache_dir=cache_dir, tag=tag)
+    if not os.path.isfile(meta_file) or not os.path.isfile(npy):
+        return None, None
+
+    with open(meta_file, 'r') as inp:
+        meta = json.load(inp)
+    if meta.get('version') != CACHE_VERSION or \
+            meta.get('source') != _source_stat(filename):
+        return None, None
+
+    data = np.load(npy)
+    if data.dtype.names is not None:
+        data = data.view(np.recarray)
+    return data, meta['meta']
+
+
+def save_cache(filename, data, meta=None, cache_dir=None, tag='track'):
+    """
+    Cache data (and a json-able dict meta) of filename.
+
+    The files are written then renamed so a reader never sees a partial
+    cache.
+    """
+    npy, meta_file = cache_files(filename, cache_dir=cache_dir, tag=tag)
+    outdir = os.path.split(npy)[0]
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir, exist_ok=True)
+
+    tmp = npy + '.{0:d}.tmp'.format(os.getpid())
+    with open(tmp, 'wb') as out:
+        np.save(out, np.asarray(data))
+    os.replace(tmp, npy)
+
+    index = {'version': CACHE_VERSION, 'source': _source_stat(filename),
+             'meta': meta or {}}
+    tmp = meta_file + '.{0:d}.tmp'.format(os.getpid())
+    with open(tmp, 'w') as out:
+        json.dump(index, out)
+    os.replace(tmp, meta_file)
+    return npy
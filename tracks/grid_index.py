@@ -0,0 +1,254 @@
+'''
+Random access to a grid of MATCH (EEP-aligned) tracks by (Z, mass, EEP).
+
+Every MATCH track has the same number of points between EEPs, so the row of
+an EEP is the same in every track (Eep.eep_offsets). GridIndex keeps one
+table of (Z, mass, hb, offset, nrows) for all tracks of all archives and
+answers queries with fancy indexing into the memory-mapped archives, no
+Track objects are made.
+
+e.g., logL at MS_TO for every mass at Z=0.014:
+    grid = GridIndex.from_dir('tracks/match')
+    masses, logl = grid.eep_values('MS_TO', logL, Z=0.014)
+'''
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from ..config import logL, logT, mass, age
+from ..fileio import get_files, get_dirs, ensure_dir
+from ..fileio.match_archive import ArchiveWriter, MatchArchive, archive_name
+from ..utils import get_zy
+
+__all__ = ['GridIndex']
+
+# config column names to MATCH archive column names
+COLUMN_ALIASES = {age: 'logAge', mass: 'Mass', logT: 'logTe'}
+
+
+class GridIndex(object):
+    """Index of MATCH track archives (one per prefix)"""
+    def __init__(self, archives):
+        self.archives = [a if isinstance(a, MatchArchive) else MatchArchive(a)
+                         for a in archives]
+        assert len(self.archives) > 0, 'No MATCH archives'
+
+        arc = self.archives[0]
+        self.columns = arc.columns
+        self.eep_list = arc.index['eep_list']
+        self.eep_list_hb = arc.index['eep_list_hb']
+        self.eep_offsets = arc.eep_offsets
+        self.eep_offsets_hb = arc.eep_offsets_hb
+
+        def stack(attr):
+            return np.concatenate([a.__getattribute__(attr)
+                                   for a in self.archives])
+
+        self.Z = stack('Zs')
+        self.mass = stack('masses')
+        self.hb = stack('hbs')
+        self.offset = stack('offsets')
+        self.nrows = stack('nrows')
+        self.names = stack('names')
+        self.iarchive = np.concatenate([np.zeros(len(a), dtype=int) + i
+                                        for i, a in
+                                        enumerate(self.archives)])
+
+    def __len__(self):
+        return len(self.Z)
+
+    @classmethod
+    def from_dir(cls, match_loc, search='match_*.json'):
+        """load all archives in match_loc and its subdirectories"""
+        archives = get_files(match_loc, search)
+        for d in get_dirs(match_loc):
+            if os.path.isdir(d):
+                archives.extend(get_files(d, search))
+        return cls(sorted(archives))
+
+    @classmethod
+    def from_match_dirs(cls, match_dirs, outdir=None, overwrite=False):
+        """
+        Make (if needed) an archive of the match_*.dat files in each
+        match_dirs and load them.
+
+        Parameters
+        ----------
+        match_dirs : list
+            directories of MATCH tracks, one per prefix
+        outdir : str
+            where to write the archives (default: in each match_dir)
+        overwrite : bool
+            remake the archive even if it exists
+        """
+        archives = []
+        for match_dir in match_dirs:
+            prefix = os.path.split(os.path.normpath(match_dir))[1]
+            base = os.path.join(outdir or match_dir, 'match_' + prefix)
+            ensure_dir(os.path.split(base)[0])
+            if overwrite or not os.path.isfile(base + '.json'):
+                text_to_archive(match_dir, base, prefix=prefix)
+            archives.append(base)
+        return cls(archives)
+
+    def column(self, col):
+        """archive column index by config or archive name (logL is Mbol)"""
+        col = COLUMN_ALIASES.get(col, col)
+        if col == logL:
+            col = 'Mbol'
+        return self.columns.index(col)
+
+    def select(self, Z=None, mass=None, hb=False, tol=1e-5):
+        """
+        Indices of tracks sorted by Z then mass.
+
+        Z, mass : float or array (None: all)
+        hb : bool or None (None: both)
+        """
+        sel = np.ones(len(self), dtype=bool)
+        if Z is not None:
+            Z = np.atleast_1d(Z)
+            sel &= np.any(np.abs(self.Z[:, None] - Z[None, :]) < tol, axis=1)
+        if mass is not None:
+            mass = np.atleast_1d(mass)
+            sel &= np.any(np.abs(self.mass[:, None] - mass[None, :]) < tol,
+                          axis=1)
+        if hb is not None:
+            sel &= self.hb == hb
+        inds, = np.nonzero(sel)
+        return inds[np.lexsort((self.mass[inds], self.Z[inds]))]
+
+    def eep_rows(self, eeps, hb=False):
+        """row of each EEP name in a MATCH track (-1: not in the track)"""
+        eep_list = self.eep_list
+        offsets = self.eep_offsets
+        if hb:
+            eep_list = self.eep_list_hb
+            offsets = self.eep_offsets_hb
+        # the last offset is the track length, its EEP (FIN) is the last row
+        offsets = np.minimum(offsets, offsets[-1] - 1)
+        return np.array([offsets[list(eep_list).index(e)]
+                         if e in eep_list else -1
+                         for e in np.atleast_1d(eeps)], dtype=int)
+
+    def values(self, inds, cols, rows):
+        """
+        Gather data of tracks inds at rows.
+
+        Parameters
+        ----------
+        inds : array (ntracks)
+            track indices (see select)
+        cols : str or list
+            column name(s)
+        rows : array (nrows) or (ntracks, nrows)
+            row in each track, rows outside of a track are NaN
+
+        Returns
+        -------
+        array (ntracks, nrows) or (ntracks, nrows, ncols) if cols is a list
+        """
+        inds = np.atleast_1d(inds)
+        icols = [self.column(c) for c in np.atleast_1d(cols)]
+        rows = np.atleast_1d(rows)
+        rows = np.broadcast_to(rows, (len(inds), rows.shape[-1]))
+
+        valid = (rows >= 0) & (rows < self.nrows[inds][:, None])
+        out = np.full(rows.shape + (len(icols),), np.nan)
+        iarcs = self.iarchive[inds]
+        for i in np.unique(iarcs):
+            sel = valid & (iarcs == i)[:, None]
+            grow = (rows + self.offset[inds][:, None])[sel]
+            # sorted reads from the memory map, then put them back
+            isort = np.argsort(grow)
+            vals = np.empty((len(grow), len(icols)))
+            vals[isort] = self.archives[i].data[grow[isort]][:, icols]
+            out[sel] = vals
+
+        # Mbol is stored
+        for j, c in enumerate(np.atleast_1d(cols)):
+            if c == logL:
+                out[..., j] = (4.77 - out[..., j]) / 2.5
+
+        if isinstance(cols, str):
+            out = out[..., 0]
+        return out
+
+    def eep_values(self, eeps, cols, Z=None, mass=None, hb=False):
+        """
+        Values of cols at EEP(s) for all tracks selected by Z, mass.
+
+        Returns
+        -------
+        masses (ntracks), values (ntracks, neeps[, ncols])
+        if eeps is a single EEP name, the neeps axis is dropped.
+        """
+        inds = self.select(Z=Z, mass=mass, hb=hb)
+        vals = self.values(inds, cols, self.eep_rows(eeps, hb=hb))
+        if isinstance(eeps, str):
+            vals = vals[:, 0]
+        return self.mass[inds], vals
+
+    def track_matrix(self, cols, Z, hb=False, nrows=None):
+        """
+        All tracks of one Z as a (nmass, nrows[, ncols]) NaN padded matrix.
+
+        nrows default is the longest track.
+        """
+        inds = self.select(Z=Z, hb=hb)
+        nrows = nrows or np.max(self.nrows[inds])
+        return self.mass[inds], self.values(inds, cols, np.arange(nrows))
+
+
+def text_to_archive(match_dir, base, prefix=None, search='match_*.dat'):
+    """write an archive of the MATCH text files in match_dir"""
+    match_files = get_files(match_dir, search)
+    assert len(match_files) > 0, \
+        'No MATCH tracks ({0:s}) in {1:s}'.format(search, match_dir)
+    names = [os.path.split(m)[1].replace('match_', '', 1).replace('.dat', '')
+             for m in match_files]
+    masses = np.array(['.'.join(n.split('_M')[1].split('.')[:2])
+                       for n in names], dtype=float)
+
+    with ArchiveWriter(base, prefix=prefix) as archive:
+        for i in np.argsort(masses):
+            Z, _ = get_zy(names[i] + '.dat')
+            archive.add(names[i], masses[i], Z, 'hb' in names[i].lower(),
+                        np.loadtxt(match_files[i], ndmin=2))
+    return archive_name(base)
+
+
+def main(argv):
+    """Main function for grid_index: print values at an EEP"""
+    parser = argparse.ArgumentParser(description="EEP values of a grid")
+
+    parser.add_argument('-e', '--eep', type=str, default='MS_TO',
+                        help='EEP name')
+
+    parser.add_argument('-c', '--cols', type=str, default=logL,
+                        help='comma separated column names')
+
+    parser.add_argument('-z', '--Z', type=float, default=None,
+                        help='metallicity (default all)')
+
+    parser.add_argument('--hb', action='store_true', help='HB tracks')
+
+    parser.add_argument('match_loc', type=str,
+                        help='location of MATCH track archives')
+
+    args = parser.parse_args(argv)
+
+    cols = args.cols.split(',')
+    grid = GridIndex.from_dir(args.match_loc)
+    inds = grid.select(Z=args.Z, hb=args.hb)
+    vals = grid.values(inds, cols, grid.eep_rows(args.eep, hb=args.hb))
+    print('# Z mass {0:s}'.format(' '.join(cols)))
+    for i, v in zip(inds, vals[:, 0]):
+        print('{0:g} {1:.3f} {2:s}'.format(
+            grid.Z[i], grid.mass[i], ' '.join('{:g}'.format(x) for x in v)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
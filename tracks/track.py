@@ -2,6 +2,7 @@
 padova track files
 '''
 
+import functools
 import os
 import sys
 
@@ -10,36 +11,209 @@ import numpy as np
 from astropy.table import Table
 
 from ..utils import get_zy, replace_
+from .cache import load_cache, save_cache
 from ..eep.critical_point import CriticalPoint, Eep
 from ..config import logL, logT, mass, age
 from ..config import xcen, ycen, xc_cen, xo_cen, MODE, EXT
 from ..graphics.graphics import vw93_plot
 
 
+# rows of the age column checked at a time by first_decrease
+CHECK_CHUNK = 1024
+
+# scan_header marker: text of a PARSEC header line that sets it
+HEADER_MARKERS = {'AGELIMIT': 'AGE EXCEEDS AGELIMIT', 'RESTART': 'RESTART'}
+
+
+@functools.lru_cache()
+def default_eep():
+    """the Eep of inputs/eeps.json, read once (do not edit it)"""
+    return Eep()
+
+
+def first_decrease(arr, decimals=6, chunk=CHECK_CHUNK):
+    """
+    index i of the first arr[i + 1] < arr[i] after rounding to decimals, or
+    either is NaN (as not np.diff(np.round(arr, decimals)) >= 0), -1 if arr
+    never decreases.
+
+    arr is scanned chunk rows at a time, stopping at the first decrease, and
+    only rows that decrease before rounding are rounded (rounding keeps the
+    order, it can only turn a decrease into a tie).
+    """
+    for i in range(0, len(arr) - 1, chunk):
+        seg = arr[i:i + chunk + 1]
+        dec, = np.nonzero(~(seg[1:] >= seg[:-1]))
+        if len(dec) == 0:
+            continue
+        dec = dec[~(np.round(seg[dec + 1], decimals) >=
+                    np.round(seg[dec], decimals))]
+        if len(dec) > 0:
+            return i + dec[0]
+    return -1
+
+
+def _header_value(val):
+    """float of a header value (Fortran D exponent allowed), else the str"""
+    try:
+        return float(val.replace('.D', '.E'))
+    except ValueError:
+        return val
+
+
+def scan_header(header):
+    """
+    Read everything Track needs from PARSEC header lines in one pass.
+
+    Parameters
+    ----------
+    header : list of str
+        header (and footer) lines
+
+    Returns
+    -------
+    header_scan : dict (json-able, stored in the track cache)
+        args : dict of KEY: value (float if it is a number) of the KEY=VALUE
+            pairs on lines with more than one '=' ('*' removed, not RESTART)
+        ALFOV : list of the float values of ' ALFOV ' lines
+        AGELIMIT, RESTART : int number of lines with the HEADER_MARKERS text
+    """
+    header_scan = {'args': {}, 'ALFOV': []}
+    header_scan.update({k: 0 for k in HEADER_MARKERS})
+    for line in header:
+        if line.count('=') > 1:
+            for arg in line.replace('*', '').split():
+                if '=' in arg and 'RESTART' not in arg:
+                    key, val = arg.split('=')
+                    header_scan['args'][key] = _header_value(val)
+        if ' ALFOV ' in line:
+            header_scan['ALFOV'].append(
+                float(line.replace('ALFOV', '').strip()))
+        for key, text in HEADER_MARKERS.items():
+            if text in line:
+                header_scan[key] += 1
+    return header_scan
+
+
+def read_colibri(filename):
+    '''
+    COLIBRI track as a record array with the column names substituted
+    (see AGBTrack.load_agbtrack). Missing values are nan.
+    '''
+    rdict = {'#': '', 'M_*': mass, 'lg ': 'log', '_*': '',
+             'age/yr': age}
+    with open(filename, 'r') as f:
+        names = replace_(f.readline(), rdict).strip().split()
+        rows = [l.split() for l in f.read().splitlines() if l.strip()]
+
+    ncols = len(names)
+    lens = np.array([len(r) for r in rows])
+    assert np.all(lens <= ncols), \
+        '{0:s} has rows longer than its header'.format(filename)
+    if np.all(lens == ncols):
+        data = np.array(rows, dtype=float).reshape(len(rows), ncols)
+    else:
+        data = np.full((len(rows), ncols), np.nan)
+        for i, row in enumerate(rows):
+            data[i, :len(row)] = row
+    return np.rec.fromarrays(data.T, names=names)
+
+
+def _agb_column(data, *names):
+    """the first of names that is a column of data"""
+    for name in names:
+        if name in data.dtype.names:
+            return data[name]
+    raise KeyError('None of {0!s} in data'.format(names))
+
+
+def select_period(data):
+    """
+    Pulsation period of each row: the P<Pmod> column (P0 or P1),
+    nan where Pmod is nan.
+    """
+    pmod = data['Pmod']
+    ip, = np.nonzero(np.isfinite(pmod))
+    pcols = ['P{0:d}'.format(i) for i in range(int(np.max(pmod[ip]) + 1))] \
+        if len(ip) > 0 else []
+    period = np.full(len(pmod), np.nan)
+    if len(pcols) > 0:
+        periods = np.column_stack([data[p] for p in pcols])
+        period[ip] = periods[ip, pmod[ip].astype(int)]
+    return period
+
+
+def time_steps(data):
+    """dt column or the time to the next row (0 for the last)"""
+    if 'dt' in data.dtype.names:
+        return data['dt']
+    return np.diff(data[age], append=data[age][-1])
+
+
+def cm_star_masks(data, mdot_cond=-5, logl_cond=3.3):
+    """M-star and C-star row masks (see AGBTrack.m_cstars)"""
+    co = _agb_column(data, 'CO', 'C/O')
+    mdot = _agb_column(data, 'logdMdt', 'dMdt')
+    mstar = (co <= 1) & (data[logL] >= logl_cond) & (mdot <= mdot_cond)
+    cstar = (co >= 1) & (mdot <= mdot_cond)
+    return mstar, cstar
+
+
+def cm_star_lifetimes(tracks, mdot_cond=-5, logl_cond=3.3):
+    """
+    M-star and C-star lifetimes of a grid of COLIBRI tracks in one pass.
+
+    Parameters
+    ----------
+    tracks : list of AGBTrack or COLIBRI filenames
+
+    Returns
+    -------
+    np.recarray of Z, mass, tau_m, tau_c (Myr), one row per track
+    """
+    tracks = [AGBTrack(t) if isinstance(t, str) else t for t in tracks]
+    itrack = np.concatenate([np.zeros(len(t.data), dtype=int) + i
+                             for i, t in enumerate(tracks)])
+    masks = [cm_star_masks(t.data, mdot_cond=mdot_cond, logl_cond=logl_cond)
+             for t in tracks]
+    mstar = np.concatenate([m[0] for m in masks])
+    cstar = np.concatenate([m[1] for m in masks])
+    dt = np.concatenate([time_steps(t.data) for t in tracks])
+
+    ntracks = len(tracks)
+    tab = np.zeros(ntracks, dtype=[('Z', float), (mass, float),
+                                   ('tau_m', float), ('tau_c', float)])
+    tab['Z'] = [t.Z for t in tracks]
+    tab[mass] = [t.mass for t in tracks]
+    tab['tau_m'] = np.bincount(itrack, weights=dt * mstar,
+                               minlength=ntracks) / 1e6
+    tab['tau_c'] = np.bincount(itrack, weights=dt * cstar,
+                               minlength=ntracks) / 1e6
+    return tab.view(np.recarray)
+
+
 class AGBTrack(object):
     """
     AGBTrack adapted from colibri2trilegal
     """
-    def __init__(self, filename):
+    def __init__(self, filename, cache=False):
         """
         Read in track, set mass and period.
+        cache [bool or str] use the track cache (see tracks.cache)
         """
-        self.match = False
-        if 'match' in list(self.__dict__.keys()) or 'match' in filename:
-            self.match = True
+        # (self.match was always True: it was tested after being set)
+        self.match = 'match' in filename
+        if not hasattr(self, 'info'):
+            self.info = {}
         self.base, self.name = os.path.split(filename)
 
         if 'hb' in self.name.lower():
             self.hb = True
-        self.load_agbtrack(filename)
+        self.load_agbtrack(filename, cache=cache)
 
         if not self.match:
             self.get_tps()
-            # period is either P0 or P1 based on value of Pmod
-            period = np.zeros(len(self.data)) * np.nan
-            for i, p in enumerate(self.data['Pmod']):
-                if np.isfinite(p):
-                    period[i] = self.data['P{:.0f}'.format(p)][i]
+            self.period = select_period(self.data)
         try:
             self.mass = float(self.name.split('agb_')[1].split('_')[0])
         except:
@@ -66,17 +240,24 @@ class AGBTrack(object):
             pass
         return indi, indf
 
-    def load_agbtrack(self, filename):
+    def load_agbtrack(self, filename, cache=False):
         '''
         Load COLIRBI track and make substitutions to column headings.
+
+        Rows shorter than the header (e.g., before the TP-AGB) are padded
+        with nan. The result is a record array, as Track.load_track.
         '''
-        rdict = {'#': '', 'M_*': mass, 'lg ': 'log', '_*': '',
-                 'age/yr': age}
-        with open(filename, 'r') as f:
-            line = f.readline()
-            names = replace_(line, rdict).strip().split()
-            import pandas as pd
-            self.data = pd.read_table(f, delim_whitespace=True, names=names)
+        cache_dir = None if cache is True else cache
+        data = None
+        if cache:
+            data, _ = load_cache(filename, cache_dir=cache_dir, tag='agb')
+
+        if data is None:
+            data = read_colibri(filename)
+            if cache:
+                save_cache(filename, data, cache_dir=cache_dir, tag='agb')
+
+        self.data = data
         if not self.match:
             self.fix_phi()
         return self.data
@@ -84,7 +265,7 @@ class AGBTrack(object):
     def fix_phi(self):
         '''The first line in the agb track is 1 but not a quiescent stage.'''
         istart = np.where(np.isfinite(self.data['NTP']))[0][0]
-        self.data['PHI_TP'].iloc[istart] = np.nan
+        self.data['PHI_TP'][istart] = np.nan
 
     def m_cstars(self, mdot_cond=-5, logl_cond=3.3):
         '''
@@ -93,29 +274,18 @@ class AGBTrack(object):
         cstar: co >=1 mdot <= -5
         (by default) adjust mdot with mdot_cond and logl with logl_cond.
         '''
-        data = self.data_array
-
-        self.mstar, = np.nonzero((data['CO'] <= 1) &
-                                 (data['logL'] >= logl_cond) &
-                                 (data['logdMdt'] <= mdot_cond))
-        self.cstar, = np.nonzero((data['CO'] >= 1) &
-                                 (data['logdMdt'] <= mdot_cond))
-
-    def tauc_m(self):
-        '''lifetimes of c and m stars'''
-
-        if 'cstar' not in list(self.__dict__.keys()):
-            self.m_cstars()
-        try:
-            tauc = np.sum(self.data['dt'][self.cstar]) / 1e6
-        except IndexError:
-            tauc = np.nan
-        try:
-            taum = np.sum(self.data['dt'][self.mstar]) / 1e6
-        except IndexError:
-            taum = np.nan
-        self.taum = taum
-        self.tauc = tauc
+        mstar, cstar = cm_star_masks(self.data, mdot_cond=mdot_cond,
+                                     logl_cond=logl_cond)
+        self.mstar, = np.nonzero(mstar)
+        self.cstar, = np.nonzero(cstar)
+
+    def tauc_m(self, mdot_cond=-5, logl_cond=3.3):
+        '''lifetimes (Myr) of c and m stars'''
+        self.m_cstars(mdot_cond=mdot_cond, logl_cond=logl_cond)
+        dt = time_steps(self.data)
+        self.tauc = np.sum(dt[self.cstar]) / 1e6
+        self.taum = np.sum(dt[self.mstar]) / 1e6
+        return self.taum, self.tauc
 
     def get_tps(self):
         '''find the thermal pulsations of each file'''
@@ -154,9 +324,14 @@ class Track(AGBTrack):
     '''Padova stellar track class.'''
     def __init__(self, filename, match=False, track_data=None,
                  ptcri_file=None, ptcri_kw=None, agb=False,
-                 debug=False):
+                 debug=False, cache=False, validate=True):
         '''
         filename [str] the path to the PMS or PMS.HB file
+        cache [bool or str] use the track cache (see tracks.cache), a str is
+            the cache directory
+        validate [bool] check that age never decreases (see check_track),
+            False skips it for a track from the cache that passed it when
+            it was cached (any other track is checked)
         '''
         (self.base, self.name) = os.path.split(filename)
         # will house error string(s)
@@ -173,18 +348,29 @@ class Track(AGBTrack):
             self.agb = True
             AGBTrack.__init__(self, filename)
 
+        # set by check_track or from the cache
+        self.age_checked = False
+
         self.match = match
+        cached = False
         if self.match:
             self.load_match_track(filename, track_data=track_data)
         else:
-            self.load_track(filename)
+            cached = bool(cache) and self.load_cached_track(filename,
+                                                            cache=cache)
+            if not cached:
+                self.load_track(filename)
 
         # No errors so far
         if self.flag is None:
             # add self.Z etc.
             self.filename_info()
             self.track_mass()
-            self.check_track(debug=debug)
+            self.check_track(debug=debug,
+                             validate=validate or not self.age_checked)
+            # only cache tracks that passed the checks
+            if cache and not cached and self.flag is None:
+                self.save_cached_track(filename, cache=cache)
             if ptcri_file is not None:
                 self.load_iptcri(ptcri_file)
 
@@ -197,14 +383,32 @@ class Track(AGBTrack):
 
         ptcri.load_iptcri(self)
 
-    def check_track(self, debug=False):
-        '''check if age decreases'''
+    def check_track(self, debug=False, validate=True):
+        '''
+        check if age decreases (unless validate is False) and, for PARSEC
+        tracks, the header AGELIMIT and the final YCEN
+        '''
+        if validate:
+            self.check_age(debug=debug)
+            self.age_checked = self.flag is None
+
+        if not self.match:
+            self.check_header_arg(loud=True)
+            ycen_end = self.data[ycen][-1]
+            if ycen_end != 0:
+                self.info['Warning'] = \
+                    'YCEN at final {0:s} {1:.4f}'.format(MODE, ycen_end)
+
+        return
+
+    def check_age(self, debug=False):
+        '''flag (PARSEC) or report (MATCH) where age decreases'''
         try:
-            age_ = np.round(self.data[age], 6)
+            age_ = self.data[age]
         except AttributeError:
-            age_ = np.round(self.data.logAge, 6)
-        test = np.diff(age_) >= 0
-        if False in test:
+            age_ = self.data.logAge
+        if first_decrease(age_) > -1:
+            age_ = np.round(age_, 6)
             # import pdb
             # pdb.set_trace()
             morp = 'parsec'
@@ -213,34 +417,29 @@ class Track(AGBTrack):
 
             print('decreasing age in {0:s} M={1:.3f} Z={2:g} track'
                   .format(morp, self.mass, self.Z))
-            bads, = np.nonzero(np.diff(age_) < 0)
+            bads, = np.nonzero(~(np.diff(age_) >= 0))
             if not self.match:
                 print('offensive {0:s}:'.format(MODE), self.data[MODE][bads])
                 self.flag = 'track has age decreasing near MODEs {}' \
                             .format(self.data[MODE][bads])
             else:
-                eep = Eep()
+                eep = default_eep()
                 if self.hb:
-                    nticks = eep.nticks_hb
+                    edges = eep.eep_offsets_hb[1:]
                     names = eep.eep_list_hb
                 else:
-                    nticks = eep.nticks
+                    edges = eep.eep_offsets[1:]
                     names = eep.eep_list
-                inds = [np.argmin(np.abs(np.cumsum(nticks)-b)) for b in bads]
+                # nearest edge (the lower one on a tie)
+                j = np.clip(np.searchsorted(edges, bads), 1, len(edges) - 1)
+                inds = np.where(bads - edges[j - 1] <= edges[j] - bads,
+                                j - 1, j)
                 print('offensive inds:', bads)
                 print('Near:', np.array(names)[inds])
 
             if debug:
                 import pdb
                 pdb.set_trace()
-
-        if not self.match:
-            self.check_header_arg(loud=True)
-            ycen_end = self.data[ycen][-1]
-            if ycen_end != 0:
-                self.info['Warning'] = \
-                    'YCEN at final {0:s} {1:.4f}'.format(MODE, ycen_end)
-
         return
 
     def track_mass(self):
@@ -296,12 +495,12 @@ class Track(AGBTrack):
 
     def calc_core_mu(self):
         '''Caclulate central mean molecular weight, assume fully ionized'''
-        xi = np.array([xcen, ycen, xc_cen, xo_cen])
+        xi = [xcen, ycen, xc_cen, xo_cen]
         ai = np.array([1., 4., 12., 16.])
         # fully ionized
         qi = ai / 2.
-        self.muc = 1. / (np.sum((self.data[xi[i]] / ai[i]) * (1 + qi[i])
-                                for i in range(len(xi))))
+        abund = np.column_stack([self.data[x] for x in xi])
+        self.muc = 1. / np.dot(abund, (1 + qi) / ai)
         return self.muc
 
     def calc_lifetimes(self):
@@ -317,9 +516,9 @@ class Track(AGBTrack):
         self.Z, self.Y = get_zy(self.name)
 
         if hasattr(self, 'header') and len(self.header) > 1:
-            self.ALFOV, = \
-                np.unique([float(l.replace('ALFOV', '').strip())
-                           for l in self.header if ' ALFOV ' in l])
+            if not hasattr(self, 'header_scan'):
+                self.add_header_args_dict()
+            self.ALFOV, = np.unique(self.header_scan['ALFOV'])
 
         if hasattr(self, 'data') and hasattr(self.data, 'QHEL'):
             if self.hb:
@@ -343,24 +542,23 @@ class Track(AGBTrack):
             return logl
 
         self.col_keys = [age, mass, logT, logL, 'logg', 'CO']
-        with open(filename, 'r') as inp:
-            header = inp.readline()
-            col_keys = header.split()
-            if len(col_keys) > len(self.col_keys):
-                self.col_keys.extend(col_keys[7:])
-
         if track_data is None:
+            with open(filename, 'r') as inp:
+                header = inp.readline()
+                col_keys = header.split()
+                if len(col_keys) > len(self.col_keys):
+                    self.col_keys.extend(col_keys[7:])
+
             data = np.genfromtxt(filename, names=self.col_keys,
                                  converters={3: lambda m: mbol2logl(m)})
         else:
+            # track_data may be an archive (read-only) view, don't edit it.
+            track_data = np.array(track_data, dtype=float)
             track_data.T[3] = mbol2logl(track_data.T[3])
-            dtype = [(c, float) for c in self.col_keys]
-            nrows = len(track_data)
-            data = np.ndarray(shape=(nrows,), dtype=dtype)
-            for i in range(nrows):
-                data[i] = track_data[i]
+            data = np.rec.fromarrays(track_data.T[:len(self.col_keys)],
+                                     names=self.col_keys)
 
-        eep = Eep()
+        eep = default_eep()
         iptcri = np.cumsum(eep.nticks) - 1.
         iptcri[iptcri >= len(data)] = 0
         self.iptcri = np.array(iptcri, dtype=int)
@@ -368,6 +566,29 @@ class Track(AGBTrack):
         self.mass = self.data[mass][0]
         return data
 
+    def load_cached_track(self, filename, cache=True):
+        '''load what load_track would from the track cache, False if stale'''
+        cache_dir = None if cache is True else cache
+        data, meta = load_cache(filename, cache_dir=cache_dir)
+        if data is None:
+            return False
+        self.data = data
+        self.header = meta['header']
+        self.header_scan = meta['header_scan']
+        self.header_dict = self.header_scan['args']
+        self.col_keys = meta['col_keys']
+        self.info.update(meta['info'])
+        self.age_checked = meta.get('age_checked', False)
+        return True
+
+    def save_cached_track(self, filename, cache=True):
+        '''save the (checked) result of load_track to the track cache'''
+        cache_dir = None if cache is True else cache
+        meta = {'header': self.header, 'header_scan': self.header_scan,
+                'col_keys': list(self.col_keys), 'info': self.info,
+                'age_checked': self.age_checked}
+        return save_cache(filename, self.data, meta=meta, cache_dir=cache_dir)
+
     def load_track(self, filename):
         '''
         reads PMS file into a record array. Stores header and footer as
@@ -417,6 +638,7 @@ class Track(AGBTrack):
                 self.flag = 'load_track error: no begin track '
             self.mass = \
                 float('.'.join(self.name.split('_M')[1].split('.')[:2]))
+            self.add_header_args_dict()
             return
 
         if len(lines) - begin_track <= 2:
@@ -472,6 +694,7 @@ class Track(AGBTrack):
 
         self.data = data.view(np.recarray)
         self.col_keys = col_keys
+        self.add_header_args_dict()
         return
 
     def summary(self, line=''):
@@ -520,26 +743,9 @@ class Track(AGBTrack):
         return col_keys
 
     def add_header_args_dict(self):
-        """PARSEC header as a dictionary"""
-        def rep(s):
-            return s.replace('.D', '.E')
-
-        def parse_args(header_line):
-            header_line = header_line.replace('*', '')
-            k, v = list(zip(*[a.split('=') for a in
-                       [l for l in header_line.split()
-                        if '=' in l and 'RESTART' not in l]]))
-            arg_dict = dict(list(zip(k, list(map(float, list(map(rep, v)))))))
-            return arg_dict
-
-        def update_args(header_line, old_dict):
-            old_dict.update(parse_args(header_line))
-            return old_dict
-
-        self.header_dict = {}
-        for line in self.header:
-            if line.count('=') > 1:
-                self.header_dict = update_args(line, self.header_dict)
+        """PARSEC header as a dictionary (see scan_header)"""
+        self.header_scan = scan_header(self.header)
+        self.header_dict = self.header_scan['args']
 
     def check_header_arg(self, ok_eval='%f>1.3e10', arg='AGELIMIT',
                          errstr='AGE EXCEEDS AGELIMIT', loud=False):
@@ -560,12 +766,14 @@ class Track(AGBTrack):
                 self.info['%s %s' % (level, arg)] = \
                     '%s: %g' % (errstr, self.header_dict[arg])
 
-        if not hasattr(self, 'header_dict'):
+        if not hasattr(self, 'header_scan'):
             self.add_header_args_dict()
-        check = len([i for i, l in enumerate(self.header) if errstr in l])
+        if HEADER_MARKERS.get(arg) == errstr:
+            check = self.header_scan[arg]
+        else:
+            check = len([i for i, l in enumerate(self.header) if errstr in l])
         do_check(check)
-        oneline = ' '.join(self.header)
-        if 'RESTART' in oneline:
+        if self.header_scan['RESTART'] > 0:
             print('Track restarted')
 
 
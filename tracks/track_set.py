@@ -10,6 +10,7 @@ import pandas as pd
 import scipy
 
 from ..fileio import get_files, get_dirs, ts_indict
+from ..profiling import stage
 from ..utils import sort_dict, filename_data
 
 from .track import Track
@@ -22,7 +23,12 @@ eep = Eep()
 
 
 class TrackSet(object):
-    """A class to load multiple Track class instances"""
+    """
+    A class to load multiple Track class instances
+
+    With stream=True the tracks are not loaded, only found (see
+    find_track_files), iter_tracks loads them one at a time.
+    """
     def __init__(self, **kwargs):
         default_dict = ts_indict()
         default_dict.update(kwargs)
@@ -31,14 +37,18 @@ class TrackSet(object):
             # assume we're in a set directory
             tracks_dir = self.tracks_dir or os.getcwd()
             self.tracks_base = os.path.join(tracks_dir, self.prefix)
-            self.find_tracks()
-            filename_data(self.prefix, skip=0)
+            if self.stream:
+                self.find_track_files()
+            else:
+                self.find_tracks()
+            self.prefix_dict = filename_data(self.prefix, skip=0)
         return
 
-    def find_tracks(self):
+    def find_track_files(self):
         """
-        load all files in tracks.base as Track instances
-        also add attributes masses and hbmaxmass to self.
+        find the track files in tracks_base (in mass order) and add the
+        attributes track_files, masses, and hbmaxmass to self from the
+        filenames alone. self.tracks is empty.
         """
         track_names = get_files(self.tracks_base, '*.*')
 
@@ -55,8 +65,38 @@ class TrackSet(object):
         track_names = np.array(track_names)[cut_mass][morder]
         mass_ = mass_[cut_mass][morder]
 
-        trks_ = [Track(t, match=self.match) for t in track_names]
-        trks = [t for t in trks_ if t.flag is None]
+        # (as Track.hb)
+        hbs = np.array(['hb' in os.path.split(t)[1].lower()
+                        for t in track_names], dtype=bool)
+        err = 'No tracks found: {0:s}'.format(self.tracks_base)
+        assert len(track_names) != 0, err
+
+        self.track_files = list(track_names)
+        self.tracks = []
+        self.masses = np.unique(mass_)
+        self.hbmaxmass = np.max(mass_[hbs]) if np.any(hbs) else 0.
+        return
+
+    def iter_tracks(self):
+        """load and yield the (unflagged) tracks one at a time"""
+        # cache_dir (str) or cache (bool) see tracks.cache
+        cache = self.cache_dir or self.cache
+        # skip the age check of cached tracks that passed it when cached
+        validate = not (cache and self.trust_cache)
+        for t in self.track_files:
+            with stage('load_track', track=os.path.split(t)[1]):
+                track = Track(t, match=self.match, cache=cache,
+                              validate=validate)
+            if track.flag is None:
+                yield track
+
+    def find_tracks(self):
+        """
+        load all files in tracks.base as Track instances
+        also add attributes masses and hbmaxmass to self.
+        """
+        self.find_track_files()
+        trks = list(self.iter_tracks())
         masses = np.unique([t.mass for t in trks])
 
         # here is where one would code a mass cut for HB only...
@@ -83,7 +123,7 @@ class TrackSet(object):
             wstr = 'a'
             header = False
             wrote = 'appended to'
-        data = pd.DataFrame()
+        dfs = []
 
         for track in self.tracks:
             offset = 0
@@ -104,8 +144,9 @@ class TrackSet(object):
             df['hb'] = track.hb * 1
             for k, v in list(self.prefix_dict.items()):
                 df[k] = v
-            data = data.append(df, ignore_index=True)
+            dfs.append(df)
 
+        data = pd.concat(dfs, ignore_index=True)
         data.to_csv(outfile, mode=wstr, index=False, sep=' ', header=header)
         print('{} {}'.format(wrote, outfile))
 
@@ -4,8 +4,9 @@ from scipy.interpolate import splev, splprep
 import numpy as np
 
 __all__ = ['closest_match', 'closest_match2d', 'extrap1d', 'find_peaks',
-           'is_numeric', 'min_dist2d', 'second_derivative', 'sort_dict',
-           'minmax', 'extrema', 'replace_', 'remove_dupes']
+           'is_numeric', 'min_dist2d', 'nearest2d', 'second_derivative',
+           'sort_dict',
+           'minmax', 'extrema', 'replace_', 'remove_dupes', 'parallel_map']
 
 
 def remove_dupes(inds1, inds2, inds3=None, inds4=None, tol=1e-6):
@@ -115,29 +116,35 @@ def second_derivative(xdata, inds, gt=False, s=0):
     return inds[tmin_ind]
 
 
+def git_hash():
+    """short git hash of padova_tracks (or 'unknown' if not a git repo)"""
+    import os
+    import subprocess
+    home, _ = os.path.split(os.path.realpath(__file__))
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             cwd=home, capture_output=True, text=True)
+    except OSError:
+        return 'unknown'
+    return out.stdout.strip() or 'unknown'
+
+
 def add_version_info(input_file):
     """Copy the input file and add the git hash and time the run started."""
-    import os
     from time import localtime, strftime
     from .fileio import replace_ext
 
     # create info file with time of run
     now = strftime("%Y-%m-%d %H:%M:%S", localtime())
     fname = replace_ext(input_file, '.info')
+    with open(input_file, 'r') as inp:
+        lines = inp.read()
+
     with open(fname, 'w') as out:
         out.write('parsec2match run started %s \n' % now)
-        out.write('padova_tracks git hash: ')
-
-    # the best way to get the git hash?
-    here = os.getcwd()
-    home, _ = os.path.split(__file__)
-
-    os.chdir(home)
-    os.system('git rev-parse --short HEAD >> "%s"' % os.path.join(here, fname))
-    os.chdir(here)
-
-    # add the input file
-    os.system('cat %s >> %s' % (input_file, fname))
+        out.write('padova_tracks git hash: %s\n' % git_hash())
+        # add the input file
+        out.write(lines)
     return fname
 
 
@@ -313,13 +320,64 @@ def find_peaks(arr):
     return turning_points
 
 
+# tracks longer than this are searched with a KD-tree in nearest2d
+KDTREE_MIN = 2000
+
+
+def nearest2d(xarr, yarr, xpoints, ypoints, kdtree_min=KDTREE_MIN):
+    '''
+    index and distance of the point in [xarr, yarr] nearest to each
+    [xpoints, ypoints]. Non-finite points of xarr, yarr are never matched.
+
+    Arrays longer than kdtree_min are searched with scipy's cKDTree, shorter
+    ones with (chunks of) the full distance matrix.
+
+    Parameters
+    ----------
+    xarr, yarr : arrays
+        e.g., a track's logT, logL
+    xpoints, ypoints : floats or arrays
+        query point(s)
+
+    Returns
+    -------
+    inds, dists : int, float or arrays (one per query point)
+    '''
+    xarr = np.asarray(xarr, dtype=float)
+    yarr = np.asarray(yarr, dtype=float)
+    scalar = np.ndim(xpoints) == 0
+    xpoints = np.atleast_1d(np.asarray(xpoints, dtype=float))
+    ypoints = np.atleast_1d(np.asarray(ypoints, dtype=float))
+
+    good, = np.nonzero(np.isfinite(xarr) & np.isfinite(yarr))
+    if len(good) > kdtree_min:
+        from scipy.spatial import cKDTree
+        tree = cKDTree(np.column_stack([xarr[good], yarr[good]]))
+        dists, inds = tree.query(np.column_stack([xpoints, ypoints]))
+    else:
+        inds = np.zeros(len(xpoints), dtype=int)
+        dists = np.zeros(len(xpoints))
+        # keep the distance matrix to ~1e6 elements
+        nchunk = max(1, int(1e6) // max(len(good), 1))
+        for i in range(0, len(xpoints), nchunk):
+            dist = np.hypot(xpoints[i:i + nchunk, None] - xarr[good],
+                            ypoints[i:i + nchunk, None] - yarr[good])
+            imin = np.argmin(dist, axis=1)
+            inds[i:i + nchunk] = imin
+            dists[i:i + nchunk] = dist[np.arange(len(imin)), imin]
+    inds = good[inds]
+    if scalar:
+        return inds[0], dists[0]
+    return inds, dists
+
+
 def min_dist2d(xpoint, ypoint, xarr, yarr):
     '''
     index and distance of point in [xarr, yarr] nearest to [xpoint, ypoint]
 
     Parameters
     ----------
-    xpoint, ypoint : floats
+    xpoint, ypoint : floats or arrays (see nearest2d)
 
     xarr, yarr : arrays
 
@@ -328,8 +386,7 @@ def min_dist2d(xpoint, ypoint, xarr, yarr):
     ind, dist : int, float
         index of xarr, arr and distance
     '''
-    dist = np.sqrt((xarr - xpoint) ** 2 + (yarr - ypoint) ** 2)
-    return np.argmin(dist), np.min(dist)
+    return nearest2d(xarr, yarr, xpoint, ypoint)
 
 
 def closest_match2d(ind, x1, y1, x2, y2, normed=False):
@@ -347,21 +404,14 @@ def closest_match2d(ind, x1, y1, x2, y2, normed=False):
         y1n = y1 / np.max(y1)
         y2n = y2 / np.max(y2)
 
-    dist = np.sqrt((x1 / x1n - x2[ind] / x2n) ** 2 +
-                   (y1 / y1n - y2[ind] / y2n) ** 2)
-    return np.argmin(dist), np.min(dist)
+    return nearest2d(x1 / x1n, y1 / y1n, x2[ind] / x2n, y2[ind] / y2n)
 
 
 def closest_match(num, arr):
     '''index and difference of closet point of arr to num'''
-    index = -1
-    arr = np.nan_to_num(arr)
-    difference = np.abs(num - arr[0])
-    for i in range(len(arr)):
-        if difference > np.abs(num - arr[i]):
-            difference = np.abs(num - arr[i])
-            index = i
-    return index, difference
+    diff = np.abs(num - np.nan_to_num(arr))
+    index = np.argmin(diff)
+    return index, diff[index]
 
 
 def is_numeric(lit):
@@ -402,3 +452,23 @@ def is_numeric(lit):
     except ValueError:
         pass
     return lit
+
+
+def parallel_map(func, iterable, workers=1, initializer=None):
+    """
+    map func over iterable with a pool of worker processes.
+
+    Results are returned in the order of iterable. workers <= 1 (or a
+    single item) runs serially in this process. func must be picklable,
+    i.e., a module level function or a functools.partial of one.
+    initializer is called once in each worker process (never when run
+    serially), e.g., graphics.utils.agg_worker.
+    """
+    items = list(iterable)
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [func(i) for i in items]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(items)),
+                             initializer=initializer) as pool:
+        return list(pool.map(func, items))